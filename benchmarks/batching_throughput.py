@@ -0,0 +1,56 @@
+"""
+Aggregate generation throughput of the Transformers backend with and without
+continuous batching, at concurrency 1, 4 and 16.
+
+    python benchmarks/batching_throughput.py --model Qwen/Qwen2.5-0.5B-Instruct --max-new-tokens 64
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.answer_generator.batching import BatchingTransformersLLM
+from src.answer_generator.model_factory import TransformersLLM
+
+PROMPTS = [
+    "Кратко расскажи, о чём обычно рассказывают в документальных фильмах о космосе.",
+    "Объясни простыми словами, что такое нейронная сеть.",
+    "Назови три причины, почему стоит учить иностранные языки.",
+    "Что такое субтитры и зачем они нужны?",
+]
+
+
+def run(llm, concurrency: int, requests: int, max_new_tokens: int) -> dict:
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        answers = list(pool.map(lambda p: llm.generate(p, max_length=max_new_tokens), prompts))
+    elapsed = time.perf_counter() - start
+    tokens = sum(llm.count_tokens(a) for a in answers)
+    return {"seconds": elapsed, "tokens": tokens, "tokens_per_second": tokens / elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", required=True, help="HF causal LM name or path")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--batch-window-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    engines = {
+        "pipeline": TransformersLLM(args.model),
+        "batching": BatchingTransformersLLM(
+            args.model, max_batch_size=args.max_batch_size, batch_window_ms=args.batch_window_ms
+        ),
+    }
+    for concurrency in (1, 4, 16):
+        for label, llm in engines.items():
+            result = run(llm, concurrency, requests=concurrency * 2, max_new_tokens=args.max_new_tokens)
+            print(
+                f"concurrency={concurrency:2d}  {label:8}  {result['tokens_per_second']:7.1f} tok/s  "
+                f"({result['tokens']} tokens in {result['seconds']:.1f}s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Startup RSS of the embedding setup in LangChain mode: the old three separate copies
+(SentenceTransformer + two HuggingFaceEmbeddings) vs one shared SentenceEmbedder.
+Each variant runs in a fresh subprocess.
+
+    python benchmarks/embedding_rss.py --model sentence-transformers/paraphrase-multilingual-mpnet-base-v2
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+SEPARATE = """
+from sentence_transformers import SentenceTransformer
+from langchain_community.embeddings import HuggingFaceEmbeddings
+models = [
+    SentenceTransformer(NAME),
+    HuggingFaceEmbeddings(model_name=NAME),
+    HuggingFaceEmbeddings(model_name=NAME, encode_kwargs={"normalize_embeddings": True}),
+]
+"""
+
+SHARED = """
+from src.answer_generator.model_registry import ModelRegistry
+registry = ModelRegistry.get_registry()
+models = [registry.get_embedder(NAME) for _ in range(3)]
+"""
+
+PROBE = """
+import json, time
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+NAME = {name!r}
+before = rss_mb()
+start = time.perf_counter()
+{body}
+print(json.dumps({{"rss_before": before, "rss_after": rss_mb(), "seconds": time.perf_counter() - start}}))
+"""
+
+
+def measure(name: str, body: str) -> dict:
+    code = PROBE.format(name=name, body=body)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="sentence-transformers/paraphrase-multilingual-mpnet-base-v2")
+    args = parser.parse_args()
+
+    for label, body in (("separate x3", SEPARATE), ("shared", SHARED)):
+        started = time.perf_counter()
+        result = measure(args.model, body)
+        print(
+            f"{label:12}  RSS {result['rss_after']:.0f} MB "
+            f"(+{result['rss_after'] - result['rss_before']:.0f} MB)  "
+            f"load {result['seconds']:.1f}s  wall {time.perf_counter() - started:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Import time of the main entry points, measured with `python -X importtime`
+in a fresh interpreter per module (median of --repeat runs).
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --top 15 --budget-ms 500
+
+With --budget-ms the script exits non-zero when any entry point exceeds the budget,
+so it can run in CI to catch a heavy dependency creeping back into module scope.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ENTRY_POINTS = [
+    "src.api.main",
+    "src.api.server",
+    "src.answer_generator.rag_model",
+    "src.answer_generator.model_factory",
+    "src.utils.db_connector",
+    "src.reranker.reranker",
+]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Cumulative import time of the module in ms, and (package, cumulative ms) of the
+    third-party/stdlib packages imported directly by project modules.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=ROOT
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    rows = [
+        (int(m.group(2)) / 1000, len(m.group(3)), m.group(4))
+        for m in map(LINE.match, result.stderr.splitlines()) if m
+    ]
+    # importtime prints children before their parent: walk backwards to find parents
+    total = 0.0
+    imports: Dict[str, float] = {}
+    stack: List[Tuple[int, str]] = []
+    for cumulative, indent, name in reversed(rows):
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        parent = stack[-1][1] if stack else None
+        stack.append((indent, name))
+        if name == module:
+            total = cumulative
+        elif parent is not None and parent.startswith("src") and not name.startswith("src"):
+            imports[name] = max(imports.get(name, 0.0), cumulative)
+    return total, sorted(imports.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5, help="heaviest imports to show per module")
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    over_budget = []
+    for module in args.modules:
+        try:
+            runs = [measure(module) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{module:40} import failed: {e}")
+            continue
+        total = statistics.median(t for t, _ in runs)
+        print(f"{module:40} {total:8.1f} ms")
+        for name, ms in runs[-1][1][:args.top]:
+            print(f"    {name:36} {ms:8.1f} ms")
+        if args.budget_ms is not None and total > args.budget_ms:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f"Over {args.budget_ms:.0f} ms budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Throughput of the embedder, the cross-encoder reranker and the llama.cpp LLM
+running at the same time, with library-default threads vs the `resources`
+section of the config. Each variant runs in a fresh subprocess, because thread
+pools and BLAS limits are process-wide.
+
+    python benchmarks/mixed_load.py --config config/config.yaml --seconds 30 \
+        --llm-workers 1 --embed-workers 2 --rerank-workers 2
+"""
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+QUERY = "О чём рассказывает автор в начале видео?"
+CHUNKS = [
+    "В начале видео автор рассказывает о своём путешествии по северу страны.",
+    "Затем он показывает, как собирал снаряжение и планировал маршрут.",
+    "Во второй половине речь идёт о погоде и о том, как она изменила планы.",
+    "В конце автор делится советами для тех, кто хочет повторить маршрут.",
+    "Отдельно упоминаются расходы на поездку и полезные приложения.",
+    "Автор отвечает на вопросы зрителей о безопасности в походе.",
+]
+PROMPT = "Кратко перескажи: " + " ".join(CHUNKS[:3])
+
+
+def load_components(config_path: str, use_resources: bool):
+    from src.answer_generator.model_factory import model_factory
+    from src.answer_generator.model_registry import ModelRegistry
+    from src.reranker.cross_encoder import CrossEncoderReranker
+    from src.utils.config_loader import ConfigLoader
+    from src.utils.resources import ResourcePlan
+
+    # The embedder reads `resources` from the process-wide config, so edit that dict in place
+    config = ConfigLoader(config_path).get_config()
+    if not use_resources:
+        config.pop("resources", None)
+    plan = ResourcePlan.from_config(config)
+    plan.apply_blas()
+    llm = model_factory(config)
+    embedder = ModelRegistry.create_local_embedder(config["embedding_model"])
+    ce_cfg = dict(config.get("reranker", {}).get("cross_encoder", {}))
+    reranker = CrossEncoderReranker(
+        ce_cfg.get("model_name", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"),
+        max_length=ce_cfg.get("max_length", 256),
+        cores=plan.reranker.cores
+    )
+    return llm, embedder, reranker
+
+
+def run_variant(config_path: str, use_resources: bool, seconds: float, workers: dict, max_tokens: int) -> dict:
+    llm, embedder, reranker = load_components(config_path, use_resources)
+
+    jobs = {
+        "llm": lambda: llm.generate(PROMPT, max_length=max_tokens),
+        "embed": lambda: embedder.encode([QUERY] + CHUNKS),
+        "rerank": lambda: reranker.predict([(QUERY, c) for c in CHUNKS]),
+    }
+    counts = {name: 0 for name in jobs}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def loop(name: str) -> None:
+        while time.perf_counter() < stop_at:
+            jobs[name]()
+            with lock:
+                counts[name] += 1
+
+    total = sum(workers.values())
+    with ThreadPoolExecutor(max_workers=total) as pool:
+        futures = [pool.submit(loop, name) for name, n in workers.items() for _ in range(n)]
+        for f in futures:
+            f.result()
+    return {name: counts[name] / seconds for name in jobs if workers[name]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--llm-workers", type=int, default=1)
+    parser.add_argument("--embed-workers", type=int, default=2)
+    parser.add_argument("--rerank-workers", type=int, default=2)
+    parser.add_argument("--max-tokens", type=int, default=32)
+    parser.add_argument("--variant", choices=("default", "resources"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    workers = {"llm": args.llm_workers, "embed": args.embed_workers, "rerank": args.rerank_workers}
+
+    if args.variant:
+        result = run_variant(args.config, args.variant == "resources", args.seconds, workers, args.max_tokens)
+        print(json.dumps(result))
+        return
+
+    for variant in ("default", "resources"):
+        cmd = [sys.executable, __file__, "--variant", variant] + sys.argv[1:]
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        rates = "  ".join(f"{name} {rate:6.2f}/s" for name, rate in result.items())
+        print(f"{variant:9}  {rates}")
+
+
+if __name__ == "__main__":
+    main()
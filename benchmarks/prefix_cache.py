@@ -0,0 +1,58 @@
+"""
+Time to first token for the RAG prompt with and without prompt-prefix reuse (llama.cpp).
+
+    python benchmarks/prefix_cache.py --model ./models/llm/model.gguf --language ru --runs 5
+"""
+import argparse
+import statistics
+import time
+
+from src.answer_generator.model_factory import LlamaCppLLM
+from src.utils.prompt_loader import PromptLoader
+
+CONTEXTS = [
+    "В фильме рассказывается о путешествии двух друзей через всю страну.",
+    "Главный герой работает инженером и мечтает построить собственный самолёт.",
+    "В конце фильма друзья возвращаются домой и открывают небольшую мастерскую.",
+]
+QUESTIONS = ["О чем фильм?", "Кем работает главный герой?", "Чем заканчивается фильм?"]
+
+
+def time_to_first_token(llm: LlamaCppLLM, prompt: str) -> float:
+    start = time.perf_counter()
+    for _ in llm.stream_generate(prompt, max_length=1):
+        break
+    return time.perf_counter() - start
+
+
+def run(model_path: str, language: str, n_ctx: int, runs: int, prefix_cache: bool) -> list:
+    template = PromptLoader().load(language)
+    llm = LlamaCppLLM(model_path, n_ctx=n_ctx, prefix_cache=prefix_cache)
+    llm.warm_prefix(PromptLoader.static_prefix(template))
+    timings = []
+    for i in range(runs):
+        prompt = template.format(
+            context=CONTEXTS[i % len(CONTEXTS)], query=QUESTIONS[i % len(QUESTIONS)]
+        )
+        timings.append(time_to_first_token(llm, prompt))
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", required=True, help="path to a GGUF model")
+    parser.add_argument("--language", default="ru")
+    parser.add_argument("--n-ctx", type=int, default=8192)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for enabled in (False, True):
+        timings = run(args.model, args.language, args.n_ctx, args.runs, enabled)
+        print(
+            f"prefix_cache={enabled!s:5}  TTFT median {statistics.median(timings) * 1000:.0f} ms  "
+            f"min {min(timings) * 1000:.0f} ms  max {max(timings) * 1000:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
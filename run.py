@@ -1,3 +1,4 @@
+from src.utils.config_loader import ConfigLoader
 from src.utils.logger_loader import LoggerLoader
 from src.utils.db_connector import DBConnector
 from src.answer_generator.rag_model import RAGModel
@@ -12,6 +13,8 @@ def clear_table() -> None:
 
 def main() -> None:
     """Основная точка входа в RAG-пайплайн."""
+    # get_logger() только возвращает логгер: обработчики поднимает configure()
+    LoggerLoader.configure(ConfigLoader.get_config())
     logger = LoggerLoader.get_logger()
     logger.info("Запуск пайплайна RAG")
 
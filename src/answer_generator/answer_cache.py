@@ -0,0 +1,174 @@
+import hashlib
+import json
+import re
+from typing import TYPE_CHECKING, Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from src.reranker.tokenizer import Tokenizer
+from src.utils.logger_loader import LoggerLoader
+from src.utils.lru_cache import LRUCache
+from src.utils.metrics import REGISTRY
+
+if TYPE_CHECKING:
+    from src.utils.db_connector import DBConnector
+
+_SENTENCE_END = re.compile(r"[.!?]")
+_WORD = re.compile(r"[.!?]|\w+")
+
+
+def normalize_query(query: str) -> str:
+    """Case, 'ё', punctuation and whitespace insensitive form of a question."""
+    return " ".join(Tokenizer.words(query))
+
+
+def query_entities(query: str) -> str:
+    """
+    Numbers and names of a question in a canonical form: tokens with digits,
+    capitalized words that do not start a sentence and acronyms.
+    Questions that differ only in these ("episode 3" vs "episode 4") must not
+    share a semantic cache entry, although their embeddings are nearly equal.
+    """
+    found = set()
+    sentence_start = True
+    for token in _WORD.findall(query):
+        if _SENTENCE_END.fullmatch(token):
+            sentence_start = True
+            continue
+        if (
+            any(ch.isdigit() for ch in token)
+            or (len(token) > 1 and token.isupper())
+            or (len(token) > 1 and token[0].isupper() and not sentence_start)
+        ):
+            found.add(token.lower().replace("ё", "е"))
+        sentence_start = False
+    return " ".join(sorted(found))
+
+
+def config_hash(config: Dict[str, Any], prompt_template: str = "") -> str:
+    """
+    Hash of everything that changes the answer for the same question:
+    model, embeddings, retrieval/rerank/context settings, decoding settings
+    (the generation section) and the prompt.
+    """
+    lang = config.get("language", "ru")
+    relevant = {
+        "language": lang,
+        "model": config.get("models", {}).get(lang),
+        "embedding_model": config.get("embedding_model"),
+        "retriever": config.get("retriever"),
+        "reranker": config.get("reranker"),
+        "context": config.get("context"),
+        "generation": config.get("generation"),
+        "use_langchain": config.get("use_langchain", False),
+        "prompt": hashlib.sha1(prompt_template.encode("utf-8")).hexdigest(),
+    }
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class AnswerCache:
+    """
+    Two-layer cache of generated answers per video.
+
+    Exact layer: (video_id, normalized query, config hash) -> answer.
+    Semantic layer: the closest cached question of the same video with the same
+    numbers and names (see query_entities) by query-embedding cosine similarity,
+    used when it is at least `semantic_threshold`.
+    Both layers are size-bounded LRU with TTL; with a DBConnector passed as `store`
+    entries are also written to the answer_cache table, so they survive restarts and
+    are shared between workers.
+
+    The in-memory layer belongs to one process: invalidate() clears it only in the
+    calling worker, other workers keep their copies until `ttl` expires.
+    """
+
+    def __init__(
+        self,
+        config_hash: str,
+        maxsize: int = 1024,
+        ttl: Optional[float] = 3600,
+        semantic_threshold: Optional[float] = 0.95,
+        store: Optional["DBConnector"] = None,
+    ) -> None:
+        self.logger = LoggerLoader.get_logger(__name__)
+        self.config_hash = config_hash
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.store = store
+        # (video_id, query_norm, config_hash) -> (answer, unit query embedding or None, entities)
+        self._entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.lookups = REGISTRY.counter("rag_answer_cache_total", "Answer cache lookups by result")
+        if self.store is not None:
+            self.store.ensure_answer_cache_table()
+
+    def _key(self, video_id: str, query: str) -> tuple:
+        return video_id, normalize_query(query), self.config_hash
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def get(self, video_id: str, query: str, query_embedding: Optional[Sequence[float]] = None) -> Optional[str]:
+        """Cached answer for the question, trying the exact layer first."""
+        key = self._key(video_id, query)
+        entry = self._entries.get(key)
+        if entry is None and self.store is not None:
+            answer = self.store.fetch_cached_answer(*key, ttl=self.ttl)
+            if answer is not None:
+                entry = (answer, None if query_embedding is None else self._unit(query_embedding), query_entities(query))
+                self._entries.put(key, entry)
+        if entry is not None:
+            self.lookups.inc(result="exact")
+            return entry[0]
+
+        if query_embedding is not None and self.semantic_threshold is not None:
+            answer = self._get_semantic(video_id, self._unit(query_embedding), query_entities(query))
+            if answer is not None:
+                self.lookups.inc(result="semantic")
+                return answer
+
+        self.lookups.inc(result="miss")
+        return None
+
+    def _get_semantic(self, video_id: str, q_vec: np.ndarray, entities: str) -> Optional[str]:
+        candidates = [
+            value for (vid, _, chash), value in self._entries.items()
+            if vid == video_id and chash == self.config_hash and value[1] is not None and value[2] == entities
+        ]
+        if candidates:
+            sims = np.vstack([emb for _, emb, _ in candidates]) @ q_vec
+            best = int(np.argmax(sims))
+            if sims[best] >= self.semantic_threshold:
+                self.logger.info(f"Semantic answer cache hit for {video_id} (similarity {sims[best]:.3f})")
+                return candidates[best][0]
+        if self.store is not None:
+            found = self.store.fetch_similar_cached_answer(
+                video_id, self.config_hash, q_vec.tolist(), self.semantic_threshold,
+                ttl=self.ttl, entities=entities
+            )
+            if found is not None:
+                return found[0]
+        return None
+
+    def put(self, video_id: str, query: str, answer: str, query_embedding: Optional[Sequence[float]] = None) -> None:
+        key = self._key(video_id, query)
+        q_vec = None if query_embedding is None else self._unit(query_embedding)
+        entities = query_entities(query)
+        self._entries.put(key, (answer, q_vec, entities))
+        if self.store is not None:
+            self.store.upsert_cached_answer(
+                *key, answer=answer, embedding=None if q_vec is None else q_vec.tolist(), entities=entities
+            )
+
+    def invalidate(self, video_id: str) -> None:
+        """
+        Drop every cached answer of the video (its subtitles were re-ingested):
+        in this process and, with a store, in the shared table.
+        """
+        for key, _ in self._entries.items():
+            if key[0] == video_id:
+                self._entries.pop(key)
+        if self.store is not None:
+            self.store.delete_cached_answers(video_id)
@@ -0,0 +1,401 @@
+import queue
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from src.core.abstractions.llm import BaseLLM
+from src.answer_generator.generation import StopFilter
+from src.utils import instrumentation
+from src.utils.logger_loader import LoggerLoader
+from src.utils.metrics import REGISTRY
+
+# Маркер конца потока для одного запроса
+_END = object()
+
+
+class GenerationRequest:
+    """
+    Один запрос в батче: промпт, параметры декодирования и очередь, куда уходят куски ответа.
+    Стоп-строки применяются здесь же: после стоп-строки request.stopped и текст дальше не идёт.
+    """
+
+    def __init__(
+            self,
+            prompt: str,
+            max_new_tokens: int,
+            cancel_event: Optional[threading.Event] = None,
+            stop: Optional[List[str]] = None,
+            temperature: Optional[float] = None
+    ):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.cancel_event = cancel_event
+        self.temperature = temperature
+        self.stop_filter = StopFilter(stop)
+        self.output: "queue.Queue" = queue.Queue()
+        self.closed = threading.Event()  # потребитель ушёл
+        # Заполняет движок декодирования: детокенизатор и тайминги для метрик
+        self.decoder: Optional["IncrementalDecoder"] = None
+        self.prompt_tokens = 0
+        self.started: Optional[float] = None
+        self.prefill_end: Optional[float] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.closed.is_set() or (self.cancel_event is not None and self.cancel_event.is_set())
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_filter.stopped
+
+    def emit(self, text: str) -> None:
+        text = self.stop_filter.feed(text)
+        if text:
+            self.output.put(text)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if error is None:
+            tail = self.stop_filter.flush()
+            if tail:
+                self.output.put(tail)
+        self.output.put(error if error is not None else _END)
+
+    def stream(self):
+        """Куски ответа по мере генерации; выход из цикла помечает запрос отменённым."""
+        try:
+            while True:
+                item = self.output.get()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.closed.set()
+
+
+class IncrementalDecoder:
+    """
+    Пошаговая детокенизация одной последовательности.
+
+    На каждом токене декодируется только короткое окно от предыдущего выданного
+    токена, а не весь ответ: прирост текста — разница между окном с новыми токенами
+    и без них. Пока окно кончается на неполном многобайтовом символе, текст не отдаётся.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.tokens: List[int] = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+
+    def _delta(self) -> Tuple[str, str]:
+        prefix = self.tokenizer.decode(self.tokens[self.prefix_offset:self.read_offset], skip_special_tokens=True)
+        text = self.tokenizer.decode(self.tokens[self.prefix_offset:], skip_special_tokens=True)
+        return prefix, text
+
+    def push(self, token: int) -> str:
+        self.tokens.append(token)
+        prefix, text = self._delta()
+        if len(text) > len(prefix) and not text.endswith("\ufffd"):
+            self.prefix_offset, self.read_offset = self.read_offset, len(self.tokens)
+            return text[len(prefix):]
+        return ""
+
+    def flush(self) -> str:
+        """Остаток, придержанный из-за неполного символа"""
+        prefix, text = self._delta()
+        self.prefix_offset = self.read_offset = len(self.tokens)
+        return text[len(prefix):]
+
+
+class ContinuousBatcher:
+    """
+    Непрерывный батчинг: между шагами декодирования принимает новые запросы
+    в работающий батч (до max_batch_size), а закончившие последовательности
+    сразу из него убирает. Короткий ответ не ждёт самый длинный в батче, а новый
+    запрос — конца текущего батча.
+
+    engine — движок декодирования; все его методы вызываются из потока батчера:
+      admit(requests) — prefill новых запросов и добавление их в батч;
+      step() -> закончившие запросы — один шаг декодирования всего батча;
+      requests и size — запросы в батче и их число; reset() — сбросить батч после ошибки.
+    Пока батч пуст, первый запрос ждёт попутчиков не дольше batch_window_ms.
+    """
+
+    def __init__(self, engine, max_batch_size: int = 8, batch_window_ms: float = 10.0):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000.0
+        self.logger = LoggerLoader.get_logger(__name__)
+        self.batch_size_hist = REGISTRY.histogram(
+            "llm_batch_size", "Sequences per decode step", buckets=(1, 2, 4, 8, 16, 32)
+        )
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = threading.Thread(target=self._loop, name="llm-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, request: GenerationRequest) -> GenerationRequest:
+        self._queue.put(request)
+        return request
+
+    def _take(self) -> List[GenerationRequest]:
+        """Новые запросы на свободные места: ждём только когда батч пуст"""
+        free = self.max_batch_size - self.engine.size
+        if free <= 0:
+            return []
+        taken = []
+        if not self.engine.size:
+            taken.append(self._queue.get())
+            deadline = time.monotonic() + self.batch_window
+        else:
+            deadline = 0.0
+        while len(taken) < free:
+            remaining = deadline - time.monotonic()
+            try:
+                taken.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for request in taken:
+            if request.cancelled:
+                request.finish()
+        return [r for r in taken if not r.cancelled]
+
+    def _loop(self) -> None:
+        while True:
+            new = self._take()
+            if new:
+                try:
+                    self.engine.admit(new)
+                except Exception as e:
+                    self.logger.error(f"Batch prefill error: {e}")
+                    for request in new:
+                        request.finish(e)
+            if not self.engine.size:
+                continue
+            self.batch_size_hist.observe(self.engine.size)
+            try:
+                finished = self.engine.step()
+            except Exception as e:
+                self.logger.error(f"Batch generation error: {e}")
+                for request in self.engine.requests:
+                    request.finish(e)
+                self.engine.reset()
+            else:
+                for request in finished:
+                    request.finish()
+
+
+class BatchingTransformersLLM(BaseLLM):
+    """
+    Реализация для Hugging Face Transformers с непрерывным батчингом.
+
+    Все запросы декодируются одним батчем с общим KV-кэшем: один forward на шаг.
+    Новый запрос проходит prefill отдельно и вливается в батч между шагами
+    (кэши выравниваются левым паддингом), закончившая последовательность (EOS,
+    свой лимит токенов, стоп-строка или отмена) сразу из батча удаляется.
+    Новый текст детокенизируется пошагово и сразу уходит в поток своего запроса.
+    """
+
+    def __init__(
+            self,
+            model_name: str,
+            max_batch_size: int = 8,
+            batch_window_ms: float = 10.0,
+            device: Optional[str] = None
+    ):
+        import torch
+        import transformers
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        self.logger = LoggerLoader.get_logger(__name__)
+        self.torch = torch
+        self.cache_cls = getattr(transformers, "DynamicCache", None)
+        try:
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name, padding_side="left")
+            self.model = AutoModelForCausalLM.from_pretrained(model_name)
+            self.logger.info(f"Loaded Transformers model for batched generation: {model_name}")
+        except Exception as e:
+            self.logger.error(f"Error loading Transformers model: {e}")
+            raise
+        if self.tokenizer.pad_token_id is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.model.to(self.device).eval()
+
+        max_len = getattr(self.tokenizer, "model_max_length", None)
+        self.context_window = max_len if max_len and max_len < 10**6 else None
+        self.reset()
+        self.batcher = ContinuousBatcher(self, max_batch_size, batch_window_ms)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def generate(
+            self,
+            prompt: str,
+            max_length: int = 200,
+            stop: Optional[List[str]] = None,
+            temperature: Optional[float] = None
+    ) -> str:
+        try:
+            return "".join(self.stream_generate(prompt, max_length=max_length, stop=stop, temperature=temperature))
+        except Exception as e:
+            self.logger.error(f"Generation error: {e}")
+            return ""
+
+    def stream_generate(
+            self,
+            prompt: str,
+            max_length: int = 200,
+            cancel_event: Optional[threading.Event] = None,
+            stop: Optional[List[str]] = None,
+            temperature: Optional[float] = None
+    ):
+        """Поставить запрос в батчер и отдавать его куски по мере генерации"""
+        request = self.batcher.submit(GenerationRequest(prompt, max_length, cancel_event, stop, temperature))
+        yield from request.stream()
+
+    def _next_tokens(self, logits, batch: List[GenerationRequest]):
+        """Жадный выбор; строки с temperature > 0 сэмплируются каждая со своей температурой"""
+        next_tokens = logits.argmax(dim=-1)
+        for i, request in enumerate(batch):
+            if request.temperature:
+                probs = self.torch.softmax(logits[i].float() / request.temperature, dim=-1)
+                next_tokens[i] = self.torch.multinomial(probs, 1)[0]
+        return next_tokens
+
+    # --- движок для ContinuousBatcher: всё ниже вызывается только из потока батчера ---
+
+    @property
+    def size(self) -> int:
+        return len(self.requests)
+
+    def reset(self) -> None:
+        self.requests: List[GenerationRequest] = []
+        self._past = None        # KV-кэш как кортеж слоёв (key, value) формы [batch, heads, seq, dim]
+        self._mask = None        # [batch, seq]
+        self._positions = None   # позиция последнего поданного токена, [batch]
+        self._tokens = None      # выбранные, но ещё не обработанные токены, [batch]
+
+    def _legacy(self, past) -> tuple:
+        return past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else tuple(past)
+
+    def _cache(self, legacy: tuple):
+        if self.cache_cls is not None and hasattr(self.cache_cls, "from_legacy_cache"):
+            return self.cache_cls.from_legacy_cache(legacy)
+        return legacy
+
+    def admit(self, requests: List[GenerationRequest]) -> None:
+        """Prefill новых запросов отдельным forward и слияние их кэша с батчем"""
+        with self.torch.inference_mode():
+            self._admit(requests)
+
+    def _admit(self, requests: List[GenerationRequest]) -> None:
+        torch = self.torch
+        start = time.perf_counter()
+        enc = self.tokenizer([r.prompt for r in requests], return_tensors="pt", padding=True).to(self.device)
+        mask = enc["attention_mask"]
+        # При левом паддинге позиции считаем по маске, иначе у коротких промптов они сдвинуты
+        positions = (mask.cumsum(-1) - 1).clamp(min=0)
+        out = self.model(input_ids=enc["input_ids"], attention_mask=mask, position_ids=positions, use_cache=True)
+        tokens = self._next_tokens(out.logits[:, -1, :], requests)
+        prefill_end = time.perf_counter()
+        for i, request in enumerate(requests):
+            request.decoder = IncrementalDecoder(self.tokenizer)
+            request.prompt_tokens = int(mask[i].sum())
+            request.started, request.prefill_end = start, prefill_end
+        past = self._legacy(out.past_key_values)
+        if not self.requests:
+            self._past, self._mask, self._positions, self._tokens = past, mask, positions[:, -1], tokens
+        else:
+            self._past, self._mask = self._merge(self._past, self._mask, past, mask)
+            self._positions = torch.cat([self._positions, positions[:, -1]])
+            self._tokens = torch.cat([self._tokens, tokens])
+        self.requests = self.requests + list(requests)
+
+    def _merge(self, past_a, mask_a, past_b, mask_b):
+        """Склеить два батча по строкам, дополнив более короткий кэш нулями слева (маска 0)"""
+        torch = self.torch
+        pad_to = max(mask_a.shape[1], mask_b.shape[1])
+
+        def left_pad(t, length, dim):
+            missing = pad_to - length
+            if not missing:
+                return t
+            shape = list(t.shape)
+            shape[dim] = missing
+            return torch.cat([t.new_zeros(shape), t], dim=dim)
+
+        len_a, len_b = mask_a.shape[1], mask_b.shape[1]
+        past = tuple(
+            tuple(torch.cat([left_pad(a, len_a, 2), left_pad(b, len_b, 2)], dim=0) for a, b in zip(layer_a, layer_b))
+            for layer_a, layer_b in zip(past_a, past_b)
+        )
+        mask = torch.cat([left_pad(mask_a, len_a, 1), left_pad(mask_b, len_b, 1)], dim=0)
+        return past, mask
+
+    def _accept(self, request: GenerationRequest, token: int) -> bool:
+        """Обработать очередной токен запроса; False — последовательность закончена"""
+        if token == self.tokenizer.eos_token_id or request.cancelled or request.stopped:
+            return False
+        request.emit(request.decoder.push(token))
+        return not request.stopped and len(request.decoder.tokens) < request.max_new_tokens
+
+    def _keep(self, rows: List[int]) -> None:
+        """Оставить в батче только строки rows и срезать общие пустые столбцы слева"""
+        torch = self.torch
+        index = torch.tensor(rows, device=self.device)
+        mask = self._mask.index_select(0, index)
+        start = int(mask.any(dim=0).long().argmax())
+        self._mask = mask[:, start:]
+        self._past = tuple(
+            tuple(t.index_select(0, index)[:, :, start:] for t in layer) for layer in self._past
+        )
+        self._positions = self._positions.index_select(0, index)
+        self._tokens = self._tokens.index_select(0, index)
+        self.requests = [self.requests[i] for i in rows]
+
+    def step(self) -> List[GenerationRequest]:
+        """Обработать выбранные токены, убрать закончившие строки и сделать один forward"""
+        with self.torch.inference_mode():
+            return self._step()
+
+    def _step(self) -> List[GenerationRequest]:
+        torch = self.torch
+        finished, rows = [], []
+        for i, request in enumerate(self.requests):
+            if self._accept(request, int(self._tokens[i])):
+                rows.append(i)
+            else:
+                finished.append(request)
+        now = time.perf_counter()
+        for request in finished:
+            if not request.stopped:
+                request.emit(request.decoder.flush())
+            instrumentation.record_generation(
+                "transformers-batched",
+                request.prompt_tokens,
+                len(request.decoder.tokens),
+                request.prefill_end - request.started,
+                now - request.prefill_end,
+            )
+        if not rows:
+            self.reset()
+            return finished
+        if len(rows) < len(self.requests):
+            self._keep(rows)
+
+        # Один forward по последнему выбранному токену каждой строки
+        mask = torch.cat([self._mask, self._mask.new_ones((len(rows), 1))], dim=-1)
+        positions = self._positions + 1
+        out = self.model(
+            input_ids=self._tokens.unsqueeze(-1),
+            attention_mask=mask,
+            position_ids=positions.unsqueeze(-1),
+            past_key_values=self._cache(self._past),
+            use_cache=True
+        )
+        self._tokens = self._next_tokens(out.logits[:, -1, :], self.requests)
+        self._past, self._mask, self._positions = self._legacy(out.past_key_values), mask, positions
+        return finished
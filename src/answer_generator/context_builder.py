@@ -0,0 +1,93 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+@dataclass
+class BuiltContext:
+    """Context text packed into the prompt and what went into it."""
+    text: str
+    chunks: List[Dict[str, Any]] = field(default_factory=list)
+    tokens: int = 0
+    budget: Optional[int] = None
+    dropped: int = 0
+
+
+def _has_timestamps(chunk: Dict[str, Any]) -> bool:
+    start, end = chunk.get("start_time"), chunk.get("end_time")
+    return start is not None and end is not None and end > start
+
+
+def merge_overlapping_text(first: str, second: str) -> str:
+    """
+    Join two adjacent windows, dropping the longest word sequence that
+    ends the first window and starts the second (the shared overlap).
+    """
+    a, b = first.split(), second.split()
+    for size in range(min(len(a), len(b)), 0, -1):
+        if a[-size:] == b[:size]:
+            return " ".join(a + b[size:])
+    return " ".join(a + b)
+
+
+class ContextBuilder:
+    """
+    Packs selected fragments into a token budget measured with the LLM tokenizer.
+
+    Fragments are taken by score until the budget is exhausted; windows of the
+    same video that overlap in time are then merged, so the overlap is sent to
+    the model once, and the context is ordered chronologically.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int], separator: str = "\n") -> None:
+        self.count_tokens = count_tokens
+        self.separator = separator
+
+    def merge_adjacent(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge windows whose time ranges overlap or touch; untimed chunks are kept as is."""
+        timed = sorted(
+            (c for c in chunks if _has_timestamps(c)),
+            key=lambda c: (c.get("video_id") or "", c["start_time"])
+        )
+        untimed = [c for c in chunks if not _has_timestamps(c)]
+
+        merged: List[Dict[str, Any]] = []
+        for chunk in timed:
+            prev = merged[-1] if merged else None
+            if (
+                prev is not None
+                and prev.get("video_id") == chunk.get("video_id")
+                and chunk["start_time"] <= prev["end_time"]
+            ):
+                prev["page_content"] = merge_overlapping_text(prev["page_content"], chunk["page_content"])
+                prev["end_time"] = max(prev["end_time"], chunk["end_time"])
+                prev["score"] = max(prev.get("score", 0.0), chunk.get("score", 0.0))
+            else:
+                merged.append(dict(chunk))
+        return merged + untimed
+
+    def build(self, chunks: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> BuiltContext:
+        """
+        Args:
+            chunks: dicts with "page_content", "score" and optionally
+                    "start_time" / "end_time" / "video_id"
+            max_tokens: context budget in LLM tokens (None = unlimited)
+        """
+        sep_tokens = self.count_tokens(self.separator) if chunks else 0
+        packed: List[Dict[str, Any]] = []
+        used = 0
+        for chunk in sorted(chunks, key=lambda c: c.get("score", 0.0), reverse=True):
+            cost = self.count_tokens(chunk["page_content"]) + (sep_tokens if packed else 0)
+            if max_tokens is not None and used + cost > max_tokens:
+                continue
+            packed.append(chunk)
+            used += cost
+
+        merged = self.merge_adjacent(packed)
+        text = self.separator.join(c["page_content"] for c in merged)
+        return BuiltContext(
+            text=text,
+            chunks=merged,
+            tokens=self.count_tokens(text) if text else 0,
+            budget=max_tokens,
+            dropped=len(chunks) - len(packed)
+        )
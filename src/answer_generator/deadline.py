@@ -0,0 +1,119 @@
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+from src.utils.metrics import REGISTRY
+
+DEGRADED = REGISTRY.counter("rag_degraded_total", "Requests where a stage was cut short by the deadline")
+
+
+class Deadline:
+    """
+    Time budget of one request as an absolute time.monotonic() instant
+    (the same clock the scheduler and the reranker take deadlines in).
+
+    Stages check remaining() and call degrade(reason) when they cut work short;
+    the caller reports `degraded` / `reasons` in the response.
+    A Deadline without a budget never expires.
+    """
+
+    def __init__(self, seconds: Optional[float] = None) -> None:
+        self.seconds = seconds
+        self.at = None if seconds is None else time.monotonic() + seconds
+        self.reasons: List[str] = []
+
+    def remaining(self) -> float:
+        return math.inf if self.at is None else self.at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def degrade(self, reason: str) -> None:
+        if reason not in self.reasons:
+            self.reasons.append(reason)
+            DEGRADED.inc(reason=reason)
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self.reasons)
+
+
+class DeadlinePolicy:
+    """
+    How pipeline stages degrade when the remaining budget is short.
+
+    - below full_retrieval_seconds: fewer candidates are fetched (half of top_k)
+    - below rerank_seconds: the reranker is skipped, retrieval order is kept
+    - below generation_seconds: no generation, the answer lists the best chunks
+    - otherwise max_length is capped to what decodes at tokens_per_second
+      in the remaining time, and generation is cancelled at the deadline
+    """
+
+    def __init__(
+        self,
+        default_seconds: Optional[float] = None,
+        max_seconds: Optional[float] = None,
+        full_retrieval_seconds: float = 5.0,
+        rerank_seconds: float = 3.0,
+        generation_seconds: float = 2.0,
+        tokens_per_second: float = 10.0
+    ) -> None:
+        self.default_seconds = default_seconds
+        self.max_seconds = max_seconds
+        self.full_retrieval_seconds = full_retrieval_seconds
+        self.rerank_seconds = rerank_seconds
+        self.generation_seconds = generation_seconds
+        self.tokens_per_second = tokens_per_second
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "DeadlinePolicy":
+        return cls(
+            default_seconds=cfg.get("default_seconds"),
+            max_seconds=cfg.get("max_seconds"),
+            full_retrieval_seconds=cfg.get("full_retrieval_seconds", 5.0),
+            rerank_seconds=cfg.get("rerank_seconds", 3.0),
+            generation_seconds=cfg.get("generation_seconds", 2.0),
+            tokens_per_second=cfg.get("tokens_per_second", 10.0)
+        )
+
+    def new_deadline(self, seconds: Optional[float] = None) -> Deadline:
+        """Deadline for a request: its own budget (capped by max_seconds) or the default."""
+        if seconds is None:
+            seconds = self.default_seconds
+        if seconds is not None and self.max_seconds is not None:
+            seconds = min(seconds, self.max_seconds)
+        return Deadline(seconds)
+
+    def retrieval_k(self, deadline: Deadline, top_k: int, floor: int = 1) -> int:
+        if deadline.remaining() >= self.full_retrieval_seconds:
+            return top_k
+        k = max(floor, top_k // 2)
+        if k < top_k:
+            deadline.degrade("top_k_reduced")
+        return k
+
+    def allow_rerank(self, deadline: Deadline) -> bool:
+        if deadline.remaining() >= self.rerank_seconds:
+            return True
+        deadline.degrade("rerank_skipped")
+        return False
+
+    def allow_generation(self, deadline: Deadline) -> bool:
+        if deadline.remaining() >= self.generation_seconds:
+            return True
+        deadline.degrade("retrieval_only")
+        return False
+
+    def max_tokens(self, deadline: Deadline, max_tokens: int) -> int:
+        remaining = deadline.remaining()
+        if math.isinf(remaining):
+            return max_tokens
+        cap = max(1, int(remaining * self.tokens_per_second))
+        if cap < max_tokens:
+            deadline.degrade("max_length_capped")
+            return cap
+        return max_tokens
+
+    def slot_deadline(self, deadline: Deadline) -> Optional[float]:
+        """Latest instant a request may still start generating (None: no limit)."""
+        return None if deadline.at is None else deadline.at - self.generation_seconds
@@ -0,0 +1,178 @@
+import re
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.utils.metrics import REGISTRY
+
+ANSWER_CAP = REGISTRY.counter("rag_answer_cap_total", "Generations per adaptive answer-length class")
+
+
+@dataclass
+class GenerationParams:
+    """
+    Decoding parameters of one generation.
+    temperature None keeps the backend default (greedy for Transformers).
+    adaptive: whether AnswerLengthPolicy may lower max_tokens (off once a request sets it).
+    """
+    max_tokens: int = 1024
+    stop: List[str] = field(default_factory=list)
+    temperature: Optional[float] = None
+    adaptive: bool = True
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], language: str) -> "GenerationParams":
+        """The `generation` section, overridden by `models.<language>.generation`."""
+        merged = dict(config.get("generation", {}))
+        merged.update(config.get("models", {}).get(language, {}).get("generation", {}))
+        return cls(
+            max_tokens=merged.get("max_tokens", 1024),
+            stop=list(merged.get("stop") or []),
+            temperature=merged.get("temperature")
+        )
+
+    def with_overrides(
+        self,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        temperature: Optional[float] = None
+    ) -> "GenerationParams":
+        """Copy with the per-request values that are set."""
+        changes: Dict[str, Any] = {}
+        if max_tokens is not None:
+            changes["max_tokens"] = max_tokens
+            changes["adaptive"] = False
+        if stop is not None:
+            changes["stop"] = list(stop)
+        if temperature is not None:
+            changes["temperature"] = temperature
+        return replace(self, **changes) if changes else self
+
+    def llm_kwargs(self) -> Dict[str, Any]:
+        """stop / temperature for BaseLLM.generate, only when set (backend defaults otherwise)."""
+        kwargs: Dict[str, Any] = {}
+        if self.stop:
+            kwargs["stop"] = list(self.stop)
+        if self.temperature is not None:
+            kwargs["temperature"] = self.temperature
+        return kwargs
+
+
+def truncate_at_stop(text: str, stop: Optional[Sequence[str]]) -> str:
+    """Cut text before the earliest stop sequence (the stop sequence itself is dropped)."""
+    cut = len(text)
+    for s in stop or ():
+        if s:
+            idx = text.find(s)
+            if idx != -1:
+                cut = min(cut, idx)
+    return text[:cut]
+
+
+class StopFilter:
+    """
+    Stop sequences for streamed text, matching llama.cpp semantics: nothing from
+    the first stop sequence on is emitted. A tail that could be the beginning of
+    a stop sequence is held back until the next piece decides it.
+    """
+
+    def __init__(self, stop: Optional[Sequence[str]] = None) -> None:
+        self.stop = [s for s in (stop or ()) if s]
+        self._hold = max((len(s) for s in self.stop), default=1) - 1
+        self._buffer = ""
+        self.stopped = False
+
+    def feed(self, text: str) -> str:
+        """Text that is safe to emit after appending this piece."""
+        if self.stopped:
+            return ""
+        if not self.stop:
+            return text
+        self._buffer += text
+        cut = truncate_at_stop(self._buffer, self.stop)
+        if len(cut) < len(self._buffer):
+            self.stopped = True
+            self._buffer = ""
+            return cut
+        keep = self._partial_suffix(self._buffer)
+        out, self._buffer = self._buffer[:len(self._buffer) - keep], self._buffer[len(self._buffer) - keep:]
+        return out
+
+    def flush(self) -> str:
+        """The held-back tail at the end of the stream."""
+        out, self._buffer = ("" if self.stopped else self._buffer), ""
+        return out
+
+    def _partial_suffix(self, text: str) -> int:
+        """Length of the longest suffix of text that is a proper prefix of a stop sequence."""
+        for n in range(min(self._hold, len(text)), 0, -1):
+            tail = text[-n:]
+            if any(s.startswith(tail) for s in self.stop):
+                return n
+        return 0
+
+
+# Question shapes that expect a short factual answer / an explanation (ru + en)
+_SHORT_RE = re.compile(
+    r"^\s*(сколько|когда|кто|где|какого|какой год|в каком|is|are|was|were|do|does|did|can|"
+    r"how many|how much|when|who|where|which)\b",
+    re.IGNORECASE
+)
+_LONG_RE = re.compile(
+    r"\b(почему|зачем|объясни|расскажи|опиши|сравни|перечисли|списком|тезисы|в ч[её]м разница|"
+    r"why|explain|describe|compare|list|summari[sz]e|key points|difference)\b",
+    re.IGNORECASE
+)
+
+
+class AnswerLengthPolicy:
+    """
+    Adaptive cap on generated tokens.
+
+    - short factual questions (who / when / how many / yes-no) get short_tokens
+    - explanations, comparisons and lists keep the configured max_tokens
+    - everything else gets medium_tokens
+    The cap is further bounded by context size: an answer grounded in the
+    context needs at most context_ratio * context tokens (but min_tokens at least).
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        short_tokens: int = 128,
+        medium_tokens: int = 384,
+        context_ratio: float = 1.0,
+        min_tokens: int = 64
+    ) -> None:
+        self.enabled = enabled
+        self.short_tokens = short_tokens
+        self.medium_tokens = medium_tokens
+        self.context_ratio = context_ratio
+        self.min_tokens = min_tokens
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "AnswerLengthPolicy":
+        return cls(
+            enabled=cfg.get("enabled", False),
+            short_tokens=cfg.get("short_tokens", 128),
+            medium_tokens=cfg.get("medium_tokens", 384),
+            context_ratio=cfg.get("context_ratio", 1.0),
+            min_tokens=cfg.get("min_tokens", 64)
+        )
+
+    @staticmethod
+    def question_type(query: str) -> str:
+        if _LONG_RE.search(query):
+            return "long"
+        if _SHORT_RE.search(query):
+            return "short"
+        return "medium"
+
+    def cap(self, query: str, context_tokens: int, max_tokens: int) -> int:
+        if not self.enabled:
+            return max_tokens
+        kind = self.question_type(query)
+        ANSWER_CAP.inc(type=kind)
+        limit = {"short": self.short_tokens, "medium": self.medium_tokens}.get(kind, max_tokens)
+        if context_tokens:
+            limit = min(limit, max(self.min_tokens, int(context_tokens * self.context_ratio)))
+        return max(1, min(max_tokens, limit))
@@ -1,19 +1,90 @@
 from abc import ABC, abstractmethod
-from typing import Union
-from src.utils.logger_loader import LoggerLoader
-from transformers import pipeline
-from llama_cpp import Llama
-import gc
+from typing import Any, Dict, List, Optional, Union
+import threading
+import time
+from src.utils.logger_loader import LoggerLoader, bind_request_id
 from src.core.abstractions.llm import BaseLLM
+from src.answer_generator.generation import StopFilter, truncate_at_stop
+from src.utils import instrumentation
+from src.utils.metrics import REGISTRY
+from src.utils.resources import ResourcePlan, pinned, pinned_steps
+
+# transformers и llama_cpp импортируются в конструкторах: нужен только один бэкенд,
+# а импорт модуля не должен тянуть тяжёлые зависимости
+
+
+class CancelCriteria:
+    """
+    Останавливает HF generate, когда выставлено любое из событий.
+    Совместим с StoppingCriteria по вызову, чтобы не импортировать transformers заранее
+    """
+
+    def __init__(self, *events: Optional[threading.Event]):
+        self.events = [e for e in events if e is not None]
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return any(e.is_set() for e in self.events)
+
+
+class StopTextCriteria:
+    """
+    Останавливает HF generate, как только в сгенерированном хвосте появилась стоп-строка
+    (сам текст потом обрезается перед ней). Декодируется только хвост последних токенов
+    """
+
+    def __init__(self, tokenizer, stop: List[str]):
+        self.tokenizer = tokenizer
+        self.stop = [s for s in stop if s]
+        # каждый токен — хотя бы один символ, так что окна длиной в самую длинную строку хватает
+        self.window = max((len(s) for s in self.stop), default=0) + 4
+        self.start: Optional[int] = None
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        length = input_ids.shape[-1]
+        if self.start is None:
+            # первый вызов — после первого сгенерированного токена
+            self.start = length - 1
+        tail = self.tokenizer.decode(input_ids[0, max(self.start, length - self.window):], skip_special_tokens=True)
+        return any(s in tail for s in self.stop)
+
+
+def sampling_kwargs(temperature: Optional[float]) -> Dict[str, Any]:
+    """Параметры HF generate для температуры: None — конфиг модели, 0 — жадно"""
+    if temperature is None:
+        return {}
+    if temperature <= 0:
+        return {"do_sample": False}
+    return {"do_sample": True, "temperature": temperature}
+
+
+class MeterStreamer:
+    """
+    Стример HF generate только для метрик: первый put — токены промпта,
+    дальше — по новому токену на шаг декодирования
+    """
+
+    def __init__(self, meter):
+        self.meter = meter
+        self.prompt_tokens: Optional[int] = None
+
+    def put(self, value) -> None:
+        if self.prompt_tokens is None:
+            self.prompt_tokens = int(value.shape[-1])
+            return
+        self.meter.token()
+
+    def end(self) -> None:
+        pass
 
 
 class TransformersLLM(BaseLLM):
     """Реализация для Hugging Face Transformers"""
 
     def __init__(self, model_name: str):
-        self.logger = LoggerLoader.get_logger()
+        from transformers import pipeline
+
+        self.logger = LoggerLoader.get_logger(__name__)
         try:
-            # поддержка stream=True для потоковой генерации
             self.pipeline = pipeline(
                 "text-generation",
                 model=model_name,
@@ -24,88 +95,282 @@ class TransformersLLM(BaseLLM):
         except Exception as e:
             self.logger.error(f"Error loading Transformers model: {e}")
             raise
+        max_len = getattr(self.pipeline.tokenizer, "model_max_length", None)
+        # HF ставит огромное значение-заглушку, если длина не задана
+        self.context_window = max_len if max_len and max_len < 10**6 else None
 
-    def generate(self, prompt: str, max_length: int = 200) -> str:
+    def count_tokens(self, text: str) -> int:
+        return len(self.pipeline.tokenizer.encode(text, add_special_tokens=False))
+
+    def generate(
+            self,
+            prompt: str,
+            max_length: int = 200,
+            stop: Optional[List[str]] = None,
+            temperature: Optional[float] = None
+    ) -> str:
+        meter = instrumentation.generation_meter("transformers")
+        extra = {"streamer": MeterStreamer(meter)} if meter.active else {}
+        extra.update(sampling_kwargs(temperature))
+        if stop:
+            from transformers import StoppingCriteriaList
+            extra["stopping_criteria"] = StoppingCriteriaList([StopTextCriteria(self.pipeline.tokenizer, stop)])
         try:
+            # max_new_tokens: max_length в HF включает длину промпта
             output = self.pipeline(
                 prompt,
-                max_length=max_length,
-                num_return_sequences=1
+                max_new_tokens=max_length,
+                num_return_sequences=1,
+                **extra
             )
-            return output[0]['generated_text']
+            if meter.active:
+                meter.finish(prompt_tokens=extra["streamer"].prompt_tokens)
+            return truncate_at_stop(output[0]['generated_text'], stop)
         except Exception as e:
             self.logger.error(f"Generation error: {e}")
             return ""
 
-    def stream_generate(self, prompt: str, max_length: int = 200):
-        """Потоковая генерация текстовых фрагментов"""
+    def stream_generate(
+            self,
+            prompt: str,
+            max_length: int = 200,
+            cancel_event: Optional[threading.Event] = None,
+            stop: Optional[List[str]] = None,
+            temperature: Optional[float] = None
+    ):
+        """Потоковая генерация текстовых фрагментов через TextIteratorStreamer"""
+        from transformers import StoppingCriteriaList, TextIteratorStreamer
+
+        streamer = TextIteratorStreamer(
+            self.pipeline.tokenizer, skip_prompt=True, skip_special_tokens=True
+        )
+        # closed — для случая, когда потребитель бросил генератор, не дочитав его
+        closed = threading.Event()
+        criteria = [CancelCriteria(closed, cancel_event)]
+        if stop:
+            criteria.append(StopTextCriteria(self.pipeline.tokenizer, stop))
+        stopping = StoppingCriteriaList(criteria)
+        # generate блокирующий — запускаем в отдельном потоке и читаем стример
+        worker = threading.Thread(
+            target=bind_request_id(self._run_pipeline),
+            args=(prompt, max_length, streamer, stopping, sampling_kwargs(temperature)),
+            daemon=True
+        )
+        worker.start()
+        meter = instrumentation.generation_meter("transformers")
+        stop_filter = StopFilter(stop)
+        pieces: List[str] = []
+        try:
+            for text in streamer:
+                text = stop_filter.feed(text)
+                if meter.active:
+                    meter.token(0)
+                    pieces.append(text)
+                if text:
+                    yield text
+                if stop_filter.stopped:
+                    break
+            tail = stop_filter.flush()
+            if tail:
+                pieces.append(tail)
+                yield tail
+        except Exception as e:
+            self.logger.error(f"Stream generation error: {e}")
+            return
+        finally:
+            closed.set()
+            if meter.active:
+                meter.finish(
+                    prompt_tokens=self.count_tokens(prompt),
+                    completion_tokens=self.count_tokens("".join(pieces))
+                )
+
+    def _run_pipeline(self, prompt, max_length, streamer, stopping, sampling) -> None:
         try:
-            # Используем параметр stream=True, если поддерживается
-            for out in self.pipeline(
+            self.pipeline(
                 prompt,
-                max_length=max_length,
+                max_new_tokens=max_length,
                 num_return_sequences=1,
-                stream=True
-            ):
-                # out может быть словарём с частичным текстом
-                text = out.get('generated_text') or out.get('text', '')
-                yield text
+                streamer=streamer,
+                stopping_criteria=stopping,
+                **sampling
+            )
         except Exception as e:
             self.logger.error(f"Stream generation error: {e}")
-            return
+            streamer.end()
 
 
 class LlamaCppLLM(BaseLLM):
     """Реализация для GGUF моделей через llama.cpp"""
 
-    def __init__(self, model_path: str, n_ctx: int = 2048):
-        self.logger = LoggerLoader.get_logger()
+    def __init__(
+            self,
+            model_path: str,
+            n_ctx: int = 2048,
+            prefix_cache: bool = False,
+            n_threads: Optional[int] = None,
+            n_threads_batch: Optional[int] = None,
+            cores: Optional[List[int]] = None
+    ):
+        from llama_cpp import Llama
+
+        self.logger = LoggerLoader.get_logger(__name__)
+        # Потоки llama.cpp создаются вызывающим потоком и наследуют его привязку к ядрам
+        self.cores = cores
         try:
-            self.llm = Llama(
-                model_path=model_path,
-                n_ctx=n_ctx,
-                verbose=False
+            with pinned(cores):
+                self.llm = Llama(
+                    model_path=model_path,
+                    n_ctx=n_ctx,
+                    n_threads=n_threads,
+                    n_threads_batch=n_threads_batch,
+                    verbose=False
+                )
+            self.logger.info(
+                f"Loaded GGUF model: {model_path} (threads={n_threads or 'auto'}, "
+                f"threads_batch={n_threads_batch or 'auto'}, cores={cores or 'all'})"
             )
-            self.logger.info(f"Loaded GGUF model: {model_path}")
         except Exception as e:
             self.logger.error(f"Error loading GGUF model: {e}")
             raise
+        self.context_window = n_ctx
+
+        # Кэш префикса: состояние llama.cpp после статической части промпта
+        self.prefix_cache = prefix_cache
+        self._prefix_text: Optional[str] = None
+        self._prefix_tokens: List[int] = []
+        self._prefix_state = None
+        self._prefix_eval_seconds = 0.0
+        # llama.cpp не потокобезопасен, а восстановление состояния + генерация должны быть атомарны.
+        # Обычный Lock, а не RLock: шаги потоковой генерации идут из разных потоков пула
+        self._lock = threading.Lock()
+        self._prefix_hits = REGISTRY.counter(
+            "llm_prefix_cache_hits_total",
+            "Requests that started from the saved prompt-prefix state (llama.cpp had not kept it in KV)"
+        )
+        self._prefill_saved = REGISTRY.counter(
+            "llm_prefill_saved_seconds_total",
+            "Prefix prefill time avoided by restoring the saved state, minus the restore time"
+        )
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def warm_prefix(self, prefix: str) -> None:
+        """
+        Один раз вычисляет KV-состояние статического префикса промпта
+        и сохраняет его (llama.cpp save_state), чтобы на запросах
+        вычислять только хвост с контекстом и вопросом.
+        """
+        if not self.prefix_cache or not prefix:
+            return
+        with self._lock, pinned(self.cores):
+            tokens = self.llm.tokenize(prefix.encode("utf-8"), add_bos=True)
+            start = time.perf_counter()
+            self.llm.reset()
+            self.llm.eval(tokens)
+            self._prefix_eval_seconds = time.perf_counter() - start
+            self._prefix_state = self.llm.save_state()
+            self._prefix_text = prefix
+            self._prefix_tokens = list(tokens)
+        self.logger.info(
+            f"Prompt prefix cached: {len(tokens)} tokens, prefill {self._prefix_eval_seconds:.2f}s"
+        )
+
+    def _restore_prefix(self, prompt: str) -> None:
+        """
+        Если промпт начинается с закэшированного префикса, гарантирует, что
+        KV-кэш модели его содержит. llama.cpp сам переиспользует общий
+        префикс токенов с предыдущим вычислением и считает только остаток.
+        """
+        if self._prefix_state is None or not prompt.startswith(self._prefix_text):
+            return
+        n = len(self._prefix_tokens)
+        current = list(self.llm.input_ids[: self.llm.n_tokens][:n])
+        if current == self._prefix_tokens:
+            # KV уже начинается с префикса: llama.cpp переиспользует его и без кэша, выигрыша нет
+            return
+        start = time.perf_counter()
+        self.llm.load_state(self._prefix_state)
+        self._prefix_hits.inc()
+        self._prefill_saved.inc(max(0.0, self._prefix_eval_seconds - (time.perf_counter() - start)))
+
+    @staticmethod
+    def _decoding_kwargs(stop: Optional[List[str]], temperature: Optional[float]) -> Dict[str, Any]:
+        # Стоп-строки llama.cpp обрабатывает сам: в выдачу не попадает ни сама строка, ни её начало
+        kwargs: Dict[str, Any] = {"stop": list(stop or [])}
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        return kwargs
 
-    def generate(self, prompt: str, max_length: int = 200) -> str:
+    def generate(
+            self,
+            prompt: str,
+            max_length: int = 200,
+            stop: Optional[List[str]] = None,
+            temperature: Optional[float] = None
+    ) -> str:
+        # Внутри — потоковый вызов: первый токен отделяет prefill от decode для метрик
+        meter = instrumentation.generation_meter("llama.cpp")
         try:
-            output = self.llm(
-                prompt,
-                max_tokens=max_length,
-                echo=False
-            )
-            # Проверяем формат вывода
-            if isinstance(output, dict) and "choices" in output:
-                return output['choices'][0]['text'].strip()
-            elif isinstance(output, str):
-                return output.strip()
-            else:
-                return str(output)
+            parts = []
+            with self._lock, pinned(self.cores):
+                self._restore_prefix(prompt)
+                for out in self.llm(
+                        prompt, max_tokens=max_length, echo=False, stream=True,
+                        **self._decoding_kwargs(stop, temperature)
+                ):
+                    parts.append(self._chunk_text(out))
+                    meter.token()
+            if meter.active:
+                meter.finish(prompt_tokens=self.count_tokens(prompt))
+            return "".join(parts).strip()
         except Exception as e:
             self.logger.error(f"Generation error: {e}")
             return ""
 
-    def stream_generate(self, prompt: str, max_length: int = 200):
+    @staticmethod
+    def _chunk_text(out) -> str:
+        # out — словарь с токеном
+        if isinstance(out, dict) and "choices" in out:
+            return out["choices"][0].get("text", "")
+        return str(out)
+
+    def stream_generate(
+            self,
+            prompt: str,
+            max_length: int = 200,
+            cancel_event: Optional[threading.Event] = None,
+            stop: Optional[List[str]] = None,
+            temperature: Optional[float] = None
+    ):
         """Потоковая генерация через llama.cpp stream=True"""
+        meter = instrumentation.generation_meter("llama.cpp")
+        stream = None
+        self._lock.acquire()
         try:
-            for out in self.llm(
+            self._restore_prefix(prompt)
+            stream = self.llm(
                 prompt,
                 max_tokens=max_length,
-                stream=True
-            ):
-                # out — словарь с токеном
-                if isinstance(out, dict) and 'choices' in out:
-                    chunk = out['choices'][0].get('text', '')
-                else:
-                    chunk = str(out)
-                yield chunk
+                stream=True,
+                **self._decoding_kwargs(stop, temperature)
+            )
+            for out in pinned_steps(stream, self.cores):
+                # Клиент ушёл — дальше не декодируем
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                meter.token()
+                yield self._chunk_text(out)
         except Exception as e:
             self.logger.error(f"Stream generation error: {e}")
             return
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+            if meter.active:
+                meter.finish(prompt_tokens=self.count_tokens(prompt))
+            self._lock.release()
 
 
 def model_factory(config: dict) -> BaseLLM:
@@ -114,11 +379,24 @@ def model_factory(config: dict) -> BaseLLM:
     model_config = config["models"][lang]
 
     if model_config["backend"] == "transformers":
+        batching = model_config.get("batching", {})
+        if batching.get("enabled", False):
+            from src.answer_generator.batching import BatchingTransformersLLM
+            return BatchingTransformersLLM(
+                model_config["model_name"],
+                max_batch_size=batching.get("max_batch_size", 8),
+                batch_window_ms=batching.get("batch_window_ms", 10)
+            )
         return TransformersLLM(model_config["model_name"])
     elif model_config["backend"] == "llama.cpp":
+        resources = ResourcePlan.from_config(config).llm
         return LlamaCppLLM(
             model_config["model_path"],
-            n_ctx=model_config.get("n_ctx", 2048)
+            n_ctx=model_config.get("n_ctx", 2048),
+            prefix_cache=model_config.get("prefix_cache", False),
+            n_threads=resources.threads,
+            n_threads_batch=resources.threads_batch,
+            cores=resources.cores
         )
     else:
         raise ValueError(f"Unknown backend: {model_config['backend']}")
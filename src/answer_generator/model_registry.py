@@ -0,0 +1,157 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from src.core.abstractions.llm import BaseLLM
+from src.core.adapters.sentence_embedder import SentenceEmbedder
+from src.answer_generator.scheduler import LLMScheduler
+from src.utils.config_loader import ConfigLoader
+from src.utils.logger_loader import LoggerLoader
+from src.utils.prompt_loader import PromptLoader
+from src.utils.resources import ResourcePlan
+
+
+class ModelRegistry:
+    """
+    Синглтон-реестр тяжёлых объектов процесса (LLM, эмбеддинги, шаблоны промптов, планировщики).
+    Каждый объект создаётся лениво при первом обращении, дальше все
+    компоненты (RAGModel, LangChainRAG) получают один и тот же экземпляр.
+    """
+    _instance = None  # Храним единственный экземпляр
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(ModelRegistry, cls).__new__(cls)
+                cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.logger = LoggerLoader.get_logger(__name__)
+        self._objects: Dict[Hashable, Any] = {}
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.prompt_loader = PromptLoader()
+
+    @classmethod
+    def get_registry(cls) -> "ModelRegistry":
+        """Возвращает экземпляр реестра."""
+        return cls()
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Возвращает объект по ключу, создавая его через factory при первом обращении.
+        Загрузка разных ключей идёт параллельно, одного ключа — ровно один раз.
+        """
+        if key in self._objects:
+            return self._objects[key]
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._objects:
+                self.logger.info(f"Loading shared model: {key}")
+                self._objects[key] = factory()
+        return self._objects[key]
+
+    def get_prompt(self, language: str) -> str:
+        """Шаблон промпта для языка (файл читается один раз)."""
+        return self.get_or_create(("prompt", language), lambda: self.prompt_loader.load(language))
+
+    def get_llm(self, config: dict) -> BaseLLM:
+        """
+        LLM для языка из конфига. Ключ — язык, бэкенд и модель, поэтому
+        одинаковые настройки всегда дают один и тот же экземпляр.
+        """
+        lang = config.get("language", "en")
+        return self.get_or_create(("llm",) + self._llm_key(config), lambda: self._create_llm(config, lang))
+
+    def get_scheduler(self, config: dict) -> LLMScheduler:
+        """
+        Планировщик генераций для LLM из конфига: один на экземпляр модели,
+        чтобы все пути генерации делили одни и те же слоты и очередь.
+        При включённом batching слотов не меньше max_batch_size, иначе батч не наберётся.
+        """
+        sched_cfg = config.get("llm_scheduler", {})
+        slots = sched_cfg.get("slots", 1)
+        batching = config["models"][config.get("language", "en")].get("batching", {})
+        if batching.get("enabled", False):
+            slots = max(slots, batching.get("max_batch_size", 8))
+        return self.get_or_create(
+            ("scheduler",) + self._llm_key(config),
+            lambda: LLMScheduler(
+                slots=slots,
+                max_queue=sched_cfg.get("max_queue", 16),
+                queue_timeout=sched_cfg.get("queue_timeout", 30.0)
+            )
+        )
+
+    @staticmethod
+    def _llm_key(config: dict) -> tuple:
+        lang = config.get("language", "en")
+        model_config = config["models"][lang]
+        return (
+            lang,
+            model_config["backend"],
+            model_config.get("model_name") or model_config.get("model_path"),
+        )
+
+    def get_embedder(self, model_name: str) -> SentenceEmbedder:
+        """
+        Общая модель эмбеддингов: один экземпляр на имя модели, он же служит
+        Embedder для RAGModel/DBVectorStore и Embeddings для LangChain.
+        """
+        return self.get_or_create(("embedder", model_name), lambda: self._create_embedder(model_name))
+
+    def _create_embedder(self, model_name: str) -> SentenceEmbedder:
+        client = self.model_client(ConfigLoader.get_config())
+        if client is not None:
+            from src.answer_generator.model_server import RemoteEmbedder
+            return RemoteEmbedder(client, model_name)
+        return self.create_local_embedder(model_name)
+
+    @staticmethod
+    def create_local_embedder(model_name: str) -> SentenceEmbedder:
+        """
+        Модель эмбеддингов в текущем процессе (веса грузятся сразу, а не на первом запросе)
+        с потоками torch и ядрами из resources.embedder.
+        """
+        resources = ResourcePlan.from_config(ConfigLoader.get_config())
+        resources.apply_torch()
+        embedder = SentenceEmbedder(model_name, cores=resources.embedder.cores)
+        embedder.model
+        return embedder
+
+    def _create_llm(self, config: dict, lang: str) -> BaseLLM:
+        client = self.model_client(config)
+        if client is not None:
+            from src.answer_generator.model_server import RemoteLLM
+            return RemoteLLM(client)
+        return self.create_local_llm(config)
+
+    def create_local_llm(self, config: dict) -> BaseLLM:
+        """LLM в текущем процессе с прогретым статическим префиксом промпта."""
+        from src.answer_generator.model_factory import model_factory
+        llm = model_factory(config)
+        llm.warm_prefix(PromptLoader.static_prefix(self.get_prompt(config.get("language", "en"))))
+        return llm
+
+    def model_client(self, config: dict) -> Optional[Any]:
+        """
+        Клиент сервера моделей, если включён model_server: тогда LLM и эмбеддинги
+        живут в отдельном процессе, общем для всех воркеров.
+        """
+        server_cfg = config.get("model_server", {})
+        if not server_cfg.get("enabled", False):
+            return None
+        from src.answer_generator.model_server import ModelClient, server_address, server_authkey
+        address = server_address(server_cfg)
+        return self.get_or_create(
+            ("model_client", address),
+            lambda: ModelClient(address, authkey=server_authkey(server_cfg, address))
+        )
+
+    def clear(self) -> None:
+        """Забывает все созданные объекты (для тестов и перезагрузки конфигурации)."""
+        with self._lock:
+            self._objects.clear()
+            self._key_locks.clear()
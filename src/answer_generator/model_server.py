@@ -0,0 +1,582 @@
+import os
+import queue
+import secrets
+import socket
+import stat
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from src.answer_generator import scheduler as scheduler_module
+from src.answer_generator.scheduler import LLMScheduler
+from src.core.abstractions.llm import BaseLLM
+from src.core.adapters.sentence_embedder import SentenceEmbedder
+from src.utils import instrumentation
+from src.utils.logger_loader import LoggerLoader
+from src.utils.metrics import REGISTRY, Family
+from src.utils.resources import ResourcePlan
+
+SOCKET_NAME = "model-server.sock"
+AUTHKEY_FILE = "authkey"
+
+
+class ModelServerError(RuntimeError):
+    """Сервер моделей недоступен или вернул ошибку."""
+
+
+def default_address() -> str:
+    """
+    Сокет в личном каталоге пользователя: $XDG_RUNTIME_DIR/rag-model-server
+    или <tmp>/rag-model-server-<uid>, а не в общем /tmp.
+    """
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        base = os.path.join(runtime_dir, "rag-model-server")
+    else:
+        base = os.path.join(tempfile.gettempdir(), f"rag-model-server-{os.getuid()}")
+    return os.path.join(base, SOCKET_NAME)
+
+
+def server_address(server_config: Dict[str, Any]) -> str:
+    """Адрес сокета из model_server.address (null — default_address())."""
+    return server_config.get("address") or default_address()
+
+
+def ensure_private_dir(path: str) -> None:
+    """
+    Создать каталог с правами 0700 или проверить существующий: он должен
+    принадлежать текущему пользователю и быть закрыт для группы и остальных.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise ModelServerError(
+            f"Каталог сокета {path} должен принадлежать текущему пользователю и иметь права 0700"
+        )
+
+
+def authkey_path(address: str) -> str:
+    """Файл ключа рядом с сокетом (в том же закрытом каталоге)."""
+    return os.path.join(os.path.dirname(address), AUTHKEY_FILE)
+
+
+def server_authkey(server_config: Dict[str, Any], address: Optional[str] = None) -> Optional[bytes]:
+    """
+    Ключ аутентификации: переменная окружения из model_server.authkey_env,
+    иначе файл ключа, сгенерированный сервером рядом с сокетом. None — ключа нет.
+    """
+    value = os.getenv(server_config.get("authkey_env", "MODEL_SERVER_AUTHKEY"))
+    if value:
+        return value.encode("utf-8")
+    path = authkey_path(address or server_address(server_config))
+    if not os.path.exists(path):
+        return None
+    # ключ из каталога, куда может писать кто-то ещё, не принимаем
+    ensure_private_dir(os.path.dirname(path))
+    try:
+        with open(path, "rb") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def create_authkey(address: str) -> bytes:
+    """Сгенерировать ключ и записать его в файл с правами 0600 рядом с сокетом."""
+    ensure_private_dir(os.path.dirname(address))
+    key = secrets.token_hex(32).encode("ascii")
+    path = authkey_path(address)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.fchmod(fd, 0o600)
+        os.write(fd, key)
+    finally:
+        os.close(fd)
+    return key
+
+
+def _error_payload(error: BaseException) -> Tuple[str, str, Optional[float]]:
+    return type(error).__name__, str(error), getattr(error, "retry_after", None)
+
+
+def _rebuild_error(payload: Tuple[str, str, Optional[float]]) -> BaseException:
+    """Ошибка сервера на стороне клиента; отказы планировщика сохраняют тип и Retry-After."""
+    name, message, retry_after = payload
+    cls = getattr(scheduler_module, name, None)
+    if isinstance(cls, type) and issubclass(cls, scheduler_module.SchedulerRejected):
+        return cls(message, retry_after=retry_after)
+    return ModelServerError(f"{name}: {message}")
+
+
+class EncodeBatcher:
+    """
+    Объединяет вызовы encode, пришедшие от разных воркеров в пределах окна
+    batch_window_ms, в один вызов модели эмбеддингов (не больше max_batch_size текстов).
+    """
+
+    def __init__(self, embedder: Any, max_batch_size: int = 64, batch_window_ms: float = 5.0):
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000.0
+        self.logger = LoggerLoader.get_logger(__name__)
+        self.batch_size_hist = REGISTRY.histogram(
+            "embed_batch_size", "Texts per embedding batch in the model server",
+            buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+        )
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = threading.Thread(target=self._loop, name="embed-batcher", daemon=True)
+        self._worker.start()
+
+    def encode(self, texts: Union[str, List[str]], **kwargs) -> Any:
+        single = isinstance(texts, str)
+        items = [texts] if single else list(texts)
+        if not items:
+            return self.embedder.encode(items, **kwargs)
+        future: Future = Future()
+        self._queue.put((items, kwargs, future))
+        result = future.result()
+        return result[0] if single else result
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        total = len(batch[0][0])
+        deadline = time.monotonic() + self.batch_window
+        while total < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            total += len(item[0])
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            # Одним вызовом можно считать только запросы с одинаковыми параметрами encode
+            groups: Dict[tuple, List[tuple]] = {}
+            for item in batch:
+                groups.setdefault(tuple(sorted(item[1].items())), []).append(item)
+            for requests in groups.values():
+                texts = [text for items, _, _ in requests for text in items]
+                self.batch_size_hist.observe(len(texts))
+                try:
+                    embeddings = self.embedder.encode(texts, **requests[0][1])
+                except Exception as e:
+                    self.logger.error(f"Embedding batch error: {e}")
+                    for _, _, future in requests:
+                        future.set_exception(e)
+                    continue
+                offset = 0
+                for items, _, future in requests:
+                    future.set_result(embeddings[offset:offset + len(items)])
+                    offset += len(items)
+
+
+class ModelServer:
+    """
+    Процесс-владелец моделей для многопроцессного развёртывания.
+
+    HTTP-воркеры обращаются к нему через Unix-сокет (multiprocessing.connection),
+    поэтому LLM и модель эмбеддингов загружены в память один раз. Каждое
+    соединение обслуживается своим потоком: одновременные encode от всех воркеров
+    собираются в батчи, генерации проходят через общий планировщик (и, при
+    включённом batching, через батчер Transformers).
+
+    Запросы приходят pickle-сообщениями, поэтому без authkey сервер не запускается,
+    а сокет лежит в каталоге 0700 и сам имеет права 0600.
+    """
+
+    def __init__(
+            self,
+            llm: BaseLLM,
+            embedder: Any,
+            address: Optional[str] = None,
+            authkey: Optional[bytes] = None,
+            scheduler: Optional[LLMScheduler] = None,
+            embed_batch_size: int = 64,
+            embed_window_ms: float = 5.0
+    ):
+        if not authkey:
+            raise ModelServerError("Сервер моделей не запускается без authkey")
+        address = address or default_address()
+        self.llm = llm
+        self.embedder = embedder
+        self.address = address
+        self.authkey = authkey
+        self.scheduler = scheduler
+        self.encoder = EncodeBatcher(embedder, embed_batch_size, embed_window_ms)
+        self.logger = LoggerLoader.get_logger(__name__)
+        self._listener: Optional[Listener] = None
+        self._closed = threading.Event()
+
+    def start(self) -> None:
+        """Открыть сокет в закрытом каталоге (оставшийся от прошлого запуска файл удаляется)."""
+        ensure_private_dir(os.path.dirname(self.address))
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        # Сокет создаётся сразу с правами 0600, без окна, когда он доступен другим
+        umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        os.chmod(self.address, 0o600)
+        self.logger.info(f"Сервер моделей слушает {self.address}")
+
+    def serve_forever(self) -> None:
+        if self._listener is None:
+            self.start()
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                if self._closed.is_set():
+                    break
+                raise
+            except Exception as e:
+                if self._closed.is_set():
+                    break
+                # например, неверный authkey у клиента
+                self.logger.warning(f"Соединение отклонено: {e}")
+                continue
+            if self._closed.is_set():
+                conn.close()
+                break
+            threading.Thread(target=self._handle, args=(conn,), name="model-server-conn", daemon=True).start()
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._listener is not None:
+            # accept не просыпается от закрытия сокета в другом потоке — будим его соединением.
+            # Без рукопожатия: если цикл уже вышел, ответа на challenge никто не пришлёт
+            try:
+                with socket.socket(socket.AF_UNIX) as wake:
+                    wake.connect(self.address)
+            except OSError:
+                pass
+            self._listener.close()
+            self._listener = None
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def _handle(self, conn: Connection) -> None:
+        """Обслуживает запросы одного соединения, пока клиент его не закроет."""
+        try:
+            while True:
+                try:
+                    method, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if method == "stream_generate":
+                    if not self._stream(conn, *args, **kwargs):
+                        return
+                    continue
+                try:
+                    result = ("ok", self._call(method, *args, **kwargs))
+                except Exception as e:
+                    result = ("error", _error_payload(e))
+                conn.send(result)
+        finally:
+            conn.close()
+
+    def _call(self, method: str, *args, **kwargs) -> Any:
+        if method == "info":
+            return {
+                "context_window": self.llm.context_window,
+                "embedding_model": getattr(self.embedder, "model_name", None),
+            }
+        if method == "count_tokens":
+            return self.llm.count_tokens(*args)
+        if method == "generate":
+            slot_timeout = kwargs.pop("slot_timeout", None)
+            if self.scheduler is None:
+                return self.llm.generate(*args, **kwargs)
+            return self.scheduler.run(self.llm.generate, *args, timeout=self._slot_timeout(slot_timeout), **kwargs)
+        if method == "encode":
+            kwargs["convert_to_tensor"] = False
+            return self.encoder.encode(*args, **kwargs)
+        if method == "metrics":
+            # токены, prefill/decode и prefix-кэш считаются здесь, а /metrics отдают воркеры
+            return REGISTRY.snapshot()
+        raise ValueError(f"Unknown method: {method}")
+
+    def _slot_timeout(self, slot_timeout: Optional[float]) -> Optional[float]:
+        """Ожидание слота: не дольше queue_timeout сервера и остатка дедлайна запроса."""
+        if slot_timeout is None or self.scheduler.queue_timeout is None:
+            return slot_timeout
+        return min(slot_timeout, self.scheduler.queue_timeout)
+
+    def _stream(
+            self,
+            conn: Connection,
+            prompt: str,
+            max_length: int = 200,
+            slot_timeout: Optional[float] = None,
+            **kwargs
+    ) -> bool:
+        """
+        Потоковая генерация: куски уходят клиенту по мере готовности. Закрытый
+        клиентом сокет отменяет генерацию. False — соединение больше не годится.
+        slot_timeout — сколько запрос воркера ещё может ждать слот (остаток его дедлайна).
+        """
+        cancel = threading.Event()
+        try:
+            if self.scheduler is not None:
+                self.scheduler.acquire(timeout=self._slot_timeout(slot_timeout))
+            stream = self.llm.stream_generate(prompt, max_length=max_length, cancel_event=cancel, **kwargs)
+            try:
+                for chunk in stream:
+                    conn.send(("chunk", chunk))
+            except (EOFError, OSError):
+                cancel.set()
+                stream.close()
+                raise
+            finally:
+                if self.scheduler is not None:
+                    self.scheduler.release()
+            conn.send(("end", None))
+            return True
+        except (EOFError, OSError):
+            self.logger.info("Клиент закрыл поток, генерация остановлена")
+            return False
+        except Exception as e:
+            try:
+                conn.send(("error", _error_payload(e)))
+                return True
+            except (EOFError, OSError):
+                return False
+
+
+class ModelClient:
+    """
+    Клиент сервера моделей в HTTP-воркере: пул соединений, по одному на
+    одновременный вызов, чтобы запросы разных потоков не ждали друг друга.
+    """
+
+    def __init__(self, address: Optional[str] = None, authkey: Optional[bytes] = None, max_idle: int = 16):
+        if not authkey:
+            # ответы сервера распаковываются pickle: без аутентификации не подключаемся
+            raise ModelServerError("Не задан authkey сервера моделей")
+        self.address = address or default_address()
+        self.authkey = authkey
+        self.max_idle = max_idle
+        self._idle: List[Connection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> Connection:
+        # сокет в чужом или общем каталоге мог подменить другой пользователь
+        ensure_private_dir(os.path.dirname(self.address))
+        try:
+            return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        except AuthenticationError as e:
+            raise ModelServerError(f"Сервер моделей отклонил ключ ({self.address}): {e}")
+        except (OSError, EOFError) as e:
+            raise ModelServerError(f"Сервер моделей недоступен ({self.address}): {e}")
+
+    def _checkout(self) -> Tuple[Connection, bool]:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _checkin(self, conn: Connection) -> None:
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        """Один запрос — один ответ. Соединение из пула, оборванное рестартом сервера, заменяется."""
+        while True:
+            conn, reused = self._checkout()
+            try:
+                conn.send((method, args, kwargs))
+                status, payload = conn.recv()
+                break
+            except (EOFError, OSError) as e:
+                conn.close()
+                if not reused:
+                    raise ModelServerError(f"Соединение с сервером моделей потеряно: {e}")
+        self._checkin(conn)
+        if status == "error":
+            raise _rebuild_error(payload)
+        return payload
+
+    def stream(self, method: str, *args, **kwargs) -> Iterator[Any]:
+        """Куски ответа по мере генерации; брошенный генератор закрывает соединение и отменяет генерацию."""
+        conn = self._connect()
+        finished = False
+        try:
+            conn.send((method, args, kwargs))
+            while True:
+                try:
+                    status, payload = conn.recv()
+                except (EOFError, OSError) as e:
+                    raise ModelServerError(f"Соединение с сервером моделей потеряно: {e}")
+                if status == "chunk":
+                    yield payload
+                    continue
+                finished = True
+                if status == "error":
+                    raise _rebuild_error(payload)
+                return
+        finally:
+            if finished:
+                self._checkin(conn)
+            else:
+                conn.close()
+
+    def metrics(self) -> List[Family]:
+        """Снимок реестра метрик сервера моделей: токены, prefill/decode, prefix-кэш."""
+        return self.call("metrics")
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class RemoteLLM(BaseLLM):
+    """
+    BaseLLM, генерация которого выполняется в процессе сервера моделей.
+
+    generate и stream_generate дополнительно принимают slot_deadline (time.monotonic()
+    этого процесса): остаток до него уходит серверу, и запрос ждёт слот в его
+    планировщике не дольше своего дедлайна.
+    """
+
+    forwards_slot_deadline = True
+
+    def __init__(self, client: ModelClient):
+        self.client = client
+        self.logger = LoggerLoader.get_logger(__name__)
+        self.context_window = client.call("info")["context_window"]
+
+    def count_tokens(self, text: str) -> int:
+        return self.client.call("count_tokens", text)
+
+    @staticmethod
+    def _decoding_kwargs(
+            stop: Optional[List[str]],
+            temperature: Optional[float],
+            slot_deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        # Передаём только заданные параметры: остальное — по умолчанию бэкенда на сервере
+        kwargs: Dict[str, Any] = {}
+        if stop:
+            kwargs["stop"] = list(stop)
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        if slot_deadline is not None:
+            # часы процессов не сравниваем: передаём оставшиеся секунды
+            kwargs["slot_timeout"] = max(0.0, slot_deadline - time.monotonic())
+        return kwargs
+
+    def generate(
+            self,
+            prompt: str,
+            max_length: int = 200,
+            stop: Optional[List[str]] = None,
+            temperature: Optional[float] = None,
+            slot_deadline: Optional[float] = None
+    ) -> str:
+        return self.client.call(
+            "generate", prompt, max_length=max_length, **self._decoding_kwargs(stop, temperature, slot_deadline)
+        )
+
+    def stream_generate(
+            self,
+            prompt: str,
+            max_length: int = 200,
+            cancel_event: Optional[threading.Event] = None,
+            stop: Optional[List[str]] = None,
+            temperature: Optional[float] = None,
+            slot_deadline: Optional[float] = None
+    ):
+        stream = self.client.stream(
+            "stream_generate", prompt, max_length=max_length,
+            **self._decoding_kwargs(stop, temperature, slot_deadline)
+        )
+        try:
+            for chunk in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                yield chunk
+        finally:
+            stream.close()
+
+    # warm_prefix не переопределяется: префикс прогревает сам сервер при загрузке модели
+
+
+class RemoteEmbedder(SentenceEmbedder):
+    """
+    Модель эмбеддингов из сервера моделей с тем же интерфейсом, что у SentenceEmbedder
+    (Embedder и Embeddings LangChain). Векторы возвращаются как numpy-массивы.
+    """
+
+    def __init__(self, client: ModelClient, model_name: str, normalize_embeddings: bool = False):
+        super().__init__(model_name, normalize_embeddings=normalize_embeddings)
+        self.client = client
+
+    @property
+    def model(self):
+        raise AttributeError("Веса модели эмбеддингов находятся в процессе сервера моделей")
+
+    def encode(self, texts: Union[str, List[str]], *, convert_to_tensor: bool = False, **kwargs):
+        kwargs.setdefault("normalize_embeddings", self.normalize_embeddings)
+        embeddings = self.client.call("encode", texts, **kwargs)
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(embeddings)
+        return embeddings
+
+
+def main() -> None:
+    """Запуск сервера моделей по секции model_server конфига."""
+    from src.answer_generator.model_registry import ModelRegistry
+    from src.utils.config_loader import ConfigLoader
+
+    logger = LoggerLoader.get_logger(__name__)
+    config = ConfigLoader.get_config()
+    LoggerLoader.configure(config)
+    instrumentation.configure(config)
+    ResourcePlan.from_config(config).apply_blas()
+    server_cfg = config.get("model_server", {})
+    registry = ModelRegistry.get_registry()
+
+    address = server_address(server_cfg)
+    ensure_private_dir(os.path.dirname(address))
+    authkey = server_authkey(server_cfg, address)
+    if authkey is None:
+        # Воркеры того же пользователя читают ключ из файла рядом с сокетом
+        authkey = create_authkey(address)
+        logger.info(f"Ключ сервера моделей записан в {authkey_path(address)}")
+
+    llm = registry.create_local_llm(config)
+    embedder = registry.create_local_embedder(config.get("embedding_model"))
+    server = ModelServer(
+        llm,
+        embedder,
+        address=address,
+        authkey=authkey,
+        scheduler=registry.get_scheduler(config),
+        embed_batch_size=server_cfg.get("embed_batch_size", 64),
+        embed_window_ms=server_cfg.get("embed_window_ms", 5),
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Сервер моделей остановлен")
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,63 @@
+import asyncio
+import logging
+import threading
 import time
-from sentence_transformers import SentenceTransformer
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
 from src.core.abstractions.embeddings import Embedder
 from src.utils.db_connector import DBConnector
-from src.utils.logger_loader import LoggerLoader
+from src.utils.async_db_connector import AsyncDBConnector
+from src.utils.logger_loader import LoggerLoader, bind_request_id
 from src.data_processing.subtitle_extractor import SubtitleExtractor
 from src.data_processing.subtitle_manager import SubtitleManager
 from src.utils.config_loader import ConfigLoader
-from src.utils.prompt_loader import PromptLoader
-from src.answer_generator.model_factory import model_factory
+from src.answer_generator.model_registry import ModelRegistry
+from src.answer_generator.scheduler import QueueTimeoutError, SchedulerRejected
+from src.answer_generator.deadline import Deadline, DeadlinePolicy
+from src.answer_generator.generation import AnswerLengthPolicy, GenerationParams
+from src.answer_generator.answer_cache import AnswerCache, config_hash
 from src.reranker.reranker import Reranker
+from src.reranker.cascade import CascadePolicy
+from src.reranker.tokenizer import TOKENIZER
+from src.reranker.diversity import mmr_select
 from src.core.adapters.db_vector_store import DBVectorStore
+from src.answer_generator.context_builder import ContextBuilder
+from src.utils import instrumentation
+from src.utils.metrics import REGISTRY
+from src.utils.resources import ResourcePlan
+
+
+@dataclass
+class PreparedQuery:
+    """
+    Result of the pre-generation stages for one request.
+    Either prompt is set, or the request short-circuits with answer / error.
+    """
+    video_id: Optional[str] = None
+    prompt: Optional[str] = None
+    chunks: List[Dict[str, Any]] = field(default_factory=list)
+    prompt_tokens: int = 0
+    context_tokens: int = 0
+    answer: Optional[str] = None
+    error: Optional[str] = None
+
+    def metadata(self) -> Dict[str, Any]:
+        """Selected chunks with timestamps, JSON-serializable."""
+        return {
+            "video_id": self.video_id,
+            "prompt_tokens": self.prompt_tokens,
+            "chunks": [
+                {
+                    "text": c["page_content"],
+                    "start_time": c.get("start_time"),
+                    "end_time": c.get("end_time"),
+                    "score": float(c["score"]) if c.get("score") is not None else None,
+                }
+                for c in self.chunks
+            ],
+        }
 
 
 class RAGModel:
@@ -20,127 +68,883 @@ class RAGModel:
 
     def __init__(self, db_connector: DBConnector):
         self.db = db_connector
-        self.logger = LoggerLoader.get_logger()
+        self.logger = LoggerLoader.get_logger(__name__)
 
         # Configuration
         self.config = ConfigLoader.get_config()
+        instrumentation.configure(self.config)
         self.language = self.config.get("language", "ru")
         self.use_langchain = self.config.get("use_langchain", False)
         self.use_reranker = self.config.get("reranker", {}).get("use_reranker", False)
+        # Token ids for lexical features (stored at ingestion too) must match the reranker model
+        TOKENIZER.set_mode(self.config.get("reranker", {}).get("tokenizer", "legacy"))
 
-        # Embedding model
+        # Embedding model: one shared instance per process (also used by LangChain)
         embed_name = self.config.get("embedding_model")
-        self.embedding_model: Embedder = SentenceTransformer(embed_name)
+        self.embedding_model: Embedder = ModelRegistry.get_registry().get_embedder(embed_name)
+
+        # One generation queue per model instance, shared by all request paths
+        self.scheduler = ModelRegistry.get_registry().get_scheduler(self.config)
+        # Per-request time budget and how stages degrade when it runs short
+        self.deadline_policy = DeadlinePolicy.from_config(self.config.get("deadline", {}))
+
+        # Decoding parameters for this language/model; requests may override them
+        self.generation = GenerationParams.from_config(self.config, self.language)
+        self.answer_length = AnswerLengthPolicy.from_config(
+            self.config.get("generation", {}).get("adaptive", {})
+        )
 
         # Components
         self.subtitle_extractor = SubtitleExtractor()
         self.subtitle_manager = SubtitleManager(db_pool=self.db, embedding_model=self.embedding_model)
 
+        # Retrieval and reranking (also used by the retrieval-only search)
+        self.vectorstore = DBVectorStore(
+            db_connector=self.db,
+            embedding_model=self.embedding_model
+        )
+
+        # Reranker setup
+        self.retriever_top_k = self.config.get("retriever", {}).get("top_k", 5)
+        if self.use_reranker:
+            rer_cfg = self.config.get("reranker", {})
+            self.reranker = Reranker(
+                rer_cfg.get("model_path"),
+                model_type=rer_cfg.get("model_type", "logreg"),
+                cross_encoder_config=rer_cfg.get("cross_encoder"),
+                cores=ResourcePlan.from_config(self.config).reranker.cores
+            )
+            self.reranker_top_k = rer_cfg.get("top_k", 5)
+            cascade_cfg = rer_cfg.get("cascade", {})
+            self.cascade = CascadePolicy(
+                margin_threshold=cascade_cfg.get("margin_threshold", 0.1),
+                min_candidates=cascade_cfg.get("min_candidates", self.reranker_top_k),
+                dispersion_ref=cascade_cfg.get("dispersion_ref", 0.05),
+                enabled=cascade_cfg.get("enabled", False)
+            )
+
         if self.use_langchain:
-            from langchain_community.embeddings import HuggingFaceEmbeddings
-            self.embed_model = HuggingFaceEmbeddings(model_name=embed_name)
             from src.integrations.langchain_integration import LangChainRAG
             self.chain = LangChainRAG(self.db, self.config)
         else:
-            # LLM and prompt
-            self.llm = model_factory(self.config)
-            self.prompt_template = PromptLoader().load(self.language)
-
-            # Embedding model for retrieval and reranking
-            self.vectorstore = DBVectorStore(
-                db_connector=self.db,
-                embedding_model=self.embedding_model
+            # LLM and prompt are process-wide, shared with the LangChain integration
+            registry = ModelRegistry.get_registry()
+            self.llm = registry.get_llm(self.config)
+            self.prompt_template = registry.get_prompt(self.language)
+
+            # Context selection: MMR over candidates, then packing into a token budget
+            ctx_cfg = self.config.get("context", {})
+            self.mmr_lambda = ctx_cfg.get("mmr_lambda", 1.0)
+            self.dedup_threshold = ctx_cfg.get("dedup_threshold")
+            self.context_max_tokens = ctx_cfg.get("max_tokens")
+            # Answer length reserved in the context window
+            self.max_new_tokens = self.generation.max_tokens
+            self.context_builder = ContextBuilder(self.llm.count_tokens)
+            self.prompt_tokens_hist = REGISTRY.histogram(
+                "rag_prompt_tokens", "Prompt size in LLM tokens",
+                buckets=(256, 512, 1024, 2048, 4096, 8192)
             )
 
-            # Reranker setup
-            self.retriever_top_k = self.config.get("retriever", {}).get("top_k", 5)
-            if self.use_reranker:
-                rer_cfg = self.config.get("reranker", {})
-                self.reranker = Reranker(rer_cfg.get("model_path"))
-                self.reranker_top_k = rer_cfg.get("top_k", 5)
+        # Answer cache in front of the pipeline (exact + semantic, per video)
+        cache_cfg = self.config.get("answer_cache", {})
+        self.answer_cache: Optional[AnswerCache] = None
+        if cache_cfg.get("enabled", False):
+            self.answer_cache = AnswerCache(
+                config_hash(self.config, ModelRegistry.get_registry().get_prompt(self.language)),
+                maxsize=cache_cfg.get("maxsize", 1024),
+                ttl=cache_cfg.get("ttl", 3600),
+                semantic_threshold=cache_cfg.get("semantic_threshold", 0.95),
+                store=self.db if cache_cfg.get("persistent", False) else None
+            )
+
+        # Async path: DB reads are awaited on an asyncpg pool (attached by the API),
+        # CPU-bound work and generation run on dedicated executors
+        async_cfg = self.config.get("async_api", {})
+        self.async_db: Optional[AsyncDBConnector] = None
+        self.cpu_executor = ThreadPoolExecutor(
+            max_workers=async_cfg.get("cpu_workers", 4), thread_name_prefix="rag-cpu"
+        )
+        # Enough threads for every slot and queue place, so the scheduler (not the executor) queues
+        self.llm_executor = ThreadPoolExecutor(
+            max_workers=self.scheduler.slots + self.scheduler.max_queue, thread_name_prefix="rag-llm"
+        )
 
         self.logger.info(
             f"Initialized RAGModel | langchain={self.use_langchain} | reranker={self.use_reranker}"
         )
 
+    def attach_async_db(self, async_db: Optional[AsyncDBConnector]) -> None:
+        """Use an async connector for DB reads in aprocess_query / asearch."""
+        self.async_db = async_db
+
+    def close(self) -> None:
+        """Stop the executors of the async path."""
+        self.cpu_executor.shutdown(wait=False)
+        self.llm_executor.shutdown(wait=False)
+
+    def warmup(self, query: str = "warmup") -> Dict[str, float]:
+        """
+        Run one tiny request through each model (embedder, reranker, LLM) so lazy
+        initialization and first-call costs are paid before traffic arrives.
+        Returns per-model warmup time in seconds.
+        """
+        timings = {}
+
+        start = time.perf_counter()
+        q_emb = self._encode_query(query)
+        timings["embedder"] = time.perf_counter() - start
+
+        if self.use_reranker:
+            start = time.perf_counter()
+            self.reranker.score(
+                q_emb, [q_emb], TOKENIZER.encode(query), [TOKENIZER.encode(query)],
+                [query], query_text=query
+            )
+            timings["reranker"] = time.perf_counter() - start
+
+        llm = self.chain.llm if self.use_langchain else self.llm
+        start = time.perf_counter()
+        llm.generate(query, max_length=1)
+        timings["llm"] = time.perf_counter() - start
+
+        self.logger.info(
+            "Warmup done | " + " | ".join(f"{name}={sec:.2f}s" for name, sec in timings.items())
+        )
+        return timings
+
     def _ensure_subtitles(self, video_id: str) -> None:
         """
         Ensure subtitles for given video_id exist in DB; extract and store if missing.
         Raises ValueError if subtitles cannot be obtained.
         """
-        if not self.db.fetch_subtitles(video_id):
+        with instrumentation.span("presence_check"):
+            present = self.db.fetch_subtitles(video_id)
+        if not present:
             self.logger.info(f"Subtitles missing for {video_id}, extracting...")
             extracted = self.subtitle_extractor.get_subtitles(video_id)
             if not extracted:
                 raise ValueError("Subtitles not found")
-            self.subtitle_manager.add_subtitles(video_id, extracted)
+            with instrumentation.span("ingest"):
+                self.subtitle_manager.add_subtitles(video_id, extracted)
             self.logger.info(f"Subtitles extracted and stored for {video_id}")
+            # answers cached for the previous ingestion of this video are stale
+            if self.answer_cache is not None:
+                self.answer_cache.invalidate(video_id)
 
-    def process_query(self, video_url: str, query: str) -> str:
+    def process_query(
+        self,
+        video_url: str,
+        query: str,
+        deadline: Optional[Deadline] = None,
+        generation: Optional[GenerationParams] = None
+    ) -> str:
         """
         Handle full RAG pipeline: extract subtitles, retrieve, rerank, generate.
+        With a deadline, stages degrade when the budget runs short (see DeadlinePolicy);
+        the cut stages are recorded in deadline.reasons and such answers are not cached.
+        generation overrides the configured decoding parameters; such requests bypass
+        the answer cache.
+        """
+        deadline = deadline or Deadline()
+        try:
+            video_id = self.subtitle_extractor.extract_video_id(video_url)
+            q_emb = None
+            if self.answer_cache is not None and video_id and generation is None:
+                q_emb = self._encode_query(query)
+                with instrumentation.span("answer_cache"):
+                    cached = self.answer_cache.get(video_id, query, q_emb)
+                if cached is not None:
+                    return cached
+
+            prepared = self.prepare_query(video_url, query, query_embedding=q_emb, deadline=deadline)
+            if prepared.error is not None:
+                return prepared.error
+            if prepared.answer is not None:
+                # LangChain answers are generated; "nothing found" is not worth caching
+                if self.use_langchain:
+                    self._cache_answer(prepared.video_id, query, prepared.answer, q_emb)
+                return prepared.answer
+            params = self._generation_params(query, prepared, generation)
+            answer = self._answer_prepared(prepared, deadline, params)
+            if not deadline.degraded and generation is None:
+                self._cache_answer(prepared.video_id, query, answer, q_emb)
+            return answer
+
+        except SchedulerRejected:
+            # overload is reported to the caller (429/503), not as a generic failure
+            raise
+        except Exception as e:
+            self.logger.error(f"process_query error: {e}")
+            return "Ошибка: не удалось обработать запрос."
+
+    async def aprocess_query(
+        self,
+        video_url: str,
+        query: str,
+        deadline: Optional[Deadline] = None,
+        generation: Optional[GenerationParams] = None
+    ) -> str:
         """
+        Async variant of process_query: DB reads are awaited, embedding / rerank /
+        prompt building run on cpu_executor and generation on llm_executor.
+        """
+        deadline = deadline or Deadline()
         try:
-            # Step 1: extract video ID
+            if self.use_langchain or self.async_db is None:
+                return await self._in_executor(
+                    self.llm_executor, self.process_query, video_url, query, deadline, generation
+                )
+
             video_id = self.subtitle_extractor.extract_video_id(video_url)
             if not video_id:
                 self.logger.error(f"Invalid video URL: {video_url}")
                 return "Ошибка: некорректный URL видео."
+            q_emb = await self._in_executor(self.cpu_executor, self._encode_query, query)
+            if self.answer_cache is not None and generation is None:
+                with instrumentation.span("answer_cache"):
+                    cached = self.answer_cache.get(video_id, query, q_emb)
+                if cached is not None:
+                    return cached
 
-            # Step 2: ensure subtitles
-            try:
-                self._ensure_subtitles(video_id)
-            except ValueError:
-                return "Ошибка: субтитры не найдены."
+            prepared = await self._aprepare(video_id, query, q_emb, deadline)
+            if prepared.error is not None:
+                return prepared.error
+            if prepared.answer is not None:
+                return prepared.answer
+            params = self._generation_params(query, prepared, generation)
+            answer = await self._in_executor(self.llm_executor, self._answer_prepared, prepared, deadline, params)
+            if not deadline.degraded and generation is None:
+                self._cache_answer(video_id, query, answer, q_emb)
+            return answer
 
-            # Step 3: choose pipeline
-            if self.use_langchain:
-                return self.chain.invoke(query)
+        except SchedulerRejected:
+            raise
+        except Exception as e:
+            self.logger.error(f"aprocess_query error: {e}")
+            return "Ошибка: не удалось обработать запрос."
 
-            # Step 4: retrieve candidates
-            docs = self.vectorstore.search(query, k=self.retriever_top_k)
-            self.logger.info(f"Retrieved {len(docs)} candidates")
-            if not docs:
-                return "По запросу не найдено похожих субтитров."
-            texts = [d["page_content"] for d in docs]
-
-            # Step 5: optional rerank
-            if self.use_reranker:
-                q_emb = self.embedding_model.encode(query, convert_to_tensor=False)
-                if hasattr(q_emb, 'cpu'):
-                    q_emb = q_emb.cpu().numpy()
-                d_embs = self.embedding_model.encode(texts, convert_to_tensor=False)
-                if hasattr(d_embs, 'cpu'):
-                    d_embs = d_embs.cpu().numpy()
-                reranked = self.reranker.rerank(
-                    q_emb,
-                    list(d_embs),
-                    query.lower().split(),
-                    [t.lower().split() for t in texts],
-                    texts
-                )
-                selected = [t for t, _ in reranked[: self.reranker_top_k]]
+    async def asearch(self, video_url: str, query: str, top_k: Optional[int] = None) -> Dict[str, Any]:
+        """Async variant of search (same result format)."""
+        if self.async_db is None:
+            return await self._in_executor(self.cpu_executor, self.search, video_url, query, top_k)
+        video_id = self.subtitle_extractor.extract_video_id(video_url)
+        if not video_id:
+            return {"video_id": None, "error": "Ошибка: некорректный URL видео."}
+        try:
+            await self._aensure_subtitles(video_id)
+        except ValueError:
+            return {"video_id": video_id, "error": "Ошибка: субтитры не найдены."}
+        q_emb = await self._in_executor(self.cpu_executor, self._encode_query, query)
+        docs, relevance = await self._aretrieve(video_id, query, q_emb)
+        return self._search_result(video_id, docs, relevance, top_k)
+
+    async def _aprepare(
+        self,
+        video_id: str,
+        query: str,
+        q_emb: np.ndarray,
+        deadline: Optional[Deadline] = None
+    ) -> PreparedQuery:
+        try:
+            await self._aensure_subtitles(video_id)
+        except ValueError:
+            return PreparedQuery(video_id=video_id, error="Ошибка: субтитры не найдены.")
+        docs, relevance = await self._aretrieve(video_id, query, q_emb, deadline)
+        return await self._in_executor(self.cpu_executor, self._build_prompt, video_id, query, docs, relevance)
+
+    async def _aensure_subtitles(self, video_id: str) -> None:
+        # The presence check is awaited; ingestion (network + embedding) stays synchronous
+        with instrumentation.span("presence_check"):
+            present = await self.async_db.has_subtitles(video_id)
+        if not present:
+            await self._in_executor(self.cpu_executor, self._ensure_subtitles, video_id)
+
+    async def _aretrieve(
+        self,
+        video_id: str,
+        query: str,
+        q_emb: np.ndarray,
+        deadline: Optional[Deadline] = None
+    ):
+        with instrumentation.span("db_search"):
+            rows = await self.async_db.search_similar_embeddings(
+                q_emb.tolist(), top_k=self._retrieval_k(deadline), video_id=video_id
+            )
+        docs = [DBVectorStore.wrap_row(row) for row in rows]
+        self.logger.debug(f"Retrieved {len(docs)} candidates")
+        return await self._in_executor(
+            self.cpu_executor, lambda: self._rerank_many([(query, q_emb, docs)], deadline)[0]
+        )
+
+    @staticmethod
+    async def _in_executor(executor: ThreadPoolExecutor, fn, *args):
+        # run_in_executor не переносит contextvars — request id для логов передаём явно
+        return await asyncio.get_running_loop().run_in_executor(executor, bind_request_id(fn), *args)
+
+    def _encode_query(self, query: str) -> np.ndarray:
+        with instrumentation.span("embedding"):
+            return self._to_numpy(self.embedding_model.encode(query, convert_to_tensor=False))
+
+    def process_batch(self, video_url: str, queries: List[str]) -> Dict[str, Any]:
+        """
+        Answer many questions about one video in one call.
+
+        The video is checked once, all queries are embedded in one encode call and
+        retrieved in one SQL statement, candidates of all queries are reranked
+        together, and generations go through the LLM scheduler concurrently
+        (up to its number of slots). Returns {"video_id", "results": [...]} with
+        one {"query", "answer" | "error" (+ "status")} item per query, in order,
+        or {"video_id", "error"} if the video itself cannot be processed.
+        """
+        video_id = self.subtitle_extractor.extract_video_id(video_url)
+        if not video_id:
+            return {"video_id": None, "error": "Ошибка: некорректный URL видео."}
+        try:
+            self._ensure_subtitles(video_id)
+        except ValueError:
+            return {"video_id": video_id, "error": "Ошибка: субтитры не найдены."}
+
+        # LangChain retrieves on its own: queries are embedded only for the answer cache
+        q_embs = None
+        if not self.use_langchain or self.answer_cache is not None:
+            with instrumentation.span("embedding"):
+                q_embs = self._to_numpy(self.embedding_model.encode(list(queries), convert_to_tensor=False))
+            q_embs = q_embs.reshape(len(queries), -1)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+
+        # Answer cache first; only misses go to retrieval
+        todo = []
+        for i, query in enumerate(queries):
+            cached = self.answer_cache.get(video_id, query, q_embs[i]) if self.answer_cache else None
+            if cached is not None:
+                results[i] = {"query": query, "answer": cached}
             else:
-                selected = texts[: self.retriever_top_k]
+                todo.append(i)
+
+        if self.use_langchain:
+            for i in todo:
+                results[i] = self._batch_item(
+                    queries[i], lambda q=queries[i]: self._invoke_chain(q),
+                    video_id, None if q_embs is None else q_embs[i]
+                )
+        elif todo:
+            with instrumentation.span("db_search"):
+                found = self.vectorstore.search_by_vectors(
+                    [q_embs[i] for i in todo], k=self.retriever_top_k, video_id=video_id
+                )
+            ranked = self._rerank_many([(queries[i], q_embs[i], docs) for i, docs in zip(todo, found)])
+            prepared = {}
+            for i, (docs, relevance) in zip(todo, ranked):
+                try:
+                    prepared[i] = self._build_prompt(video_id, queries[i], docs, relevance)
+                except Exception as e:
+                    self.logger.error(f"process_batch prompt error: {e}")
+                    results[i] = {"query": queries[i], "error": "Ошибка: не удалось обработать запрос."}
+
+            def answer(i: int) -> Dict[str, Any]:
+                item = prepared[i]
+                if item.answer is not None:
+                    return {"query": queries[i], "answer": item.answer}
+                params = self._generation_params(queries[i], item)
+                return self._batch_item(
+                    queries[i], lambda: self._generate_answer(item.prompt, params=params), video_id, q_embs[i]
+                )
 
-            snippets_str = "\n".join(f"\t{i}.\t{snippet}" for i, snippet in enumerate(selected, 1))
-            self.logger.info(f"Selected {len(selected)} snippets for context:\n{snippets_str}")
+            # Requests beyond the scheduler's slots wait in its queue as usual
+            pending = list(prepared)
+            with ThreadPoolExecutor(max_workers=self.scheduler.slots) as pool:
+                for i, item in zip(pending, pool.map(bind_request_id(answer), pending)):
+                    results[i] = item
 
-            # Step 6: generate answer
-            context = "\n".join(selected)
-            prompt = self.prompt_template.format(query=query, context=context)
-            return self._generate_answer(prompt)
+        return {"video_id": video_id, "results": results}
 
+    def _batch_item(
+        self,
+        query: str,
+        produce,
+        video_id: Optional[str] = None,
+        q_emb: Optional[np.ndarray] = None
+    ) -> Dict[str, Any]:
+        """One batch result; failures are reported per item instead of failing the batch."""
+        try:
+            answer = produce()
+        except SchedulerRejected as e:
+            return {"query": query, "error": str(e), "status": e.status_code}
         except Exception as e:
-            self.logger.error(f"process_query error: {e}")
-            return "Ошибка: не удалось обработать запрос."
+            self.logger.error(f"process_batch item error: {e}")
+            return {"query": query, "error": "Ошибка: не удалось обработать запрос."}
+        if video_id is not None:
+            self._cache_answer(video_id, query, answer, q_emb)
+        return {"query": query, "answer": answer}
+
+    def stream_query(
+        self,
+        video_url: str,
+        query: str,
+        cancel_event: Optional[threading.Event] = None,
+        generation: Optional[GenerationParams] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of process_query. Yields events:
+          {"event": "metadata", "data": {"video_id", "chunks", "prompt_tokens"}} - first
+          {"event": "token", "data": {"text"}}                                   - per piece
+          {"event": "done", "data": {timing and token stats, degraded info}}     - last
+          {"event": "error", "data": {"message"[, "status"]}}                    - on failure
+        "status" is set (429/503) when the request was shed by the LLM scheduler.
+        Generation stops without a "done" event once cancel_event is set.
+        With a deadline, stages degrade as in process_query and decoding stops at it.
+        Closing the generator closes the LLM stream before the scheduler slot is released.
+        """
+        deadline = deadline or Deadline()
+        start = time.perf_counter()
+        try:
+            prepared = self.prepare_query(video_url, query, deadline=deadline)
+        except SchedulerRejected as e:
+            yield {"event": "error", "data": {"message": str(e), "status": e.status_code}}
+            return
+        except Exception as e:
+            self.logger.error(f"stream_query error: {e}")
+            yield {"event": "error", "data": {"message": "Ошибка: не удалось обработать запрос."}}
+            return
+        if prepared.error is not None:
+            yield {"event": "error", "data": {"message": prepared.error}}
+            return
+
+        retrieval_seconds = time.perf_counter() - start
+        yield {"event": "metadata", "data": prepared.metadata()}
+
+        if prepared.answer is not None:
+            yield {"event": "token", "data": {"text": prepared.answer}}
+            yield {"event": "done", "data": {"retrieval_seconds": round(retrieval_seconds, 3)}}
+            return
+        if not self.deadline_policy.allow_generation(deadline):
+            yield from self._stream_retrieval_only(prepared, deadline, retrieval_seconds)
+            return
+
+        params = self._generation_params(query, prepared, generation)
+        slot_deadline = self.deadline_policy.slot_deadline(deadline)
+        if slot_deadline is not None and self.scheduler.queue_timeout is not None:
+            slot_deadline = min(slot_deadline, time.monotonic() + self.scheduler.queue_timeout)
+        try:
+            self.scheduler.acquire(deadline=slot_deadline)
+        except QueueTimeoutError as e:
+            # the wait ended at the deadline: answer with chunks, as process_query does
+            if not self.deadline_policy.allow_generation(deadline):
+                yield from self._stream_retrieval_only(prepared, deadline, retrieval_seconds)
+                return
+            yield {"event": "error", "data": {"message": str(e), "status": e.status_code}}
+            return
+        except SchedulerRejected as e:
+            yield {"event": "error", "data": {"message": str(e), "status": e.status_code}}
+            return
+
+        first_token_at = None
+        parts: List[str] = []
+        gen_start = time.perf_counter()
+        stream = None
+        try:
+            max_length = self.deadline_policy.max_tokens(deadline, params.max_tokens)
+            stream = self.llm.stream_generate(
+                prepared.prompt, max_length=max_length, cancel_event=cancel_event,
+                **self._llm_kwargs(params, deadline)
+            )
+            for piece in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                if piece:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    parts.append(piece)
+                    yield {"event": "token", "data": {"text": piece}}
+                if deadline.expired():
+                    deadline.degrade("generation_cut")
+                    break
+        except Exception as e:
+            self.logger.error(f"stream_query generation error: {e}")
+            yield {"event": "error", "data": {"message": "Ошибка: не удалось сгенерировать ответ."}}
+            return
+        finally:
+            # also runs when the consumer closes this generator (client disconnect):
+            # the backend (llama.cpp lock, HF worker) is released before the slot
+            if stream is not None:
+                stream.close()
+            self.scheduler.release()
+
+        if cancel_event is not None and cancel_event.is_set():
+            self.logger.info(f"Stream cancelled by client after {len(parts)} pieces")
+            return
+
+        generation_seconds = time.perf_counter() - gen_start
+        completion_tokens = self.llm.count_tokens("".join(parts))
+        self.logger.info(f"Answer streamed in {generation_seconds:.2f}s")
+        yield {"event": "done", "data": {
+            "prompt_tokens": prepared.prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "retrieval_seconds": round(retrieval_seconds, 3),
+            "time_to_first_token": round(first_token_at - start, 3) if first_token_at else None,
+            "generation_seconds": round(generation_seconds, 3),
+            "tokens_per_second": round(completion_tokens / generation_seconds, 2) if generation_seconds > 0 else None,
+            "degraded": deadline.degraded,
+            "degraded_reasons": deadline.reasons or None,
+        }}
+
+    def _stream_retrieval_only(
+        self, prepared: PreparedQuery, deadline: Deadline, retrieval_seconds: float
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream events of an answer degraded to the best chunks."""
+        yield {"event": "token", "data": {"text": self._retrieval_only_answer(prepared)}}
+        yield {"event": "done", "data": {
+            "retrieval_seconds": round(retrieval_seconds, 3),
+            "degraded": True,
+            "degraded_reasons": deadline.reasons,
+        }}
+
+    def search(self, video_url: str, query: str, top_k: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Retrieval only, no generation: subtitles -> vector search -> optional rerank.
+        Returns {"video_id", "chunks": [{text, start_time, end_time, score, url}]},
+        best first, or {"video_id", "error"} when the video cannot be searched.
+        """
+        video_id = self.subtitle_extractor.extract_video_id(video_url)
+        if not video_id:
+            return {"video_id": None, "error": "Ошибка: некорректный URL видео."}
+        try:
+            self._ensure_subtitles(video_id)
+        except ValueError:
+            return {"video_id": video_id, "error": "Ошибка: субтитры не найдены."}
+
+        q_emb = self._encode_query(query)
+        docs, relevance = self._retrieve(video_id, query, q_emb)
+        return self._search_result(video_id, docs, relevance, top_k)
+
+    def _search_result(
+        self,
+        video_id: str,
+        docs: List[Dict[str, Any]],
+        relevance: List[float],
+        top_k: Optional[int]
+    ) -> Dict[str, Any]:
+        order = sorted(range(len(docs)), key=lambda i: relevance[i], reverse=True)
+        if top_k is None:
+            top_k = self.reranker_top_k if self.use_reranker else self.retriever_top_k
+        chunks = []
+        for i in order[:top_k]:
+            doc = docs[i]
+            chunks.append({
+                "text": doc["page_content"],
+                "start_time": doc.get("start_time"),
+                "end_time": doc.get("end_time"),
+                "score": float(relevance[i]),
+                "url": self.subtitle_extractor.video_url(video_id, doc.get("start_time")),
+            })
+        return {"video_id": video_id, "chunks": chunks}
+
+    def prepare_query(
+        self,
+        video_url: str,
+        query: str,
+        query_embedding: Optional[np.ndarray] = None,
+        deadline: Optional[Deadline] = None
+    ) -> PreparedQuery:
+        """
+        Everything before generation: subtitles, retrieval, rerank, context, prompt.
+        query_embedding may be passed when the caller has already encoded the query.
+        """
+        # Step 1: extract video ID
+        video_id = self.subtitle_extractor.extract_video_id(video_url)
+        if not video_id:
+            self.logger.error(f"Invalid video URL: {video_url}")
+            return PreparedQuery(error="Ошибка: некорректный URL видео.")
+
+        # Step 2: ensure subtitles
+        try:
+            self._ensure_subtitles(video_id)
+        except ValueError:
+            return PreparedQuery(video_id=video_id, error="Ошибка: субтитры не найдены.")
+
+        # Step 3: choose pipeline
+        if self.use_langchain:
+            return PreparedQuery(video_id=video_id, answer=self._invoke_chain(query))
+
+        # Step 4-5: retrieve candidates of this video and optionally rerank them
+        q_emb = query_embedding
+        if q_emb is None:
+            q_emb = self._encode_query(query)
+        docs, relevance = self._retrieve(video_id, query, q_emb, deadline)
+        return self._build_prompt(video_id, query, docs, relevance)
+
+    def _invoke_chain(self, query: str) -> str:
+        """LangChain answer (retrieval and generation) in a scheduler slot."""
+        with self.scheduler.slot(), instrumentation.span("langchain"):
+            return self.chain.invoke(query)
+
+    def _build_prompt(
+        self,
+        video_id: str,
+        query: str,
+        docs: List[Dict[str, Any]],
+        relevance: List[float]
+    ) -> PreparedQuery:
+        """
+        Steps after retrieval: diverse selection, packing into the token budget, prompt.
+        """
+        with instrumentation.span("prompt_build"):
+            return self._select_and_format(video_id, query, docs, relevance)
+
+    def _select_and_format(
+        self,
+        video_id: str,
+        query: str,
+        docs: List[Dict[str, Any]],
+        relevance: List[float]
+    ) -> PreparedQuery:
+        if not docs:
+            return PreparedQuery(video_id=video_id, answer="По запросу не найдено похожих субтитров.")
+        select_k = self.reranker_top_k if self.use_reranker else self.retriever_top_k
+
+        # Step 6: diverse selection (MMR) so overlapping windows don't repeat in the prompt
+        picked = mmr_select(
+            self._doc_embeddings(docs),
+            relevance,
+            k=select_k,
+            lambda_=self.mmr_lambda,
+            dedup_threshold=self.dedup_threshold
+        )
+        selected = [dict(docs[i], score=float(relevance[i])) for i in picked]
 
-    def _generate_answer(self, prompt: str) -> str:
+        # Step 7: pack selected windows into the token budget
+        built = self.context_builder.build(selected, max_tokens=self._context_budget(query))
+        # Full snippet text only at DEBUG: the string is not even built otherwise
+        if self.logger.isEnabledFor(logging.DEBUG):
+            snippets_str = "\n".join(
+                f"\t{i}.\t{c['page_content']}" for i, c in enumerate(built.chunks, 1)
+            )
+            self.logger.debug(f"Selected {len(built.chunks)} snippets for context:\n{snippets_str}")
+
+        # Step 8: build prompt
+        prompt = self.prompt_template.format(query=query, context=built.text)
+        prompt_tokens = self.llm.count_tokens(prompt)
+        self.prompt_tokens_hist.observe(prompt_tokens)
+        self.logger.info(
+            f"Prompt tokens: {prompt_tokens} (context {built.tokens}/{built.budget}, "
+            f"dropped {built.dropped} snippets)"
+        )
+        return PreparedQuery(
+            video_id=video_id, prompt=prompt, chunks=built.chunks,
+            prompt_tokens=prompt_tokens, context_tokens=built.tokens
+        )
+
+    def _retrieve(self, video_id: str, query: str, q_emb: np.ndarray, deadline: Optional[Deadline] = None):
+        """
+        Vector search within the video, then optional rerank (the cascade may
+        bypass it or prune candidates). Returns (docs, relevance) in search order.
+        """
+        with instrumentation.span("db_search"):
+            docs = self.vectorstore.search_by_vector(q_emb, k=self._retrieval_k(deadline), video_id=video_id)
+        self.logger.debug(f"Retrieved {len(docs)} candidates")
+        return self._rerank_many([(query, q_emb, docs)], deadline)[0]
+
+    def _retrieval_k(self, deadline: Optional[Deadline]) -> int:
+        """Candidates to fetch: retriever top_k, halved when the deadline is close."""
+        if deadline is None:
+            return self.retriever_top_k
+        floor = self.reranker_top_k if self.use_reranker else 1
+        return self.deadline_policy.retrieval_k(deadline, self.retriever_top_k, floor=floor)
+
+    def _rerank_many(self, items: List[tuple], deadline: Optional[Deadline] = None) -> List[tuple]:
+        """
+        Apply the cascade to each (query, q_emb, docs) item and score all queries
+        that need reranking in one reranker call. Returns (docs, relevance) per item;
+        candidates pruned by the cascade follow the reranked head in retrieval order.
+        With a deadline, reranking is skipped when too little time is left and
+        scoring itself is bounded by the deadline.
+        """
+        results = []
+        pending = []
+        rerank = self.use_reranker and (deadline is None or self.deadline_policy.allow_rerank(deadline))
+        for query, q_emb, docs in items:
+            if not docs:
+                results.append(([], []))
+                continue
+            relevance = [d["score"] for d in docs]
+            if rerank:
+                bypass, n_candidates = self.cascade.plan(relevance)
+                if bypass:
+                    self.cascade.record_bypass(len(docs))
+                    self.logger.info("Reranker bypassed: top-1 retrieval margin above threshold")
+                else:
+                    pending.append((len(results), query, q_emb, docs[:n_candidates], len(docs)))
+            results.append((docs, relevance))
+        if not pending:
+            return results
+
+        rerank_start = time.perf_counter()
+        requests = []
+        for _, query, q_emb, docs, _ in pending:
+            # Token ids are stored at ingestion; legacy rows are tokenized here
+            cand_tokens = [
+                d["token_ids"] if d.get("token_ids") is not None
+                else TOKENIZER.encode(d["page_content"])
+                for d in docs
+            ]
+            # Row ids key the cross-encoder score cache (text hashes otherwise)
+            ids = [d.get("id") for d in docs]
+            requests.append({
+                "query_embedding": q_emb,
+                "doc_embeddings": list(self._doc_embeddings(docs)),
+                "query_tokens": TOKENIZER.encode(query),
+                "doc_tokens_list": cand_tokens,
+                "doc_texts": [d["page_content"] for d in docs],
+                "query_text": query,
+                "doc_ids": ids if all(i is not None for i in ids) else None,
+            })
+        with instrumentation.span("rerank"):
+            scores = self.reranker.score_many(requests, deadline=deadline.at if deadline else None)
+        elapsed = time.perf_counter() - rerank_start
+        for (idx, _, _, head, total), relevance in zip(pending, scores):
+            tail = results[idx][0][len(head):]
+            relevance = list(relevance) + self.cascade.tail_scores(relevance, len(tail))
+            results[idx] = (head + tail, relevance)
+            self.cascade.record_rerank(elapsed / len(pending), len(head), total)
+        return results
+
+    def _context_budget(self, query: str) -> Optional[int]:
+        """
+        Context token budget: configured max_tokens, further capped so that
+        template + query + context + answer fit into the model context window.
+        """
+        budget = self.context_max_tokens
+        if self.llm.context_window:
+            fixed = self.llm.count_tokens(self.prompt_template.format(query=query, context=""))
+            available = self.llm.context_window - fixed - self.max_new_tokens
+            budget = available if budget is None else min(budget, available)
+        return max(budget, 0) if budget is not None else None
+
+    @staticmethod
+    def _to_numpy(emb) -> np.ndarray:
+        if hasattr(emb, 'cpu'):
+            emb = emb.cpu().numpy()
+        return np.asarray(emb, dtype=np.float32)
+
+    def _doc_embeddings(self, docs: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Candidate embeddings as an (n, d) matrix.
+        Stored embeddings from the DB are used; missing ones are encoded in one batch.
+        """
+        missing = [i for i, d in enumerate(docs) if d.get("embedding") is None]
+        if missing:
+            encoded = self._to_numpy(self.embedding_model.encode(
+                [docs[i]["page_content"] for i in missing], convert_to_tensor=False
+            ))
+            for i, emb in zip(missing, encoded):
+                docs[i]["embedding"] = emb
+        return np.vstack([d["embedding"] for d in docs])
+
+    def _cache_answer(self, video_id: str, query: str, answer: str, q_emb: Optional[np.ndarray]) -> None:
+        if self.answer_cache is not None and answer:
+            self.answer_cache.put(video_id, query, answer, q_emb)
+
+    def _generation_params(
+        self,
+        query: str,
+        prepared: PreparedQuery,
+        generation: Optional[GenerationParams] = None
+    ) -> GenerationParams:
+        """Configured (or request) decoding parameters with the adaptive answer-length cap."""
+        params = generation or self.generation
+        if not params.adaptive:
+            return params
+        cap = self.answer_length.cap(query, prepared.context_tokens, params.max_tokens)
+        return params if cap == params.max_tokens else replace(params, max_tokens=cap)
+
+    def _llm_kwargs(self, params: GenerationParams, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        Decoding kwargs for the LLM. A remote LLM also gets the slot deadline, so the
+        request waits in the model server's queue no longer than it may wait here.
+        """
+        kwargs = params.llm_kwargs()
+        if deadline is not None and getattr(self.llm, "forwards_slot_deadline", False):
+            slot_deadline = self.deadline_policy.slot_deadline(deadline)
+            if slot_deadline is not None:
+                kwargs["slot_deadline"] = slot_deadline
+        return kwargs
+
+    def _answer_prepared(
+        self,
+        prepared: PreparedQuery,
+        deadline: Deadline,
+        params: Optional[GenerationParams] = None
+    ) -> str:
+        """
+        Generate the answer for a prepared prompt within the deadline. When there is
+        no time left to generate (before or while waiting for a slot), the best
+        chunks are returned instead.
+        """
+        if not self.deadline_policy.allow_generation(deadline):
+            return self._retrieval_only_answer(prepared)
+        try:
+            return self._generate_answer(prepared.prompt, deadline, params)
+        except QueueTimeoutError:
+            # the scheduler's own queue_timeout is still reported as overload
+            if self.deadline_policy.allow_generation(deadline):
+                raise
+            return self._retrieval_only_answer(prepared)
+
+    def _retrieval_only_answer(self, prepared: PreparedQuery) -> str:
+        """Degraded answer: the selected chunks with links to their moments in the video."""
+        lines = [
+            f"{i}. {c['page_content']} ({self.subtitle_extractor.video_url(prepared.video_id, c.get('start_time'))})"
+            for i, c in enumerate(prepared.chunks, 1)
+        ]
+        return "Не успели сгенерировать ответ вовремя. Наиболее подходящие фрагменты видео:\n" + "\n".join(lines)
+
+    def _generate_answer(
+        self,
+        prompt: str,
+        deadline: Optional[Deadline] = None,
+        params: Optional[GenerationParams] = None
+    ) -> str:
         """
         Generate answer using LLM.
+        With a deadline, max_length is capped to the remaining time, the slot wait
+        ends early enough to still generate, and decoding is cancelled at the deadline.
         """
-        start = time.time()
-        answer = self.llm.generate(prompt, max_length=1024)
+        params = params or self.generation
+        if deadline is None or deadline.at is None:
+            with self.scheduler.slot(), instrumentation.span("generation"):
+                start = time.time()
+                answer = self.llm.generate(prompt, max_length=params.max_tokens, **params.llm_kwargs())
+            elapsed = time.time() - start
+            self.logger.info(f"Answer generated in {elapsed:.2f}s")
+            return answer.strip()
+
+        slot_deadline = self.deadline_policy.slot_deadline(deadline)
+        if self.scheduler.queue_timeout is not None:
+            slot_deadline = min(slot_deadline, time.monotonic() + self.scheduler.queue_timeout)
+        with self.scheduler.slot(deadline=slot_deadline), instrumentation.span("generation"):
+            start = time.time()
+            max_length = self.deadline_policy.max_tokens(deadline, params.max_tokens)
+            answer = self._generate_until(prompt, max_length, deadline, params)
         elapsed = time.time() - start
-        self.logger.info(f"Answer generated in {elapsed:.2f}s")
+        self.logger.info(f"Answer generated in {elapsed:.2f}s (deadline, max_length={max_length})")
         return answer.strip()
+
+    def _generate_until(self, prompt: str, max_length: int, deadline: Deadline, params: GenerationParams) -> str:
+        """Stream the answer and cancel decoding once the deadline passes."""
+        cancel_event = threading.Event()
+        parts: List[str] = []
+        stream = self.llm.stream_generate(
+            prompt, max_length=max_length, cancel_event=cancel_event, **self._llm_kwargs(params, deadline)
+        )
+        try:
+            for piece in stream:
+                parts.append(piece)
+                if deadline.expired():
+                    cancel_event.set()
+                    deadline.degrade("generation_cut")
+                    break
+        finally:
+            # releases the backend (llama.cpp lock, HF worker) even when cut short
+            stream.close()
+        return "".join(parts)
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, TypeVar
+
+from src.utils.logger_loader import LoggerLoader
+from src.utils.metrics import REGISTRY
+
+T = TypeVar("T")
+
+
+class SchedulerRejected(RuntimeError):
+    """Request was not admitted to generation; status_code is the HTTP status to answer with."""
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFullError(SchedulerRejected):
+    """The wait queue is at capacity (load shedding)."""
+    status_code = 429
+
+
+class QueueTimeoutError(SchedulerRejected):
+    """The request's deadline passed before a generation slot became free."""
+    status_code = 503
+
+
+class LLMScheduler:
+    """
+    Admission control for one model instance.
+
+    At most `slots` generations run at once (llama.cpp / a HF pipeline are not
+    safe to call concurrently, and parallel calls only oversubscribe the cores).
+    Other requests wait in a bounded FIFO queue; when the queue is full they are
+    rejected immediately, and a waiting request gives up once its deadline passes.
+    """
+
+    def __init__(self, slots: int = 1, max_queue: int = 16, queue_timeout: Optional[float] = 30.0) -> None:
+        if slots < 1:
+            raise ValueError("slots must be >= 1")
+        self.slots = slots
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.logger = LoggerLoader.get_logger(__name__)
+
+        self._cond = threading.Condition()
+        self._waiting: deque = deque()
+        self._busy = 0
+
+        self.queue_depth = REGISTRY.gauge("llm_queue_depth", "Requests waiting for a generation slot")
+        self.busy_slots = REGISTRY.gauge("llm_slots_busy", "Generation slots in use")
+        self.queue_wait = REGISTRY.histogram("llm_queue_wait_seconds", "Time spent waiting for a generation slot")
+        self.rejected = REGISTRY.counter("llm_requests_rejected_total", "Requests shed by the LLM scheduler")
+
+    def _deadline(self, timeout: Optional[float]) -> Optional[float]:
+        timeout = self.queue_timeout if timeout is None else timeout
+        return None if timeout is None else time.monotonic() + timeout
+
+    def acquire(self, timeout: Optional[float] = None, deadline: Optional[float] = None) -> float:
+        """
+        Wait for a slot in arrival order.
+
+        :param timeout: max seconds to wait (default: queue_timeout)
+        :param deadline: absolute time.monotonic() deadline; overrides timeout
+        :return: seconds spent in the queue
+        :raises QueueFullError: the queue is full
+        :raises QueueTimeoutError: the deadline passed while waiting
+        """
+        deadline = deadline if deadline is not None else self._deadline(timeout)
+        ticket = object()
+        start = time.monotonic()
+        with self._cond:
+            if self._busy < self.slots and not self._waiting:
+                self._busy += 1
+                self.busy_slots.set(self._busy)
+                self.queue_wait.observe(0.0)
+                return 0.0
+            if len(self._waiting) >= self.max_queue:
+                self.rejected.inc(reason="queue_full")
+                raise QueueFullError("LLM queue is full", retry_after=self.queue_timeout)
+
+            self._waiting.append(ticket)
+            self.queue_depth.set(len(self._waiting))
+            try:
+                while not (self._waiting[0] is ticket and self._busy < self.slots):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self.rejected.inc(reason="deadline")
+                        raise QueueTimeoutError("Timed out waiting for a generation slot")
+                    self._cond.wait(remaining)
+                self._busy += 1
+                self.busy_slots.set(self._busy)
+            finally:
+                self._waiting.remove(ticket)
+                self.queue_depth.set(len(self._waiting))
+                # следующий в очереди мог стать первым
+                self._cond.notify_all()
+
+        waited = time.monotonic() - start
+        self.queue_wait.observe(waited)
+        return waited
+
+    def release(self) -> None:
+        with self._cond:
+            self._busy -= 1
+            self.busy_slots.set(self._busy)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None, deadline: Optional[float] = None) -> Iterator[float]:
+        """Hold a generation slot for the duration of the block; yields the queue wait."""
+        waited = self.acquire(timeout=timeout, deadline=deadline)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def run(self, fn: Callable[..., T], *args, timeout: Optional[float] = None, **kwargs) -> T:
+        """Call fn inside a slot."""
+        with self.slot(timeout=timeout):
+            return fn(*args, **kwargs)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"slots": self.slots, "busy": self._busy, "waiting": len(self._waiting), "max_queue": self.max_queue}
@@ -1,10 +1,26 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Annotated, Optional
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import Annotated, Any, AsyncIterator, Dict, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import re
+import threading
+import time
+import uuid
+from src.answer_generator.model_registry import ModelRegistry
 from src.answer_generator.rag_model import RAGModel
-from src.utils.logger_loader import LoggerLoader
+from src.answer_generator.generation import GenerationParams
+from src.answer_generator.scheduler import SchedulerRejected
+from src.utils.metrics import REGISTRY
+from src.utils.logger_loader import LoggerLoader, reset_request_id, set_request_id
 from src.utils.db_connector import DBConnector
-import uvicorn
+from src.utils.async_db_connector import AsyncDBConnector
+from src.utils.config_loader import ConfigLoader
+from src.utils.profiling import MODES as PROFILE_MODES, RequestProfiler, new_profile_id
+from src.utils.resources import ResourcePlan
 from dotenv import load_dotenv
 import os
 
@@ -12,54 +28,453 @@ import os
 load_dotenv()
 
 # Логгер
-logger = LoggerLoader.get_logger()
+logger = LoggerLoader.get_logger(__name__)
+
+
+class ServiceState:
+    """
+    Компоненты сервиса. Загружаются в фоне после старта процесса, поэтому
+    /health отвечает сразу, а /ready — только когда модели загружены и прогреты.
+    """
+
+    def __init__(self) -> None:
+        self.db_connector: Optional[DBConnector] = None
+        self.rag_model: Optional[RAGModel] = None
+        # Асинхронный пул для чтения из БД в async-эндпоинтах
+        self.async_db_connector: Optional[AsyncDBConnector] = None
+        self.ready: bool = False
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        # Профилирование по запросу (X-Profile + X-Admin-Token) и фоновое 1 из N
+        self.profiler: Optional[RequestProfiler] = None
+        # Клиент сервера моделей (model_server.enabled): его метрики добавляются в /metrics
+        self.model_client: Optional[Any] = None
+
+
+state = ServiceState()
+
+
+async def _timed(name: str, fn, *args) -> Any:
+    """Выполнить блокирующую загрузку в отдельном потоке и запомнить её время."""
+    start = time.perf_counter()
+    result = await asyncio.to_thread(fn, *args)
+    state.timings[name] = round(time.perf_counter() - start, 3)
+    logger.info(f"Компонент '{name}' загружен за {state.timings[name]:.2f} с")
+    return result
+
+
+async def load_components() -> None:
+    """
+    Параллельно поднять пул БД, модель эмбеддингов и LLM, затем собрать RAGModel
+    (модели берутся из реестра уже загруженными) и прогнать через модели пробный запрос.
+    """
+    config = ConfigLoader.get_config()
+    registry = ModelRegistry.get_registry()
+    start = time.perf_counter()
+    try:
+        state.model_client = registry.model_client(config)
+        state.db_connector, _, _ = await asyncio.gather(
+            _timed("db", DBConnector),
+            _timed("embedder", registry.get_embedder, config.get("embedding_model")),
+            _timed("llm", registry.get_llm, config),
+        )
+        state.rag_model = await _timed("rag_model", RAGModel, state.db_connector)
+
+        async_cfg = config.get("async_api", {})
+        if async_cfg.get("enabled", False):
+            state.async_db_connector = AsyncDBConnector(
+                min_size=async_cfg.get("pool_min_size", 2),
+                max_size=async_cfg.get("pool_max_size", 10)
+            )
+            await state.async_db_connector.connect()
+            state.rag_model.attach_async_db(state.async_db_connector)
+
+        await _timed("warmup", state.rag_model.warmup)
+        state.timings["total"] = round(time.perf_counter() - start, 3)
+        state.ready = True
+        logger.info(f"Сервис готов к работе за {state.timings['total']:.2f} с")
+    except Exception as e:
+        state.error = str(e)
+        logger.error(f"Ошибка при запуске сервиса: {e}")
+
+
+async def close_components() -> None:
+    state.ready = False
+    if state.async_db_connector is not None:
+        if state.rag_model is not None:
+            state.rag_model.attach_async_db(None)
+        await state.async_db_connector.close()
+    if state.rag_model is not None:
+        state.rag_model.close()
+    if state.db_connector is not None:
+        state.db_connector.close()
+        logger.info("Пул соединений закрыт")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    config = ConfigLoader.get_config()
+    LoggerLoader.configure(config)
+    # Пулы BLAS ограничиваются до загрузки моделей, torch и llama.cpp — при их создании
+    ResourcePlan.from_config(config).apply_blas()
+    state.profiler = RequestProfiler.from_config(config)
+    # Загрузка не блокирует старт: процесс сразу отвечает на /health и /ready
+    loader = asyncio.create_task(load_components())
+    try:
+        yield
+    finally:
+        if not loader.done():
+            loader.cancel()
+            try:
+                await loader
+            except asyncio.CancelledError:
+                pass
+        await close_components()
+        if state.profiler is not None:
+            path = state.profiler.dump_hot_paths()
+            if path:
+                logger.info(f"Агрегат горячих путей сохранён в {path}")
+
 
 # FastAPI приложение
 app: FastAPI = FastAPI(
     title="RAG API",
     description="API для обработки запросов с помощью Retrieval-Augmented Generation",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
-# Инициализация DB и RAG модели
-db_connector: DBConnector = DBConnector()
-rag_model: RAGModel = RAGModel(db_connector=db_connector)
-logger.info("RAGModel успешно инициализирована с DBConnector")
+
+# Допустимый X-Request-Id от клиента; иначе id генерируется (в логи и заголовки не попадает мусор)
+REQUEST_ID_RE = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+class RequestIdMiddleware:
+    """
+    Request id для корреляции логов: берётся из X-Request-Id, если он подходит
+    под REQUEST_ID_RE (иначе генерируется), кладётся в contextvar на время запроса
+    и возвращается в заголовке ответа.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        incoming = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        rid = incoming if REQUEST_ID_RE.fullmatch(incoming) else uuid.uuid4().hex
+
+        async def send_with_id(message) -> None:
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append((b"x-request-id", rid.encode("latin-1")))
+            await send(message)
+
+        token = set_request_id(rid)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            reset_request_id(token)
+
+
+app.add_middleware(RequestIdMiddleware)
+
+
+def get_rag_model() -> RAGModel:
+    """RAGModel, если сервис готов; иначе 503 с Retry-After."""
+    if not state.ready or state.rag_model is None:
+        detail = "Сервис не запустился" if state.error else "Сервис загружается"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+    return state.rag_model
+
+
+def _profiler() -> RequestProfiler:
+    if state.profiler is None:
+        raise HTTPException(status_code=503, detail="Профилировщик не инициализирован")
+    return state.profiler
+
+
+def _require_admin(http_request: Request) -> RequestProfiler:
+    """Профилировщик, если X-Admin-Token совпадает с admin-токеном; иначе 403."""
+    profiler = _profiler()
+    if not profiler.authorized(http_request.headers.get("X-Admin-Token")):
+        raise HTTPException(status_code=403, detail="Нужен admin-токен")
+    return profiler
+
+
+def profile_mode(http_request: Request) -> Optional[str]:
+    """
+    Режим профилирования запроса по требованию: заголовок X-Profile или параметр
+    ?profile= (1/true — режим из конфига, sampling/cprofile — явно). Требует
+    admin-токен. Без флага — None (фоновый 1 из N решает background_sample()).
+    """
+    flag = http_request.headers.get("X-Profile") or http_request.query_params.get("profile")
+    if not flag:
+        return None
+    profiler = _require_admin(http_request)
+    flag = flag.lower()
+    if flag in ("1", "true", "yes"):
+        return profiler.mode
+    if flag not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"Неизвестный режим профилирования: {flag}")
+    return flag
+
+
+def background_sample() -> bool:
+    """Профилировать ли этот запрос в фоне (profiling.sample_every)."""
+    return state.profiler is not None and state.profiler.should_sample()
+
+
+# Максимум вопросов в одном /query/batch
+MAX_BATCH_QUERIES = 64
+# Максимум фрагментов в ответе /search
+MAX_SEARCH_TOP_K = 100
 
 # ----- Pydantic схемы с Annotated для Swagger UI -----
 class QueryRequest(BaseModel):
     video_url: Annotated[str, "URL видео"]  # Используем аннотацию для добавления подсказки в Swagger
     query: Annotated[str, "Вопрос к видео"]  # Подсказка для запроса
+    # Бюджет времени на запрос, с (по умолчанию deadline.default_seconds, не больше deadline.max_seconds)
+    timeout: Annotated[Optional[float], Field(gt=0), "Бюджет времени, с"] = None
+    # Параметры генерации поверх секции generation конфига (такие запросы не кэшируются)
+    max_tokens: Annotated[Optional[int], Field(gt=0, le=4096), "Максимум токенов ответа"] = None
+    stop: Annotated[Optional[List[str]], Field(max_length=8), "Стоп-строки"] = None
+    temperature: Annotated[Optional[float], Field(ge=0, le=2), "Температура"] = None
+
+    def generation(self, defaults: GenerationParams) -> Optional[GenerationParams]:
+        """Параметры генерации запроса или None, если он ничего не переопределяет."""
+        if self.max_tokens is None and self.stop is None and self.temperature is None:
+            return None
+        return defaults.with_overrides(self.max_tokens, self.stop, self.temperature)
 
 class QueryResponse(BaseModel):
     answer: str
     context: Optional[str] = None  # Можно включать для отладки
+    degraded: bool = False  # часть этапов урезана из-за дедлайна
+    degraded_reasons: Optional[List[str]] = None
+
+class BatchQueryRequest(BaseModel):
+    video_url: Annotated[str, "URL видео"]
+    queries: Annotated[List[str], Field(min_length=1, max_length=MAX_BATCH_QUERIES), "Вопросы к видео"]
+
+class BatchQueryItem(BaseModel):
+    query: str
+    answer: Optional[str] = None
+    error: Optional[str] = None
+    status: Optional[int] = None  # 429/503, если генерация отклонена планировщиком
+
+class BatchQueryResponse(BaseModel):
+    video_id: str
+    results: List[BatchQueryItem]
+
+class SearchRequest(BaseModel):
+    video_url: Annotated[str, "URL видео"]
+    query: Annotated[str, "Что найти в видео"]
+    top_k: Annotated[Optional[int], Field(gt=0, le=MAX_SEARCH_TOP_K), "Сколько фрагментов вернуть"] = None
+
+class SearchChunk(BaseModel):
+    text: str
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+    score: float
+    url: str  # ссылка на момент в видео
+
+class SearchResponse(BaseModel):
+    video_id: str
+    chunks: List[SearchChunk]
 
 # ----- Роуты -----
 @app.get("/health")
-def health_check() -> dict:
-    logger.info("Получен запрос на /health")
-    return {"status": "ok"}
+def health_check() -> JSONResponse:
+    """Liveness: процесс жив. 503 только если запуск компонентов завершился ошибкой."""
+    logger.debug("Получен запрос на /health")
+    if state.error:
+        return JSONResponse({"status": "error", "error": state.error}, status_code=503)
+    return JSONResponse({"status": "ok"})
+
+@app.get("/ready")
+def readiness_check() -> JSONResponse:
+    """Readiness: БД подключена, модели загружены и прогреты — можно слать трафик."""
+    if not state.ready:
+        status = "error" if state.error else "starting"
+        return JSONResponse({"status": status, "timings": state.timings}, status_code=503)
+    return JSONResponse({
+        "status": "ready",
+        "timings": state.timings,
+        "db_pool": state.db_connector.pool_stats(),
+    })
 
 @app.post("/query", response_model=QueryResponse)
-def query_endpoint(request: QueryRequest) -> QueryResponse:
+async def query_endpoint(request: QueryRequest, http_request: Request, response: Response) -> QueryResponse:
+    rag_model = get_rag_model()
+    mode = profile_mode(http_request)
+    deadline = rag_model.deadline_policy.new_deadline(request.timeout)
+    generation = request.generation(rag_model.generation)
     try:
         logger.info(f"Запрос получен: video_url='{request.video_url}', query='{request.query}'")
-        answer: str = rag_model.process_query(request.video_url, request.query)
-        logger.info(f"Ответ сгенерирован (обрезка до 500 символов): {answer[:500]}...")
-        return QueryResponse(answer=answer)
+        if mode is None:
+            answer_coro = rag_model.aprocess_query(request.video_url, request.query, deadline, generation)
+            # фоновый профиль снимается с того же асинхронного пути, что и у остальных запросов
+            answer: str = await (state.profiler.sample(answer_coro) if background_sample() else answer_coro)
+        else:
+            # Профилируемый запрос целиком идёт синхронным путём в одном потоке пула:
+            # так профайлер видит все этапы, а не только корутину эндпоинта
+            profile_id = new_profile_id()
+            answer = await run_in_threadpool(
+                state.profiler.run, profile_id, mode, rag_model.process_query,
+                request.video_url, request.query, deadline, generation
+            )
+            response.headers["X-Profile-Id"] = profile_id
+        logger.debug(f"Ответ сгенерирован (обрезка до 500 символов): {answer[:500]}...")
+        if deadline.degraded:
+            logger.warning(f"Ответ урезан по дедлайну: {', '.join(deadline.reasons)}")
+        return QueryResponse(answer=answer, degraded=deadline.degraded, degraded_reasons=deadline.reasons or None)
+    except SchedulerRejected as e:
+        logger.warning(f"Запрос отклонён планировщиком LLM: {e}")
+        headers = {"Retry-After": str(int(e.retry_after))} if e.retry_after else None
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
     except Exception as e:
         logger.error(f"Ошибка при обработке запроса: {e}")
         raise HTTPException(status_code=500, detail="Ошибка обработки запроса")
 
-# ----- Завершение работы -----
-@app.on_event("shutdown")
-def shutdown_event() -> None:
-    db_connector.close()
-    logger.info("Пул соединений закрыт")
+@app.post("/query/batch", response_model=BatchQueryResponse)
+def query_batch_endpoint(request: BatchQueryRequest) -> BatchQueryResponse:
+    """
+    Несколько вопросов к одному видео за один вызов. Ошибки возвращаются
+    по каждому вопросу отдельно и не ломают весь запрос.
+    """
+    logger.info(f"Пакетный запрос: video_url='{request.video_url}', вопросов: {len(request.queries)}")
+    rag_model = get_rag_model()
+    try:
+        result = rag_model.process_batch(request.video_url, request.queries)
+    except Exception as e:
+        logger.error(f"Ошибка при обработке пакетного запроса: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка обработки запроса")
+    if "error" in result:
+        status = 400 if result["video_id"] is None else 404
+        raise HTTPException(status_code=status, detail=result["error"])
+    return BatchQueryResponse(**result)
+
+@app.post("/search", response_model=SearchResponse)
+async def search_endpoint(request: SearchRequest, http_request: Request, response: Response) -> SearchResponse:
+    """
+    Поиск по видео без генерации: фрагменты субтитров с таймкодами,
+    оценками и ссылками на нужный момент.
+    """
+    logger.info(f"Поиск: video_url='{request.video_url}', query='{request.query}'")
+    rag_model = get_rag_model()
+    mode = profile_mode(http_request)
+    try:
+        if mode is None:
+            search_coro = rag_model.asearch(request.video_url, request.query, top_k=request.top_k)
+            result = await (state.profiler.sample(search_coro) if background_sample() else search_coro)
+        else:
+            profile_id = new_profile_id()
+            result = await run_in_threadpool(
+                state.profiler.run, profile_id, mode, rag_model.search, request.video_url, request.query, request.top_k
+            )
+            response.headers["X-Profile-Id"] = profile_id
+    except Exception as e:
+        logger.error(f"Ошибка при поиске: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка обработки запроса")
+    if "error" in result:
+        status = 400 if result["video_id"] is None else 404
+        raise HTTPException(status_code=status, detail=result["error"])
+    return SearchResponse(**result)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint() -> PlainTextResponse:
+    """
+    Метрики процесса в формате Prometheus (очередь LLM, реранкер, размеры промптов).
+    С сервером моделей к ним добавляются его метрики (токены, prefill/decode,
+    prefix-кэш) с меткой process="model_server".
+    """
+    remote = []
+    if state.model_client is not None:
+        try:
+            remote.append(({"process": "model_server"}, state.model_client.metrics()))
+        except Exception as e:
+            logger.warning(f"Метрики сервера моделей недоступны: {e}")
+    return PlainTextResponse(REGISTRY.render(remote), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/profiles/hot")
+def hot_paths_endpoint(http_request: Request, top: int = 20) -> JSONResponse:
+    """Агрегат sampling-профилей: самые горячие функции и стеки."""
+    return JSONResponse(_require_admin(http_request).hot_paths(top))
+
+@app.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse)
+def profile_endpoint(profile_id: str, http_request: Request) -> PlainTextResponse:
+    """
+    Профиль запроса по X-Profile-Id: свёрнутые стеки (flamegraph.pl, speedscope)
+    или текст pstats для режима cprofile.
+    """
+    report = _require_admin(http_request).get(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return PlainTextResponse(
+        report.to_text(),
+        headers={"X-Profile-Mode": report.mode, "X-Profile-Duration": f"{report.duration:.3f}"},
+    )
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Сериализация события в формат text/event-stream."""
+    data = json.dumps(event["data"], ensure_ascii=False)
+    return f"event: {event['event']}\ndata: {data}\n\n"
+
+@app.post("/query/stream")
+async def query_stream_endpoint(request: QueryRequest, http_request: Request) -> StreamingResponse:
+    """
+    Потоковый ответ (SSE): сначала событие metadata с выбранными фрагментами,
+    затем token-события, в конце done со статистикой.
+    При отключении клиента генерация останавливается.
+    """
+    logger.info(f"Потоковый запрос: video_url='{request.video_url}', query='{request.query}'")
+    cancel_event = threading.Event()
+    rag_model = get_rag_model()
+    events = rag_model.stream_query(
+        request.video_url, request.query, cancel_event=cancel_event,
+        generation=request.generation(rag_model.generation),
+        deadline=rag_model.deadline_policy.new_deadline(request.timeout)
+    )
+    # Шаг генератора и его закрытие не должны идти одновременно из разных потоков
+    step_lock = threading.Lock()
+
+    def step() -> Optional[Dict[str, Any]]:
+        with step_lock:
+            return next(events, None)
+
+    def close() -> None:
+        with step_lock:
+            events.close()
+
+    async def event_source() -> AsyncIterator[str]:
+        try:
+            while True:
+                if await http_request.is_disconnected():
+                    logger.info("Клиент отключился, останавливаем генерацию")
+                    break
+                # Генерация блокирующая — шаги итератора выполняем в пуле потоков
+                event = await run_in_threadpool(step)
+                if event is None:
+                    break
+                yield format_sse(event)
+        finally:
+            cancel_event.set()
+            # Закрываем явно, не дожидаясь GC: поток LLM и слот планировщика освобождаются сразу.
+            # В потоке: если текущий шаг ещё выполняется, закрытие дождётся его
+            await asyncio.shield(run_in_threadpool(close))
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # ----- Запуск сервера -----
 if __name__ == "__main__":
+    import uvicorn
+
     port = int(os.getenv("APP_PORT", 8000))
     logger.info(f"Запуск сервера на http://127.0.0.1:{port}")
     uvicorn.run("src.api.main:app", host="127.0.0.1", port=port, reload=True)
@@ -1,17 +1,21 @@
-import uvicorn
 import os
 from dotenv import load_dotenv
 
 
 def main() -> None:
     """Запуск FastAPI через Uvicorn с параметрами из .env"""
+    import uvicorn
+
     load_dotenv()
 
+    # Несколько воркеров — только с сервером моделей (model_server.enabled), иначе каждый грузит свои модели
+    workers = int(os.getenv("WORKERS", 1))
     uvicorn.run(
         "src.api.main:app",
         host=os.getenv("APP_HOST", "127.0.0.1"),
         port=int(os.getenv("APP_PORT", 8000)),
-        reload=os.getenv("RELOAD", "True") == "True"
+        reload=workers == 1 and os.getenv("RELOAD", "True") == "True",
+        workers=workers
     )
 
 
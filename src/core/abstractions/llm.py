@@ -1,4 +1,6 @@
+import threading
 from abc import ABC, abstractmethod
+from typing import List, Optional
 
 class BaseLLM(ABC):
     """
@@ -6,24 +8,65 @@ class BaseLLM(ABC):
     Определяет базовый интерфейс для генерации ответов и стриминга.
     """
 
+    # Размер контекстного окна модели в токенах (None — неизвестен)
+    context_window: Optional[int] = None
+
     @abstractmethod
-    def generate(self, prompt: str, max_length: int = 200) -> str:
+    def generate(
+            self,
+            prompt: str,
+            max_length: int = 200,
+            stop: Optional[List[str]] = None,
+            temperature: Optional[float] = None
+    ) -> str:
         """
         Сгенерировать полный ответ на основе prompt.
 
         :param prompt: входной текстовый промпт
         :param max_length: максимальное количество токенов в ответе
+        :param stop: стоп-последовательности: ответ обрывается перед первой из них (сама она не входит)
+        :param temperature: температура сэмплирования (None — по умолчанию бэкенда, 0 — жадно)
         :return: сгенерированный текст
         """
         pass
 
     @abstractmethod
-    def stream_generate(self, prompt: str, max_length: int = 200):
+    def stream_generate(
+            self,
+            prompt: str,
+            max_length: int = 200,
+            cancel_event: Optional[threading.Event] = None,
+            stop: Optional[List[str]] = None,
+            temperature: Optional[float] = None
+    ):
         """
         Построчный или по-токенный стриминг генерации.
 
         :param prompt: входной текстовый промпт
         :param max_length: ограничение на длину
+        :param cancel_event: если установлен — генерация прекращается на ближайшем токене
+        :param stop: стоп-последовательности, как в generate: части стоп-строки не отдаются
+        :param temperature: температура сэмплирования, как в generate
         :yield: части ответа (строки или токены)
         """
         pass
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Количество токенов текста в токенизаторе модели.
+        Реализация по умолчанию — грубая оценка (~4 символа на токен);
+        бэкенды переопределяют её своим токенизатором.
+
+        :param text: текст
+        :return: число токенов
+        """
+        return (len(text) + 3) // 4
+
+    def warm_prefix(self, prefix: str) -> None:
+        """
+        Подготовить модель к промптам с общим статическим префиксом
+        (например, закэшировать его KV-состояние). По умолчанию ничего не делает.
+
+        :param prefix: неизменная начальная часть всех промптов
+        """
+        return None
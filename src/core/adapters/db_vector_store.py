@@ -1,7 +1,18 @@
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Optional, Union
+import numpy as np
 from src.core.abstractions.vector_store import VectorStore
 from src.utils.db_connector import DBConnector
 from src.core.abstractions.embeddings import Embedder
+from src.reranker.tokenizer import TOKENIZER
+
+def parse_vector(value: Any) -> Union[np.ndarray, None]:
+    """Convert a pgvector value ('[0.1,0.2]' text or a sequence) to a float32 array."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return np.array(value.strip("[]").split(","), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
 
 class DBVectorStore(VectorStore):
     """
@@ -14,7 +25,7 @@ class DBVectorStore(VectorStore):
 
     def add(self, texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
         """
-        Embed and insert each document into the subtitles table.
+        Embed, tokenize and insert each document into the subtitles table.
         """
         docs_embs = self.embedding_model.encode(texts, convert_to_tensor=False)
 
@@ -25,18 +36,52 @@ class DBVectorStore(VectorStore):
                 start_time=meta["start_time"],
                 end_time=meta["end_time"],
                 text=text,
-                embedding=vec
+                embedding=vec,
+                token_ids=TOKENIZER.encode(text).tolist()
             )
 
-    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+    def search(self, query: str, k: int = 5, video_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Compute query embedding and search in DB.
         """
         q_emb = self.embedding_model.encode(query, convert_to_tensor=False)
-        raw = q_emb.tolist() if hasattr(q_emb, 'tolist') else q_emb
-        results = self.db.search_similar_embeddings(raw, top_k=k)
+        return self.search_by_vector(q_emb, k=k, video_id=video_id)
+
+    def search_by_vector(self, embedding: Any, k: int = 5, video_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Search in DB with an already computed query embedding,
+        restricted to one video when video_id is given.
+        Stored token ids and embeddings are returned as numpy arrays
+        under "token_ids" / "embedding" (None for rows without them),
+        window bounds in seconds under "start_time" / "end_time",
+        the row id under "id".
+        """
+        raw = embedding.tolist() if hasattr(embedding, 'tolist') else embedding
+        results = self.db.search_similar_embeddings(raw, top_k=k, video_id=video_id)
+        return [self.wrap_row(row) for row in results]
+
+    def search_by_vectors(
+        self, embeddings: Any, k: int = 5, video_id: Optional[str] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several query embeddings in one DB round trip.
+        Returns one list of results (same format as search_by_vector) per embedding.
+        """
+        raw = [e.tolist() if hasattr(e, 'tolist') else e for e in embeddings]
+        batches = self.db.search_similar_embeddings_batch(raw, top_k=k, video_id=video_id)
+        return [[self.wrap_row(row) for row in rows] for rows in batches]
 
-        wrapped: List[Dict[str, Any]] = []
-        for text, score in results:
-            wrapped.append({"page_content": text, "score": score})
-        return wrapped
+    @staticmethod
+    def wrap_row(row: tuple) -> Dict[str, Any]:
+        """Search result row (text, score, token_ids, embedding, start, end, video_id, id) as a dict."""
+        text, score, token_ids, emb, start_time, end_time, vid, row_id = row
+        return {
+            "page_content": text,
+            "score": score,
+            "token_ids": np.asarray(token_ids, dtype=np.int64) if token_ids is not None else None,
+            "embedding": parse_vector(emb),
+            "start_time": start_time,
+            "end_time": end_time,
+            "video_id": vid,
+            "id": row_id
+        }
@@ -0,0 +1,56 @@
+import threading
+from typing import Any, List, Optional, Sequence, Union
+
+from src.utils.resources import pinned
+
+
+class SentenceEmbedder:
+    """
+    One loaded SentenceTransformer exposed through both interfaces used in the project:
+    the Embedder protocol (`encode`) and LangChain's Embeddings (`embed_documents`,
+    `embed_query`). RAGModel, the vector stores and the LangChain chain share one
+    instance, so the weights are resident once.
+    With `cores` set, encoding runs pinned to those cores (resources.embedder).
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        normalize_embeddings: bool = False,
+        model: Optional[Any] = None,
+        cores: Optional[Sequence[int]] = None
+    ):
+        self.model_name = model_name
+        self.normalize_embeddings = normalize_embeddings
+        self._model = model
+        self.cores = cores
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The underlying SentenceTransformer, loaded on first use."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def encode(self, texts: Union[str, List[str]], *, convert_to_tensor: bool = False, **kwargs):
+        kwargs.setdefault("normalize_embeddings", self.normalize_embeddings)
+        with pinned(self.cores):
+            return self.model.encode(texts, convert_to_tensor=convert_to_tensor, **kwargs)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return [list(map(float, vec)) for vec in self.encode(list(texts))]
+
+    def embed_query(self, text: str) -> List[float]:
+        return list(map(float, self.encode(text)))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embed_query(text)
@@ -1,20 +1,16 @@
 import os
 import re
 from datetime import datetime
-from typing import List, Dict, Optional, Union
-
-from youtube_transcript_api import (
-    YouTubeTranscriptApi,
-    TranscriptsDisabled,
-    NoTranscriptFound,
-    TranscriptList,
-)
-from yt_dlp import YoutubeDL
+from typing import TYPE_CHECKING, List, Dict, Optional, Union
 
+from src.utils import instrumentation
 from src.utils.config_loader import ConfigLoader
 from src.utils.logger_loader import LoggerLoader
 from src.utils.subtitles_cleaner import clean_subtitles
 
+if TYPE_CHECKING:
+    from youtube_transcript_api import TranscriptList
+
 
 class SubtitleExtractor:
     """
@@ -29,10 +25,10 @@ class SubtitleExtractor:
 
     def __init__(self) -> None:
         self.config = ConfigLoader.get_config()
-        self.logger = LoggerLoader.get_logger()
+        self.logger = LoggerLoader.get_logger(__name__)
 
-        # YouTube API и язык
-        self.api = YouTubeTranscriptApi()
+        # YouTube API (создаётся при первом запросе) и язык
+        self._api = None
         self.language = self.config.get("language", "ru")
 
         # Параметры временных окон (секунды)
@@ -55,13 +51,31 @@ class SubtitleExtractor:
             return m.group(1) if m else None
         return ref if re.fullmatch(r"[0-9A-Za-z_-]{11}", ref) else None
 
+    @staticmethod
+    def video_url(video_id: str, start_time: Optional[float] = None) -> str:
+        """
+        Ссылка на видео; с start_time — на момент воспроизведения (целые секунды).
+        """
+        url = f"https://www.youtube.com/watch?v={video_id}"
+        return url if start_time is None else f"{url}&t={int(start_time)}s"
+
+    @property
+    def api(self):
+        """Клиент YouTubeTranscriptApi; библиотека импортируется при первом обращении."""
+        if self._api is None:
+            from youtube_transcript_api import YouTubeTranscriptApi
+            self._api = YouTubeTranscriptApi()
+        return self._api
+
     def fetch_subtitles_api(self, video_id: str) -> Optional[List[Dict[str, Union[str, float]]]]:
         """
         Получает raw‑сегменты через YouTubeTranscriptApi.
         Формат: [{"text", "start", "duration"}, ...]
         """
+        from youtube_transcript_api import TranscriptsDisabled, NoTranscriptFound
+
         try:
-            transcripts: TranscriptList = self.api.list(video_id)
+            transcripts: "TranscriptList" = self.api.list(video_id)
             try:
                 tr = transcripts.find_transcript([self.language])
             except:
@@ -119,6 +133,8 @@ class SubtitleExtractor:
         """
         Fallback: скачивает VTT через yt-dlp и парсит его.
         """
+        from yt_dlp import YoutubeDL
+
         url = f"https://www.youtube.com/watch?v={video_id}"
         opts = {
             "skip_download": True,
@@ -151,6 +167,14 @@ class SubtitleExtractor:
         Объединяет очищенные и дедуплицированные сегменты
         в текстовые окна по времени.
         """
+        return [w["text"] for w in self.chunk_windows(segments)]
+
+    def chunk_windows(self, segments: List[Dict[str, Union[str, float]]]) -> List[Dict[str, Union[str, float]]]:
+        """
+        То же, что chunk_by_time, но с границами окон:
+        [{"text", "start", "duration"}, ...], где start/duration —
+        от начала первого до конца последнего сегмента окна.
+        """
         # 1) Очистка и дедупликация подрядных повторов
         cleaned = clean_subtitles(segments)
         dedup, prev = [], None
@@ -173,12 +197,18 @@ class SubtitleExtractor:
         t = t0
         while t < t_end:
             parts = [
-                s["text"]
+                s
                 for s in dedup
                 if t <= s["start"] < t + self.block_duration
             ]
             if parts:
-                windows.append(" ".join(parts))
+                w_start = parts[0]["start"]
+                w_end = max(p["start"] + p["duration"] for p in parts)
+                windows.append({
+                    "text": " ".join(p["text"] for p in parts),
+                    "start": w_start,
+                    "duration": w_end - w_start
+                })
             t += (self.block_duration - self.block_overlap)
 
         return windows
@@ -186,24 +216,23 @@ class SubtitleExtractor:
     def get_subtitles(self, video_ref: str) -> Optional[List[Dict[str, Union[str, float]]]]:
         """
         Основной метод: принимает URL или video_id,
-        возвращает список {"text", start=0.0, duration=0.0}.
+        возвращает список окон {"text", "start", "duration"}.
         """
         vid = self.extract_video_id(video_ref)
         if not vid:
             self.logger.error(f"Invalid video reference: {video_ref}")
             return None
 
-        # 1) Пытаемся через API
-        segments = self.fetch_subtitles_api(vid)
-        # 2) Иначе — через VTT
-        if segments is None:
-            segments = self.fetch_subtitles_vtt(vid)
+        with instrumentation.span("transcript_fetch"):
+            # 1) Пытаемся через API
+            segments = self.fetch_subtitles_api(vid)
+            # 2) Иначе — через VTT
+            if segments is None:
+                segments = self.fetch_subtitles_vtt(vid)
         if not segments:
             self.logger.error(f"No subtitles for {vid}")
             return None
 
-        # 3) Time‑based chunking
-        windows = self.chunk_by_time(segments)
-
-        # 4) Подготовка финального списка для RAG
-        return [{"text": w, "start": 0.0, "duration": 0.0} for w in windows]
+        # 3) Time‑based chunking с сохранением таймкодов окон
+        with instrumentation.span("chunking"):
+            return self.chunk_windows(segments)
@@ -2,6 +2,7 @@ from src.utils.db_connector import DBConnector
 from src.utils.config_loader import ConfigLoader
 from typing import Optional, List, Dict, Union
 from src.core.abstractions.embeddings import Embedder
+from src.reranker.tokenizer import TOKENIZER
 
 class SubtitleManager:
     def __init__(self, db_pool: DBConnector, embedding_model: Embedder):
@@ -25,8 +26,13 @@ class SubtitleManager:
             # Получаем эмбеддинг для текста субтитра
             embedding = self.get_embedding(text)
 
+            # Токены считаем один раз при загрузке, чтобы не токенизировать на каждом запросе
+            token_ids = TOKENIZER.encode(text).tolist()
+
             # Добавляем субтитры в базу
-            self.db_connector.insert_subtitle(video_id, start_time, end_time, text, embedding)
+            self.db_connector.insert_subtitle(
+                video_id, start_time, end_time, text, embedding, token_ids=token_ids
+            )
 
     def get_subtitles(self, video_id: str) -> Optional[List[Dict[str, Union[str, float]]]]:
         """Получение субтитров по video_id."""
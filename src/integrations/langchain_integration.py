@@ -4,6 +4,12 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_core.embeddings import Embeddings
 from src.utils.db_connector import DBConnector
 from src.integrations.langchain_vectorstore import DBLangChainVectorStore
+from src.answer_generator.model_registry import ModelRegistry
+from src.answer_generator.generation import GenerationParams
+from src.core.adapters.sentence_embedder import SentenceEmbedder
+
+# SentenceEmbedder implements the Embeddings interface without depending on langchain
+Embeddings.register(SentenceEmbedder)
 
 
 class LangChainRAG:
@@ -13,6 +19,12 @@ class LangChainRAG:
         self.db_connector = db_connector
         self.config = config
 
+        # Shared process-wide LLM and prompt (loaded once, reused by RAGModel too)
+        registry = ModelRegistry.get_registry()
+        self.llm = registry.get_llm(config)
+        self.prompt_template = registry.get_prompt(config.get("language", "ru"))
+        self.generation = GenerationParams.from_config(config, config.get("language", "ru"))
+
         # Initialize embedding model
         self.embedding = self._get_embedding_model()
 
@@ -26,17 +38,11 @@ class LangChainRAG:
         self.chain = self._create_chain()
 
     def _get_embedding_model(self) -> Embeddings:
-        """Instantiate embedding model for LangChain."""
-        from langchain_community.embeddings import HuggingFaceEmbeddings
-        return HuggingFaceEmbeddings(
-            model_name=self.config["embedding_model"],
-            encode_kwargs={"normalize_embeddings": True}
-        )
+        """Shared embedding model (the same weights RAGModel uses)."""
+        return ModelRegistry.get_registry().get_embedder(self.config["embedding_model"])
 
     def _create_chain(self):
         """Create RAG chain: retrieve -> prompt -> LLM -> parse."""
-        prompt = self._load_prompt_template()
-
         retriever = self.vectorstore.as_retriever(
             search_kwargs={"k": self.config["retriever"]["top_k"]}
         )
@@ -48,20 +54,17 @@ class LangChainRAG:
             | StrOutputParser()
         )
 
-    def _load_prompt_template(self) -> str:
-        from src.utils.prompt_loader import PromptLoader
-        return PromptLoader().load(self.config.get("language", "ru"))
-
     def _format_prompt(self, data: dict) -> str:
-        return self._load_prompt_template().format(
-            context=data["context"],
-            question=data["question"]
+        context = "\n".join(
+            doc.page_content if hasattr(doc, "page_content") else str(doc)
+            for doc in data["context"]
         )
+        return self.prompt_template.format(context=context, query=data["question"])
 
     def _generate_answer(self, prompt: str) -> str:
-        from src.answer_generator.model_factory import model_factory
-        llm = model_factory(self.config)
-        return llm.generate(prompt, max_length=1024)
+        return self.llm.generate(
+            prompt, max_length=self.generation.max_tokens, **self.generation.llm_kwargs()
+        )
 
     def invoke(self, query: str) -> str:
         return self.chain.invoke(query)
\ No newline at end of file
@@ -3,6 +3,7 @@ from langchain_core.vectorstores import VectorStore as LCVectorStore
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from src.utils.db_connector import DBConnector
+from src.reranker.tokenizer import TOKENIZER
 
 class DBLangChainVectorStore(LCVectorStore):
     """
@@ -29,7 +30,8 @@ class DBLangChainVectorStore(LCVectorStore):
                 start_time=meta["start_time"],
                 end_time=meta["end_time"],
                 text=text,
-                embedding=emb.tolist() if hasattr(emb, "tolist") else emb
+                embedding=emb.tolist() if hasattr(emb, "tolist") else emb,
+                token_ids=TOKENIZER.encode(text).tolist()
             )
         return []
 
@@ -43,9 +45,9 @@ class DBLangChainVectorStore(LCVectorStore):
         q_emb = self.embedding_model.embed_query(query)
         q_emb_list = q_emb.tolist() if hasattr(q_emb, "tolist") else q_emb
         # 2) ищем
-        results = self.db.search_similar_embeddings(q_emb_list, top_k=k)
+        results = self.db.search_similar_embeddings(q_emb_list, top_k=k, video_id=kwargs.get("video_id"))
         # 3) упаковываем в Document
         docs = []
-        for text, score in results:
+        for text, score, *_ in results:
             docs.append(Document(page_content=text, metadata={"score": score}))
         return docs
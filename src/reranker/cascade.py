@@ -0,0 +1,121 @@
+import math
+import threading
+from typing import List, Tuple
+
+import numpy as np
+
+from src.utils.metrics import REGISTRY
+
+
+class CascadePolicy:
+    """
+    Cascade ranking in front of the reranker.
+
+    - If top-1 retrieval score leads top-2 by more than margin_threshold,
+      reranking would not change the selected context, so it is bypassed.
+    - Otherwise the number of candidates sent to the reranker shrinks with
+      score dispersion: tightly clustered scores (ambiguous) keep all
+      candidates, well-separated scores keep only min_candidates.
+
+    Path counters and estimated saved time are exported to the metrics registry.
+    """
+
+    def __init__(
+        self,
+        margin_threshold: float = 0.1,
+        min_candidates: int = 3,
+        dispersion_ref: float = 0.05,
+        enabled: bool = True
+    ) -> None:
+        self.enabled = enabled
+        self.margin_threshold = margin_threshold
+        self.min_candidates = max(1, min_candidates)
+        self.dispersion_ref = dispersion_ref
+
+        self._lock = threading.Lock()
+        # Running average of reranking cost per candidate, seconds
+        self._cost_per_candidate = 0.0
+        self._cost_samples = 0
+
+        self.paths = REGISTRY.counter(
+            "rag_rerank_cascade_total", "Queries per cascade path (bypass / rerank)"
+        )
+        self.pruned = REGISTRY.counter(
+            "rag_rerank_candidates_pruned_total", "Candidates not sent to the reranker"
+        )
+        self.rerank_seconds = REGISTRY.counter(
+            "rag_rerank_seconds_total", "Time spent in the rerank stage"
+        )
+        self.saved_seconds = REGISTRY.counter(
+            "rag_rerank_saved_seconds_total", "Estimated rerank time saved by the cascade"
+        )
+
+    def plan(self, scores: List[float]) -> Tuple[bool, int]:
+        """
+        Decide whether to rerank and how many candidates to send.
+
+        Args:
+            scores: retrieval scores, sorted descending
+
+        Returns:
+            (bypass, n_candidates)
+        """
+        total = len(scores)
+        if not self.enabled or total == 0:
+            return False, total
+        if total == 1 or scores[0] - scores[1] > self.margin_threshold:
+            return True, 0
+
+        if total <= self.min_candidates or self.dispersion_ref <= 0:
+            return False, total
+        spread = min(1.0, float(np.std(scores)) / self.dispersion_ref)
+        n = self.min_candidates + math.ceil((total - self.min_candidates) * (1.0 - spread))
+        return False, min(total, n)
+
+    @staticmethod
+    def tail_scores(head_scores: List[float], n_tail: int) -> List[float]:
+        """
+        Scores for the pruned tail, placed after the reranked head.
+
+        Pruned candidates keep their retrieval order but are scored strictly
+        below the lowest reranker score, spaced on the head's own scale so
+        min-max normalisation downstream (MMR) is not distorted.
+        """
+        if n_tail <= 0:
+            return []
+        low, high = min(head_scores), max(head_scores)
+        step = (high - low) / len(head_scores) if high > low else 1.0
+        return [low - step * (i + 1) for i in range(n_tail)]
+
+    def record_bypass(self, n_candidates: int) -> None:
+        """Count a bypassed query and the rerank time it would have cost."""
+        self.paths.inc(path="bypass")
+        with self._lock:
+            saved = self._cost_per_candidate * n_candidates
+        self.saved_seconds.inc(saved)
+
+    def record_rerank(self, elapsed: float, n_candidates: int, n_total: int) -> None:
+        """Count a reranked query; pruned candidates are credited as saved time."""
+        self.paths.inc(path="rerank")
+        self.rerank_seconds.inc(elapsed)
+        pruned = n_total - n_candidates
+        if n_candidates <= 0:
+            return
+        with self._lock:
+            self._cost_samples += 1
+            per_candidate = elapsed / n_candidates
+            self._cost_per_candidate += (per_candidate - self._cost_per_candidate) / self._cost_samples
+            saved = self._cost_per_candidate * pruned
+        if pruned > 0:
+            self.pruned.inc(pruned)
+            self.saved_seconds.inc(saved)
+
+    def stats(self) -> dict:
+        """Snapshot of cascade counters."""
+        return {
+            "bypass": int(self.paths.value(path="bypass")),
+            "rerank": int(self.paths.value(path="rerank")),
+            "pruned_candidates": int(self.pruned.value()),
+            "rerank_seconds": self.rerank_seconds.value(),
+            "saved_seconds": self.saved_seconds.value(),
+        }
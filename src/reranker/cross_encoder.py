@@ -0,0 +1,144 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.reranker.ml_model import BaseRerankModel
+from src.utils.logger_loader import LoggerLoader, bind_request_id
+from src.utils.lru_cache import LRUCache
+from src.utils.resources import thread_initializer
+
+
+def text_hash(text: str) -> str:
+    """Stable short hash used as cache key for queries and chunks without an id."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class CrossEncoderReranker(BaseRerankModel):
+    """
+    CPU cross-encoder scoring (query, fragment) pairs jointly.
+
+    All uncached pairs of a request are scored in one padded batch under a
+    latency budget; scores are memoized in an LRU cache keyed by
+    (query hash, chunk id). A batch that overran its budget keeps running
+    (a started prediction cannot be cancelled); until it finishes, new requests
+    fall back immediately instead of queueing behind it.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_length: int = 256,
+        latency_budget_ms: float = 300.0,
+        cache_size: int = 4096,
+        cores: Optional[Sequence[int]] = None,
+    ) -> None:
+        self.logger = LoggerLoader.get_logger(__name__)
+        self.model_name = model_name
+        self.max_length = max_length
+        self.latency_budget = latency_budget_ms / 1000.0
+        self.cache = LRUCache(maxsize=cache_size)
+        # One worker: scoring is CPU-bound, the thread only lets us stop waiting on it.
+        # It is pinned to `cores` for its lifetime, and so is the torch pool it starts.
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="cross-encoder", initializer=thread_initializer(cores)
+        )
+        # Prediction abandoned by its caller but still running on the worker
+        self._stale: Optional[Future] = None
+        self._lock = threading.Lock()
+        self.model = None
+        self.load(model_name)
+
+    def train(
+        self,
+        X: Sequence[Tuple[str, str]],
+        y: np.ndarray,
+        epochs: int = 1,
+        batch_size: int = 16,
+    ) -> None:
+        """Fine-tune on labelled (query, fragment) pairs; cached scores are dropped."""
+        from sentence_transformers import InputExample
+        from torch.utils.data import DataLoader
+
+        examples = [InputExample(texts=[q, d], label=float(label)) for (q, d), label in zip(X, y)]
+        loader = DataLoader(examples, shuffle=True, batch_size=batch_size)
+        self.model.fit(train_dataloader=loader, epochs=epochs, show_progress_bar=False)
+        self.cache.clear()
+
+    def predict(self, X: Sequence[Tuple[str, str]]) -> List[float]:
+        """Score (query, fragment) pairs in a single padded batch."""
+        pairs = [list(p) for p in X]
+        if not pairs:
+            return []
+        scores = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        return np.asarray(scores, dtype=float).reshape(-1).tolist()
+
+    def save(self, path: str) -> None:
+        self.model.save(path)
+
+    def load(self, path: str) -> None:
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(path, max_length=self.max_length, device="cpu")
+        self.logger.info(f"Loaded cross-encoder: {path}")
+
+    def score(
+        self,
+        query_text: str,
+        doc_texts: List[str],
+        doc_ids: Optional[List[str]] = None,
+        deadline: Optional[float] = None,
+    ) -> Optional[List[float]]:
+        """
+        Score fragments for a query, reusing cached pair scores.
+
+        Args:
+            query_text: raw query text
+            doc_texts: fragment texts
+            doc_ids: stable fragment ids (defaults to text hashes)
+            deadline: absolute time.monotonic() by which the request must finish
+
+        Returns:
+            Scores in doc_texts order, or None if scoring did not fit in the
+            remaining time (caller should fall back to a cheaper model).
+        """
+        q_hash = text_hash(query_text)
+        ids = doc_ids if doc_ids is not None else [text_hash(t) for t in doc_texts]
+        keys = [(q_hash, chunk_id) for chunk_id in ids]
+
+        scores: List[Optional[float]] = [self.cache.get(key) for key in keys]
+        missing = [i for i, s in enumerate(scores) if s is None]
+        if not missing:
+            return scores
+
+        timeout = self.latency_budget
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        if timeout <= 0:
+            return None
+
+        pairs = [(query_text, doc_texts[i]) for i in missing]
+        with self._lock:
+            if self._stale is not None and not self._stale.done():
+                self.logger.debug("Cross-encoder busy with an overrun batch, skipping")
+                return None
+            self._stale = None
+            future = self._executor.submit(bind_request_id(self.predict), pairs)
+        try:
+            fresh = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # A queued job is dropped; a running one is remembered until it finishes
+            if not future.cancel():
+                with self._lock:
+                    self._stale = future
+            self.logger.warning(
+                f"Cross-encoder exceeded {timeout * 1000:.0f} ms for {len(pairs)} pairs"
+            )
+            return None
+
+        for i, value in zip(missing, fresh):
+            scores[i] = value
+            self.cache.put(keys[i], value)
+        return scores
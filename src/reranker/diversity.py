@@ -0,0 +1,70 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def _normalize_rows(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _minmax(values: np.ndarray) -> np.ndarray:
+    span = values.max() - values.min()
+    if span <= 0:
+        return np.ones_like(values)
+    return (values - values.min()) / span
+
+
+def mmr_select(
+    doc_embs: np.ndarray,
+    relevance: Sequence[float],
+    k: int,
+    lambda_: float = 0.7,
+    dedup_threshold: Optional[float] = None
+) -> List[int]:
+    """
+    Maximal marginal relevance selection over candidate fragments.
+
+    Overlapping subtitle windows are near-duplicates in embedding space; MMR
+    trades relevance against similarity to already selected fragments so the
+    context is built from diverse windows.
+
+    Args:
+        doc_embs: (n, d) candidate embeddings
+        relevance: per-candidate relevance (retrieval or reranker scores), higher is better
+        k: maximum number of fragments to select
+        lambda_: relevance weight; 1.0 disables the diversity term
+        dedup_threshold: drop candidates whose cosine to a selected one is at least this
+
+    Returns:
+        Indices of selected candidates, in selection order.
+    """
+    rel = np.asarray(relevance, dtype=float)
+    n = rel.shape[0]
+    if n == 0 or k <= 0:
+        return []
+
+    embs = _normalize_rows(np.asarray(doc_embs, dtype=float).reshape(n, -1))
+    sims = embs @ embs.T
+    # Relevance scaled to [0, 1] so it is comparable with cosine similarity
+    rel = _minmax(rel)
+
+    max_sim = np.full(n, -1.0)
+    available = np.ones(n, dtype=bool)
+    selected: List[int] = []
+
+    while len(selected) < k and available.any():
+        penalty = np.clip(max_sim, 0.0, None) if selected else np.zeros(n)
+        scores = lambda_ * rel - (1.0 - lambda_) * penalty
+        scores[~available] = -np.inf
+        idx = int(np.argmax(scores))
+        available[idx] = False
+
+        if dedup_threshold is not None and selected and max_sim[idx] >= dedup_threshold:
+            continue
+
+        selected.append(idx)
+        max_sim = np.maximum(max_sim, sims[idx])
+
+    return selected
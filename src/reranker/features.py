@@ -1,40 +1,45 @@
 import numpy as np
-from typing import List, Set
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity as sklearn_cosine
-
-# Набор русскоязычных стоп-слов
-STOPWORDS: Set[str] = {
-    "и", "в", "во", "не", "что", "он", "на", "я", "с", "со", "как", "а", "то", "все", "она", "так",
-    "его", "но", "да", "ты", "к", "у", "же", "вы", "за", "бы", "по", "ее", "мне", "было", "вот", "от",
-    "меня", "еще", "нет", "о", "из", "ему", "теперь", "когда", "даже", "ну", "вдруг", "ли", "если",
-    "уже", "или", "ни", "быть", "был", "него", "до", "вас", "нибудь", "опять", "уж", "вам", "ведь",
-    "там", "потом", "себя", "ничего", "ей", "может", "они", "тут", "где", "есть", "надо", "ней",
-    "для", "мы", "тебя", "их", "чем", "была", "сам", "чтоб", "без", "будто", "чего", "раз", "тоже",
-    "себе", "под", "будет", "ж", "тогда", "кто", "этот"
-}
+from typing import TYPE_CHECKING, List, Optional, Sequence, Union
+from src.reranker.tokenizer import STOPWORDS, TOKENIZER
+
+# sklearn is imported where it is used: it is slow to import and only needed for scoring
+if TYPE_CHECKING:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Token ids from Tokenizer.encode, or plain string tokens
+Tokens = Union[np.ndarray, Sequence[str]]
 
 def cosine_sim(a: np.ndarray, b: np.ndarray) -> float:
     """Compute cosine similarity between two vectors."""
     if a.ndim != 1 or b.ndim != 1:
         raise ValueError("Input embeddings must be 1D arrays.")
+    from sklearn.metrics.pairwise import cosine_similarity as sklearn_cosine
+
     return float(sklearn_cosine(a.reshape(1, -1), b.reshape(1, -1))[0, 0])
 
 
-def token_overlap(query_tokens: List[str], doc_tokens: List[str]) -> float:
+def as_token_ids(tokens: Tokens) -> np.ndarray:
+    """Return int64 token ids; string tokens are mapped through the shared tokenizer."""
+    if isinstance(tokens, np.ndarray):
+        return tokens.astype(np.int64, copy=False)
+    return TOKENIZER.encode_tokens(tokens)
+
+
+def token_overlap(query_tokens: Tokens, doc_tokens: Tokens) -> float:
     """Fraction of unique query tokens appearing in document tokens."""
-    if not query_tokens:
+    query_set = TOKENIZER.content_ids(as_token_ids(query_tokens))
+    if query_set.size == 0:
         return 0.0
-    query_set = set(query_tokens) - STOPWORDS
-    doc_set = set(doc_tokens) - STOPWORDS
-    return len(query_set & doc_set) / len(query_set) if query_set else 0.0
+    doc_set = TOKENIZER.content_ids(as_token_ids(doc_tokens))
+    return np.intersect1d(query_set, doc_set, assume_unique=True).size / query_set.size
 
 
-def stopword_ratio(doc_tokens: List[str]) -> float:
+def stopword_ratio(doc_tokens: Tokens) -> float:
     """Ratio of stopwords to total tokens in document."""
-    if not doc_tokens:
+    ids = as_token_ids(doc_tokens)
+    if ids.size == 0:
         return 0.0
-    return sum(1 for t in doc_tokens if t in STOPWORDS) / len(doc_tokens)
+    return float(TOKENIZER.stopword_mask(ids).mean())
 
 
 def length_diff_ratio(query_text: str, doc_text: str) -> float:
@@ -61,7 +66,7 @@ class FeatureBuilder:
     """
 
     def __init__(self) -> None:
-        self.vectorizer: TfidfVectorizer | None = None
+        self.vectorizer: "TfidfVectorizer | None" = None
         self.query_text: str | None = None
 
     def fit_tfidf(self, query_text: str, doc_texts: List[str]) -> None:
@@ -69,6 +74,8 @@ class FeatureBuilder:
         Fit TF-IDF on combined query and document texts.
         Must be called before computing tfidf_similarity.
         """
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
         self.query_text = query_text
         try:
             # включаем слова длины ≥1, чтобы 'x','z' тоже попадали
@@ -94,26 +101,34 @@ class FeatureBuilder:
     def build(self,
               query_emb: np.ndarray,
               doc_embs: List[np.ndarray],
-              query_tokens: List[str],
-              doc_tokens_list: List[List[str]],
-              doc_texts: List[str]
+              query_tokens: Tokens,
+              doc_tokens_list: List[Tokens],
+              doc_texts: List[str],
+              query_text: Optional[str] = None
               ) -> List[np.ndarray]:
         """
         Compute feature vectors for all document candidates for a single query.
 
+        query_text is required when tokens are given as id arrays; string
+        tokens are joined back into the query text otherwise.
+
         Returns:
             List of feature arrays, in same order as doc_texts.
         """
         total = len(doc_texts)
         # Initialize TF-IDF once
-        q_text = ' '.join(query_tokens)
+        if query_text is not None:
+            q_text = ' '.join(query_text.lower().split())
+        else:
+            q_text = ' '.join(query_tokens)
+        query_ids = as_token_ids(query_tokens)
         self.fit_tfidf(q_text, doc_texts)
 
         features: List[np.ndarray] = []
         for idx, (emb, tokens, text) in enumerate(zip(doc_embs, doc_tokens_list, doc_texts)):
             feats = [
                 cosine_sim(query_emb, emb),           # embedding similarity
-                token_overlap(query_tokens, tokens),  # lexical overlap
+                token_overlap(query_ids, tokens),     # lexical overlap
                 stopword_ratio(tokens),               # noise ratio
                 length_diff_ratio(q_text, text),      # length difference
                 position_feature(idx, total),         # result position
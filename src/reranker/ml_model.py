@@ -2,8 +2,6 @@ import os
 from abc import ABC, abstractmethod
 from typing import List
 import numpy as np
-from sklearn.linear_model import LogisticRegression
-import joblib
 
 class BaseRerankModel(ABC):
     @abstractmethod
@@ -28,6 +26,9 @@ class BaseRerankModel(ABC):
 
 class LogisticRegressionReranker(BaseRerankModel):
     def __init__(self):
+        # sklearn/joblib импортируются при создании модели, а не при импорте модуля
+        from sklearn.linear_model import LogisticRegression
+
         self.model = LogisticRegression(solver='liblinear')
 
     def train(self, X: np.ndarray, y: np.ndarray) -> None:
@@ -39,8 +40,12 @@ class LogisticRegressionReranker(BaseRerankModel):
         return probs[:, 1].tolist()
 
     def save(self, path: str) -> None:
+        import joblib
+
         os.makedirs(os.path.dirname(path), exist_ok=True)
         joblib.dump(self.model, path)
 
     def load(self, path: str) -> None:
+        import joblib
+
         self.model = joblib.load(path)
@@ -4,6 +4,8 @@ from typing import List, Dict
 
 from src.utils.db_connector import DBConnector
 from src.answer_generator.rag_model import RAGModel
+from src.utils.config_loader import ConfigLoader
+from src.utils.logger_loader import LoggerLoader
 
 
 def build_dataset(
@@ -49,6 +51,7 @@ def build_dataset(
 
 
 if __name__ == "__main__":
+    LoggerLoader.configure(ConfigLoader.get_config())
     build_dataset(
         queries_path="downloads/reranker/queries.json",
         output_path="downloads/reranker/unlabeled.json",
@@ -1,58 +1,159 @@
 import numpy as np
-from typing import List, Tuple
-from src.reranker.features import FeatureBuilder
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from src.reranker.features import FeatureBuilder, Tokens
 from src.reranker.ml_model import LogisticRegressionReranker
+from src.reranker.cross_encoder import CrossEncoderReranker
+from src.utils.logger_loader import LoggerLoader
+from src.utils.resources import pinned
 import os
 
 
 class Reranker:
     """
     Reranker class: loads a trained model and re-ranks document fragments based on features.
+
+    With model_type="cross_encoder" fragments are scored by a cross-encoder first;
+    the logistic-regression model stays loaded as the fallback when the
+    cross-encoder does not finish within the remaining time.
     """
-    def __init__(self, model_path: str) -> None:
+    def __init__(
+        self,
+        model_path: str,
+        model_type: str = "logreg",
+        cross_encoder_config: Optional[dict] = None,
+        cores: Optional[Sequence[int]] = None
+    ) -> None:
+        self.logger = LoggerLoader.get_logger(__name__)
+        self.cores = cores
         self.model = LogisticRegressionReranker()
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Reranker model not found at {model_path}")
         self.model.load(model_path)
         self.feature_builder = FeatureBuilder()
 
-    def rerank(
+        self.cross_encoder: Optional[CrossEncoderReranker] = None
+        if model_type == "cross_encoder":
+            self.cross_encoder = CrossEncoderReranker(**(cross_encoder_config or {}), cores=cores)
+        elif model_type != "logreg":
+            raise ValueError(f"Unknown reranker model_type: {model_type}")
+
+    def score(
         self,
         query_embedding: np.ndarray,
         doc_embeddings: List[np.ndarray],
-        query_tokens: List[str],
-        doc_tokens_list: List[List[str]],
-        doc_texts: List[str]
-    ) -> List[Tuple[str, float]]:
+        query_tokens: Tokens,
+        doc_tokens_list: List[Tokens],
+        doc_texts: List[str],
+        query_text: Optional[str] = None,
+        doc_ids: Optional[List[str]] = None,
+        deadline: Optional[float] = None
+    ) -> List[float]:
         """
-        Re-rank document texts by predicted relevance score.
+        Predict relevance scores for document fragments, in input order.
 
         Args:
             query_embedding: numpy array of query embedding
             doc_embeddings: list of numpy arrays for each doc fragment embedding
-            query_tokens: tokenized query
-            doc_tokens_list: list of token lists for each doc fragment
+            query_tokens: tokenized query (token id array or string tokens)
+            doc_tokens_list: token ids / token lists for each doc fragment
             doc_texts: list of document fragment texts
+            query_text: raw query text for the cross-encoder (defaults to joined tokens)
+            doc_ids: stable fragment ids for the cross-encoder score cache
+            deadline: absolute time.monotonic() by which scoring must finish
 
         Returns:
-            List of tuples (text, score), sorted by score descending
+            List of scores aligned with doc_texts
         """
-        # 1. Compute feature vectors
-        features = self.feature_builder.build(
-            query_emb=query_embedding,
-            doc_embs=doc_embeddings,
-            query_tokens=query_tokens,
-            doc_tokens_list=doc_tokens_list,
-            doc_texts=doc_texts
-        )
+        return self.score_many([{
+            "query_embedding": query_embedding,
+            "doc_embeddings": doc_embeddings,
+            "query_tokens": query_tokens,
+            "doc_tokens_list": doc_tokens_list,
+            "doc_texts": doc_texts,
+            "query_text": query_text,
+            "doc_ids": doc_ids,
+        }], deadline=deadline)[0]
+
+    def score_many(self, requests: List[Dict[str, Any]], deadline: Optional[float] = None) -> List[List[float]]:
+        """
+        Score candidates of several queries at once.
+
+        Args:
+            requests: one dict per query with the keyword arguments of score()
+                      (query_embedding, doc_embeddings, query_tokens, doc_tokens_list,
+                      doc_texts and optionally query_text, doc_ids)
+            deadline: absolute time.monotonic() by which scoring must finish
+
+        Returns:
+            Per-request lists of scores aligned with each request's doc_texts.
+            Logistic-regression scoring of all requests runs as one feature matrix.
+        """
+        results: List[Optional[List[float]]] = [[] if not r["doc_texts"] else None for r in requests]
 
-        # 2. Stack into feature matrix
-        X = np.vstack(features)
+        if self.cross_encoder is not None:
+            for i, req in enumerate(requests):
+                if results[i] is not None:
+                    continue
+                query_text = req.get("query_text")
+                results[i] = self.cross_encoder.score(
+                    query_text if query_text is not None else " ".join(req["query_tokens"]),
+                    req["doc_texts"],
+                    doc_ids=req.get("doc_ids"),
+                    deadline=deadline
+                )
+                if results[i] is None:
+                    self.logger.warning("Cross-encoder fell back to logistic regression reranker")
 
-        # 3. Predict relevance scores
-        scores = self.model.predict(X)
+        pending = [i for i, r in enumerate(results) if r is None]
+        if pending:
+            # 1. Compute feature vectors for every pending query
+            blocks = []
+            for i in pending:
+                req = requests[i]
+                blocks.append(np.vstack(self.feature_builder.build(
+                    query_emb=req["query_embedding"],
+                    doc_embs=req["doc_embeddings"],
+                    query_tokens=req["query_tokens"],
+                    doc_tokens_list=req["doc_tokens_list"],
+                    doc_texts=req["doc_texts"],
+                    query_text=req.get("query_text")
+                )))
+
+            # 2. Stack into one feature matrix and predict in one call
+            with pinned(self.cores):
+                scores = list(self.model.predict(np.vstack(blocks)))
+
+            # 3. Split scores back per query
+            offset = 0
+            for i, block in zip(pending, blocks):
+                results[i] = scores[offset:offset + len(block)]
+                offset += len(block)
+        return results
+
+    def rerank(
+        self,
+        query_embedding: np.ndarray,
+        doc_embeddings: List[np.ndarray],
+        query_tokens: Tokens,
+        doc_tokens_list: List[Tokens],
+        doc_texts: List[str],
+        query_text: Optional[str] = None,
+        doc_ids: Optional[List[str]] = None,
+        deadline: Optional[float] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Re-rank document texts by predicted relevance score.
+        Arguments are the same as for score().
+
+        Returns:
+            List of tuples (text, score), sorted by score descending
+        """
+        scores = self.score(
+            query_embedding, doc_embeddings, query_tokens, doc_tokens_list, doc_texts,
+            query_text=query_text, doc_ids=doc_ids, deadline=deadline
+        )
 
-        # 4. Zip texts and scores, sort by score descending
+        # Zip texts and scores, sort by score descending
         reranked = sorted(
             zip(doc_texts, scores), key=lambda x: x[1], reverse=True
         )
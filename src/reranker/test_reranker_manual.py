@@ -1,6 +1,7 @@
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from src.reranker.reranker import Reranker
+from src.reranker.tokenizer import TOKENIZER
 
 def to_numpy(vec):
     """Ensure embedding is a NumPy array."""
@@ -16,8 +17,8 @@ def run_example(query_text, doc_texts, reranker, embed_model):
     ]
 
     # 2) Токенизация
-    query_tokens = query_text.lower().split()
-    doc_tokens_list = [text.lower().split() for text in doc_texts]
+    query_tokens = TOKENIZER.encode(query_text)
+    doc_tokens_list = [TOKENIZER.encode(text) for text in doc_texts]
 
     # 3) Реранкинг
     ranked = reranker.rerank(
@@ -25,7 +26,8 @@ def run_example(query_text, doc_texts, reranker, embed_model):
         doc_embs,
         query_tokens,
         doc_tokens_list,
-        doc_texts
+        doc_texts,
+        query_text=query_text
     )
 
     # 4) Печать результатов
@@ -0,0 +1,90 @@
+import hashlib
+import re
+from typing import Iterable, List, Set
+
+import numpy as np
+
+from src.utils.lru_cache import LRUCache
+
+# Набор русскоязычных стоп-слов
+STOPWORDS: Set[str] = {
+    "и", "в", "во", "не", "что", "он", "на", "я", "с", "со", "как", "а", "то", "все", "она", "так",
+    "его", "но", "да", "ты", "к", "у", "же", "вы", "за", "бы", "по", "ее", "мне", "было", "вот", "от",
+    "меня", "еще", "нет", "о", "из", "ему", "теперь", "когда", "даже", "ну", "вдруг", "ли", "если",
+    "уже", "или", "ни", "быть", "был", "него", "до", "вас", "нибудь", "опять", "уж", "вам", "ведь",
+    "там", "потом", "себя", "ничего", "ей", "может", "они", "тут", "где", "есть", "надо", "ней",
+    "для", "мы", "тебя", "их", "чем", "была", "сам", "чтоб", "без", "будто", "чего", "раз", "тоже",
+    "себе", "под", "будет", "ж", "тогда", "кто", "этот"
+}
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# legacy: lowercase + whitespace split, punctuation kept (the shipped logreg model was trained on it)
+# words: lowercase, "ё" folded to "е", punctuation dropped (retrain the model with trainer.py first)
+MODES = ("legacy", "words")
+
+
+class Tokenizer:
+    """
+    Shared tokenization/normalization for lexical reranker features.
+
+    Each token maps to a stable signed 64-bit id (blake2b of the token),
+    so ids computed at ingestion can be stored in the DB and compared with
+    query ids in any process. Stored ids follow the active mode: after
+    switching modes, re-ingest videos so their token_ids match.
+    Token -> id lookups are memoized in a bounded LRU cache.
+    """
+
+    def __init__(self, stopwords: Iterable[str] = STOPWORDS, mode: str = "legacy", cache_size: int = 100_000) -> None:
+        self.set_mode(mode)
+        self._ids = LRUCache(maxsize=cache_size)
+        self.stopword_ids = np.unique(
+            np.array([self.token_id(w) for w in stopwords], dtype=np.int64)
+        )
+
+    def set_mode(self, mode: str) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown tokenizer mode: {mode}")
+        self.mode = mode
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return text.lower().replace("ё", "е")
+
+    @classmethod
+    def words(cls, text: str) -> List[str]:
+        """Normalized word tokens without punctuation, independent of the mode."""
+        return TOKEN_PATTERN.findall(cls.normalize(text))
+
+    def tokenize(self, text: str) -> List[str]:
+        """Split text into tokens according to the mode."""
+        if self.mode == "legacy":
+            return text.lower().split()
+        return self.words(text)
+
+    def token_id(self, token: str) -> int:
+        token_id = self._ids.get(token)
+        if token_id is None:
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            token_id = int.from_bytes(digest, "little", signed=True)
+            self._ids.put(token, token_id)
+        return token_id
+
+    def encode_tokens(self, tokens: Iterable[str]) -> np.ndarray:
+        """Map already split tokens to an int64 id array."""
+        return np.fromiter((self.token_id(t) for t in tokens), dtype=np.int64)
+
+    def encode(self, text: str) -> np.ndarray:
+        """Tokenize text and return its int64 id array (order and repeats kept)."""
+        return self.encode_tokens(self.tokenize(text))
+
+    def content_ids(self, ids: np.ndarray) -> np.ndarray:
+        """Unique non-stopword ids, sorted."""
+        return np.setdiff1d(np.unique(ids), self.stopword_ids, assume_unique=True)
+
+    def stopword_mask(self, ids: np.ndarray) -> np.ndarray:
+        return np.isin(ids, self.stopword_ids)
+
+
+# Shared process-wide instance
+TOKENIZER = Tokenizer()
@@ -7,12 +7,19 @@ from sentence_transformers import SentenceTransformer
 import joblib
 
 from src.reranker.features import FeatureBuilder
+from src.reranker.tokenizer import TOKENIZER
+from src.utils.config_loader import ConfigLoader
+from src.utils.logger_loader import LoggerLoader
 
 
 def main(
     train_path: str = "downloads/reranker/train_data.json",
-    model_out: str = "models/reranker/logreg_reranker.pkl"
+    model_out: str = "models/reranker/logreg_reranker.pkl",
+    tokenizer_mode: str = "legacy"
 ):
+    # Режим токенизатора должен совпадать с reranker.tokenizer в конфиге
+    TOKENIZER.set_mode(tokenizer_mode)
+
     # 1. Загрузка размеченного датасета
     with open(train_path, encoding="utf-8") as f:
         raw = json.load(f)
@@ -40,9 +47,9 @@ def main(
     q_embs = emb_model.encode(queries, convert_to_tensor=False)
     d_embs = emb_model.encode(texts,  convert_to_tensor=False)
 
-    # Токенизация для фич
-    q_tokens = [q.lower().split() for q in queries]
-    d_tokens = [t.lower().split() for t in texts]
+    # Токенизация для фич (тот же токенизатор, что и при инференсе)
+    q_tokens = [TOKENIZER.encode(q) for q in queries]
+    d_tokens = [TOKENIZER.encode(t) for t in texts]
 
     # 3. Построение признаков через FeatureBuilder
     fb = FeatureBuilder()
@@ -53,7 +60,8 @@ def main(
             doc_embs=[d_embs[i]],
             query_tokens=q_tokens[i],
             doc_tokens_list=[d_tokens[i]],
-            doc_texts=[texts[i]]
+            doc_texts=[texts[i]],
+            query_text=queries[i]
         )
         X_list.append(feats[0])  # единственный вектор из списка
 
@@ -70,4 +78,5 @@ def main(
 
 
 if __name__ == "__main__":
+    LoggerLoader.configure(ConfigLoader.get_config())
     main()
@@ -0,0 +1,146 @@
+from typing import Any, List, Optional, Tuple
+
+from src.utils.db_connector import connection_params
+from src.utils.logger_loader import LoggerLoader
+
+logger = LoggerLoader.get_logger(__name__)
+
+SEARCH_SQL = """
+    SELECT text,
+           1 - (embedding <=> $1::vector) AS similarity,
+           token_ids,
+           embedding,
+           start_time,
+           end_time,
+           video_id,
+           id::text
+      FROM subtitles
+     WHERE $2::text IS NULL OR video_id = $2
+     ORDER BY embedding <=> $1::vector
+     LIMIT $3
+"""
+
+SEARCH_BATCH_SQL = """
+    SELECT q.idx,
+           s.text, s.similarity, s.token_ids, s.embedding,
+           s.start_time, s.end_time, s.video_id, s.id
+      FROM unnest($1::vector[]) WITH ORDINALITY AS q(vec, idx)
+     CROSS JOIN LATERAL (
+           SELECT text,
+                  1 - (embedding <=> q.vec) AS similarity,
+                  token_ids,
+                  embedding,
+                  start_time,
+                  end_time,
+                  video_id,
+                  id::text AS id
+             FROM subtitles
+            WHERE $2::text IS NULL OR video_id = $2
+            ORDER BY embedding <=> q.vec
+            LIMIT $3
+     ) s
+     ORDER BY q.idx, s.similarity DESC
+"""
+
+
+def encode_vector(value: Any) -> str:
+    """Значение для pgvector в текстовом формате '[0.1,0.2,...]'."""
+    if hasattr(value, "tolist"):
+        value = value.tolist()
+    return "[" + ",".join(map(str, value)) + "]"
+
+
+def decode_vector(text: str) -> List[float]:
+    return [float(x) for x in text.strip("[]").split(",")] if text.strip("[]") else []
+
+
+class AsyncDBConnector:
+    """
+    Асинхронный доступ к той же таблице subtitles через пул asyncpg.
+    Используется async-эндпоинтами для чтения (проверка субтитров, векторный поиск),
+    чтобы ожидание БД не занимало поток. Строки результатов совпадают по формату
+    с DBConnector.
+    """
+
+    def __init__(self, min_size: int = 2, max_size: int = 10) -> None:
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+
+    async def connect(self) -> None:
+        """Создать пул соединений (с кодеком pgvector на каждом соединении)."""
+        import asyncpg
+
+        try:
+            logger.info("Инициализация асинхронного пула соединений...")
+            params = connection_params()
+            self._pool = await asyncpg.create_pool(
+                user=params["user"],
+                password=params["password"],
+                host=params["host"],
+                port=params["port"],
+                database=params["dbname"],
+                min_size=self.min_size,
+                max_size=self.max_size,
+                init=self._init_connection,
+            )
+            logger.info("Асинхронный пул соединений создан.")
+        except Exception as error:
+            logger.error(f"Ошибка при создании асинхронного пула: {error}")
+            raise
+
+    @staticmethod
+    async def _init_connection(conn) -> None:
+        await conn.set_type_codec(
+            "vector", schema="public", encoder=encode_vector, decoder=decode_vector, format="text"
+        )
+
+    async def close(self) -> None:
+        """Закрыть пул."""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+            logger.info("Асинхронный пул соединений закрыт.")
+
+    def _require_pool(self):
+        if self._pool is None:
+            raise RuntimeError("Асинхронный пул соединений не инициализирован.")
+        return self._pool
+
+    async def has_subtitles(self, video_id: str) -> bool:
+        """Есть ли в БД субтитры видео."""
+        pool = self._require_pool()
+        row = await pool.fetchval("SELECT 1 FROM subtitles WHERE video_id = $1 LIMIT 1;", video_id)
+        return row is not None
+
+    async def search_similar_embeddings(
+            self, embedding: List[float], top_k: int = 5, video_id: Optional[str] = None
+    ) -> List[Tuple]:
+        """
+        Поиск похожих субтитров по embedding, формат строк как у
+        DBConnector.search_similar_embeddings.
+        """
+        pool = self._require_pool()
+        try:
+            rows = await pool.fetch(SEARCH_SQL, embedding, video_id, top_k)
+            return [tuple(row) for row in rows]
+        except Exception as error:
+            logger.error(f"Ошибка при асинхронном поиске эмбеддингов: {error}")
+            return []
+
+    async def search_similar_embeddings_batch(
+            self, embeddings: List[List[float]], top_k: int = 5, video_id: Optional[str] = None
+    ) -> List[List[Tuple]]:
+        """Пакетный поиск одним запросом, как DBConnector.search_similar_embeddings_batch."""
+        results: List[List[Tuple]] = [[] for _ in embeddings]
+        if not embeddings:
+            return results
+        pool = self._require_pool()
+        try:
+            rows = await pool.fetch(SEARCH_BATCH_SQL, list(embeddings), video_id, top_k)
+        except Exception as error:
+            logger.error(f"Ошибка при асинхронном пакетном поиске: {error}")
+            return results
+        for idx, *row in (tuple(r) for r in rows):
+            results[idx - 1].append(tuple(row))
+        return results
@@ -0,0 +1,217 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from src.utils.logger_loader import LoggerLoader
+from src.utils.metrics import REGISTRY
+
+
+class PoolTimeoutError(RuntimeError):
+    """Свободное соединение не появилось за отведённое время."""
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений (интерфейс как у psycopg2-пулов:
+    getconn / putconn / closeall).
+
+    - При исчерпании пула getconn ждёт освобождения соединения не дольше acquire_timeout.
+    - Соединение, простоявшее без дела дольше ping_after секунд, перед выдачей
+      проверяется запросом SELECT 1; сломанное заменяется новым.
+    - Соединения старше max_lifetime секунд пересоздаются при возврате/выдаче.
+    """
+
+    def __init__(
+            self,
+            connect: Callable[[], Any],
+            minconn: int = 1,
+            maxconn: int = 10,
+            acquire_timeout: Optional[float] = 30.0,
+            ping_after: Optional[float] = 30.0,
+            max_lifetime: Optional[float] = 3600.0
+    ) -> None:
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Некорректные размеры пула")
+        self.logger = LoggerLoader.get_logger(__name__)
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.ping_after = ping_after
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        self._idle: List[Any] = []  # стек: свежие соединения сверху
+        self._used: Dict[int, Any] = {}
+        self._created_at: Dict[int, float] = {}
+        self._released_at: Dict[int, float] = {}
+        self._pending = 0
+        self._waiting = 0
+        self._closed = False
+
+        self.in_use_gauge = REGISTRY.gauge("db_pool_in_use", "Connections handed out")
+        self.idle_gauge = REGISTRY.gauge("db_pool_idle", "Idle connections in the pool")
+        self.waiting_gauge = REGISTRY.gauge("db_pool_waiting", "Threads waiting for a connection")
+        self.acquire_hist = REGISTRY.histogram("db_pool_acquire_seconds", "Time to acquire a connection")
+        self.timeouts = REGISTRY.counter("db_pool_timeouts_total", "Acquire attempts that timed out")
+        self.replaced = REGISTRY.counter("db_pool_replaced_total", "Connections closed and replaced")
+
+        for _ in range(minconn):
+            conn = self._open()
+            self._idle.append(conn)
+            self._released_at[id(conn)] = time.monotonic()
+        self._update_gauges()
+
+    # ----- внутренние операции -----
+
+    def _open(self) -> Any:
+        conn = self._connect()
+        self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn: Any, reason: str) -> None:
+        self._created_at.pop(id(conn), None)
+        self._released_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self.replaced.inc(reason=reason)
+
+    def _expired(self, conn: Any) -> bool:
+        created = self._created_at.get(id(conn))
+        return (
+            self.max_lifetime is not None
+            and created is not None
+            and time.monotonic() - created > self.max_lifetime
+        )
+
+    def _alive(self, conn: Any) -> bool:
+        """Проверка соединения перед выдачей (только для долго простаивавших)."""
+        if getattr(conn, "closed", False):
+            return False
+        released = self._released_at.get(id(conn))
+        if self.ping_after is None or released is None or time.monotonic() - released < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except Exception as error:
+            self.logger.warning(f"Соединение не прошло проверку и будет заменено: {error}")
+            return False
+
+    def _update_gauges(self) -> None:
+        self.in_use_gauge.set(len(self._used))
+        self.idle_gauge.set(len(self._idle))
+        self.waiting_gauge.set(self._waiting)
+
+    # ----- публичный интерфейс -----
+
+    def getconn(self, timeout: Optional[float] = None) -> Any:
+        """
+        Выдать соединение: свободное из пула, новое (если не достигнут maxconn)
+        или дождаться возврата. PoolTimeoutError, если ждать пришлось дольше timeout.
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Пул соединений закрыт.")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if len(self._used) + self._pending < self.maxconn:
+                    conn = None
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.timeouts.inc()
+                    raise PoolTimeoutError(f"Нет свободного соединения за {timeout:.1f} с")
+                self._waiting += 1
+                self._update_gauges()
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            # место в пуле занято, пока соединение проверяется или открывается
+            self._pending += 1
+
+        # Подключение и ping — вне блокировки, чтобы не держать остальных
+        try:
+            if conn is not None:
+                if self._expired(conn):
+                    self._discard(conn, "expired")
+                    conn = None
+                elif not self._alive(conn):
+                    self._discard(conn, "broken")
+                    conn = None
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            with self._cond:
+                self._pending -= 1
+                self._update_gauges()
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._pending -= 1
+            self._used[id(conn)] = conn
+            self._update_gauges()
+        self.acquire_hist.observe(time.monotonic() - start)
+        return conn
+
+    def putconn(self, conn: Any, close: bool = False) -> None:
+        """Вернуть соединение; закрытые, сломанные и устаревшие не возвращаются в пул."""
+        with self._cond:
+            if self._used.pop(id(conn), None) is None:
+                raise ValueError("Соединение не принадлежит пулу")
+            broken = close or self._closed or getattr(conn, "closed", False)
+            if not broken:
+                try:
+                    # незавершённая транзакция не должна достаться следующему
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            if broken or self._expired(conn):
+                self._discard(conn, "broken" if broken else "expired")
+            else:
+                self._idle.append(conn)
+                self._released_at[id(conn)] = time.monotonic()
+            self._update_gauges()
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """with pool.connection() as conn: ... — соединение возвращается в любом случае."""
+        conn = self.getconn(timeout=timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self) -> None:
+        """Закрыть свободные соединения; выданные закроются при возврате."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop(), "shutdown")
+            self._update_gauges()
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "minconn": self.minconn,
+                "maxconn": self.maxconn,
+                "in_use": len(self._used),
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "acquire_count": self.acquire_hist.count(),
+                "acquire_seconds_total": round(self.acquire_hist.sum(), 6),
+            }
@@ -1,42 +1,51 @@
 import os
-from typing import List, Tuple, Optional
-from psycopg2.pool import SimpleConnectionPool
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple, Optional
+import psycopg2
 from psycopg2.extensions import connection as PGConnection
 from dotenv import load_dotenv
+from src.utils.config_loader import ConfigLoader
+from src.utils.connection_pool import ConnectionPool
 from src.utils.logger_loader import LoggerLoader
 
 
-load_dotenv()
-logger = LoggerLoader.get_logger()
+logger = LoggerLoader.get_logger(__name__)
 
-USER = os.getenv("USER")  # Если USER нет в .env, используем "default_user"
-PASSWORD = os.getenv("SUPABASE_KEY")
-HOST = os.getenv("HOST")
-PORT = int(os.getenv("PORT"))  # Если PORT нет в .env, используем 5432
-DBNAME = os.getenv("DBNAME")
 
-
-print(f"USER: {USER}")
-print(f"HOST: {HOST}")
-print(f"PORT: {PORT}")
-print(f"DBNAME: {DBNAME}")
+def connection_params() -> Dict[str, Any]:
+    """Параметры подключения из окружения (.env читается здесь, а не при импорте модуля)."""
+    load_dotenv()
+    return {
+        "user": os.getenv("USER"),
+        "password": os.getenv("SUPABASE_KEY"),
+        "host": os.getenv("HOST"),
+        "port": int(os.getenv("PORT") or 5432),
+        "dbname": os.getenv("DBNAME"),
+    }
 
 
 class DBConnector:
-    def __init__(self) -> None:
-        self._pool: Optional[SimpleConnectionPool] = None
+    def __init__(self, pool_config: Optional[Dict[str, Any]] = None) -> None:
+        """
+        pool_config — секция database.pool конфига: minconn, maxconn, acquire_timeout,
+        ping_after (простой в секундах, после которого соединение проверяется SELECT 1)
+        и max_lifetime (возраст в секундах, после которого соединение пересоздаётся).
+        """
+        self._pool: Optional[ConnectionPool] = None
+        if pool_config is None:
+            pool_config = ConfigLoader.get_config().get("database", {}).get("pool", {})
 
         try:
-            logger.info("Инициализация пула соединений...")
-
-            self._pool = SimpleConnectionPool(
-                minconn=1,
-                maxconn=10,
-                user=USER,
-                password=PASSWORD,
-                host=HOST,
-                port=PORT,
-                dbname=DBNAME,
+            params = connection_params()
+            logger.info(f"Инициализация пула соединений к {params['host']}:{params['port']}/{params['dbname']}...")
+
+            self._pool = ConnectionPool(
+                connect=lambda: psycopg2.connect(**params),
+                minconn=pool_config.get("minconn", 1),
+                maxconn=pool_config.get("maxconn", 10),
+                acquire_timeout=pool_config.get("acquire_timeout", 30.0),
+                ping_after=pool_config.get("ping_after", 30.0),
+                max_lifetime=pool_config.get("max_lifetime", 3600.0),
             )
 
             if self._pool:
@@ -50,12 +59,12 @@ class DBConnector:
             raise
 
     def get_connection(self) -> PGConnection:
-        """Получить соединение из пула."""
+        """Получить соединение из пула (ждёт свободное не дольше acquire_timeout)."""
         try:
             if not self._pool:
                 raise RuntimeError("Пул соединений не инициализирован.")
             conn = self._pool.getconn()
-            logger.info("Соединение получено из пула.")
+            logger.debug("Соединение получено из пула.")
             return conn
         except Exception as error:
             logger.error(f"Ошибка при получении соединения: {error}")
@@ -66,10 +75,25 @@ class DBConnector:
         try:
             if self._pool and connection:
                 self._pool.putconn(connection)
-                logger.info("Соединение возвращено в пул.")
+                logger.debug("Соединение возвращено в пул.")
         except Exception as error:
             logger.error(f"Ошибка при возврате соединения: {error}")
 
+    @contextmanager
+    def connection(self) -> Iterator[PGConnection]:
+        """with db.connection() as conn: ... — соединение возвращается в пул в любом случае."""
+        conn = self.get_connection()
+        try:
+            yield conn
+        finally:
+            self.release_connection(conn)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Состояние пула: размеры, занятые, свободные, ожидающие, время получения."""
+        if not self._pool:
+            return {}
+        return self._pool.stats()
+
     def close(self) -> None:
         """Закрыть все соединения пула."""
         try:
@@ -95,6 +119,7 @@ class DBConnector:
                     self.create_subtitles_table(conn)
                 else:
                     logger.info("Таблица 'subtitles' уже существует.")
+                    self.ensure_columns(conn)
 
             #Проверка существования индексов
             self.release_connection(conn)
@@ -109,6 +134,16 @@ class DBConnector:
             if conn:
                 self.release_connection(conn)
 
+    def ensure_columns(self, connection: PGConnection) -> None:
+        """Добавить колонки, появившиеся после создания таблицы."""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("ALTER TABLE subtitles ADD COLUMN IF NOT EXISTS token_ids BIGINT[];")
+            connection.commit()
+        except Exception as error:
+            logger.error(f"Ошибка при миграции таблицы: {error}")
+            connection.rollback()
+
     def ensure_indexes(self) -> None:
         """Создать индекс на video_id и IVFFlat-индекс на embedding, если их нет."""
         conn = self.get_connection()
@@ -163,7 +198,8 @@ class DBConnector:
                         start_time FLOAT NOT NULL,
                         end_time FLOAT NOT NULL,
                         text TEXT NOT NULL,
-                        embedding VECTOR(768)
+                        embedding VECTOR(768),
+                        token_ids BIGINT[]
                     );
                 """)
                 connection.commit()
@@ -174,17 +210,17 @@ class DBConnector:
 
     def insert_subtitle(
             self, video_id: str, start_time: float, end_time: float,
-            text: str, embedding: List[float]
+            text: str, embedding: List[float], token_ids: Optional[List[int]] = None
     ) -> None:
-        """Добавить субтитры в таблицу."""
+        """Добавить субтитры в таблицу (token_ids — id токенов из Tokenizer.encode)."""
         conn = None
         try:
             conn = self.get_connection()
             with conn.cursor() as cursor:
                 cursor.execute("""
-                    INSERT INTO subtitles (video_id, start_time, end_time, text, embedding)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (video_id, start_time, end_time, text, embedding))
+                    INSERT INTO subtitles (video_id, start_time, end_time, text, embedding, token_ids)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (video_id, start_time, end_time, text, embedding, token_ids))
                 conn.commit()
 
             logger.info(f"Субтитры для {video_id} успешно добавлены.")
@@ -196,9 +232,13 @@ class DBConnector:
             if conn:
                 self.release_connection(conn)
 
-    def search_similar_embeddings(self, embedding: List[float], top_k: int = 5) -> List[Tuple[str, float]]:
+    def search_similar_embeddings(
+            self, embedding: List[float], top_k: int = 5, video_id: Optional[str] = None
+    ) -> List[Tuple[str, float, Optional[List[int]], str, float, float, str, str]]:
         """
-        Поиск похожих субтитров по embedding.
+        Поиск похожих субтитров по embedding (в пределах video_id, если он задан).
+        Возвращает строки (text, similarity, token_ids, embedding, start_time, end_time, video_id, id),
+        embedding — текстовое представление pgvector вида '[0.1,0.2,...]'.
         """
         conn = None
         try:
@@ -206,16 +246,24 @@ class DBConnector:
             with conn.cursor() as cursor:
                 # собираем строку вида '[0.1,0.2,0.3]'
                 vector_text = "[" + ",".join(map(str, embedding)) + "]"
-                # передаем vector_text как параметр, а в SQL делаем ::vector
+                # передаем vector_text как параметр, а в SQL делаем ::vector;
+                # сортируем по самому расстоянию (ASC), иначе ivfflat-индекс не используется
                 cursor.execute(
                     """
                     SELECT text,
-                           1 - (embedding <#> %s::vector) AS similarity
+                           1 - (embedding <=> %s::vector) AS similarity,
+                           token_ids,
+                           embedding,
+                           start_time,
+                           end_time,
+                           video_id,
+                           id::text
                       FROM subtitles
-                     ORDER BY similarity DESC
+                     WHERE %s::text IS NULL OR video_id = %s
+                     ORDER BY embedding <=> %s::vector
                      LIMIT %s
                     """,
-                    (vector_text, top_k),
+                    (vector_text, video_id, video_id, vector_text, top_k),
                 )
                 return cursor.fetchall()
 
@@ -227,6 +275,182 @@ class DBConnector:
             if conn:
                 self.release_connection(conn)
 
+    def search_similar_embeddings_batch(
+            self, embeddings: List[List[float]], top_k: int = 5, video_id: Optional[str] = None
+    ) -> List[List[Tuple[str, float, Optional[List[int]], str, float, float, str, str]]]:
+        """
+        Поиск для нескольких запросов одним SQL-запросом (unnest + LATERAL).
+        Возвращает для каждого embedding (в исходном порядке) строки того же вида,
+        что и search_similar_embeddings.
+        """
+        conn = None
+        results: List[List[Tuple]] = [[] for _ in embeddings]
+        if not embeddings:
+            return results
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                vectors = ["[" + ",".join(map(str, emb)) + "]" for emb in embeddings]
+                cursor.execute(
+                    """
+                    SELECT q.idx,
+                           s.text, s.similarity, s.token_ids, s.embedding,
+                           s.start_time, s.end_time, s.video_id, s.id
+                      FROM unnest(%s::text[]) WITH ORDINALITY AS q(vec, idx)
+                     CROSS JOIN LATERAL (
+                           SELECT text,
+                                  1 - (embedding <=> q.vec::vector) AS similarity,
+                                  token_ids,
+                                  embedding,
+                                  start_time,
+                                  end_time,
+                                  video_id,
+                                  id::text AS id
+                             FROM subtitles
+                            WHERE %s::text IS NULL OR video_id = %s
+                            ORDER BY embedding <=> q.vec::vector
+                            LIMIT %s
+                     ) s
+                     ORDER BY q.idx, s.similarity DESC
+                    """,
+                    (vectors, video_id, video_id, top_k),
+                )
+                for idx, *row in cursor.fetchall():
+                    results[idx - 1].append(tuple(row))
+            return results
+
+        except Exception as error:
+            logger.error(f"Ошибка при пакетном поиске эмбеддингов: {error}")
+            return [[] for _ in embeddings]
+
+        finally:
+            if conn:
+                self.release_connection(conn)
+
+    def ensure_answer_cache_table(self) -> None:
+        """Создать таблицу кэша ответов, если её нет."""
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS answer_cache (
+                        video_id TEXT NOT NULL,
+                        query_norm TEXT NOT NULL,
+                        config_hash TEXT NOT NULL,
+                        answer TEXT NOT NULL,
+                        query_embedding VECTOR(768),
+                        entities TEXT NOT NULL DEFAULT '',
+                        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                        PRIMARY KEY (video_id, query_norm, config_hash)
+                    );
+                """)
+                cursor.execute("ALTER TABLE answer_cache ADD COLUMN IF NOT EXISTS entities TEXT NOT NULL DEFAULT '';")
+                conn.commit()
+            logger.info("Таблица 'answer_cache' создана или уже существует.")
+        except Exception as error:
+            logger.error(f"Ошибка при создании таблицы кэша ответов: {error}")
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                self.release_connection(conn)
+
+    def fetch_cached_answer(
+            self, video_id: str, query_norm: str, config_hash: str, ttl: Optional[float] = None
+    ) -> Optional[str]:
+        """Точный поиск ответа в кэше (ttl — возраст записи в секундах)."""
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT answer FROM answer_cache
+                     WHERE video_id = %s AND query_norm = %s AND config_hash = %s
+                       AND (%s::float IS NULL OR created_at > now() - %s::float * interval '1 second')
+                """, (video_id, query_norm, config_hash, ttl, ttl))
+                row = cursor.fetchone()
+            return row[0] if row else None
+        except Exception as error:
+            logger.error(f"Ошибка при чтении кэша ответов: {error}")
+            return None
+        finally:
+            if conn:
+                self.release_connection(conn)
+
+    def fetch_similar_cached_answer(
+            self, video_id: str, config_hash: str, embedding: List[float],
+            threshold: float, ttl: Optional[float] = None, entities: str = ""
+    ) -> Optional[Tuple[str, float]]:
+        """
+        Ближайший по косинусу закэшированный вопрос того же видео с теми же сущностями
+        (числа, имена), если сходство >= threshold.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                vector_text = "[" + ",".join(map(str, embedding)) + "]"
+                cursor.execute("""
+                    SELECT answer, 1 - (query_embedding <=> %s::vector) AS similarity
+                      FROM answer_cache
+                     WHERE video_id = %s AND config_hash = %s AND entities = %s
+                       AND query_embedding IS NOT NULL
+                       AND (%s::float IS NULL OR created_at > now() - %s::float * interval '1 second')
+                     ORDER BY query_embedding <=> %s::vector
+                     LIMIT 1
+                """, (vector_text, video_id, config_hash, entities, ttl, ttl, vector_text))
+                row = cursor.fetchone()
+            if row and row[1] >= threshold:
+                return row[0], float(row[1])
+            return None
+        except Exception as error:
+            logger.error(f"Ошибка при семантическом поиске в кэше ответов: {error}")
+            return None
+        finally:
+            if conn:
+                self.release_connection(conn)
+
+    def upsert_cached_answer(
+            self, video_id: str, query_norm: str, config_hash: str,
+            answer: str, embedding: Optional[List[float]] = None, entities: str = ""
+    ) -> None:
+        """Сохранить ответ в кэш (перезаписывает запись с тем же ключом)."""
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                vector_text = "[" + ",".join(map(str, embedding)) + "]" if embedding is not None else None
+                cursor.execute("""
+                    INSERT INTO answer_cache (video_id, query_norm, config_hash, answer, query_embedding, entities)
+                    VALUES (%s, %s, %s, %s, %s::vector, %s)
+                    ON CONFLICT (video_id, query_norm, config_hash)
+                    DO UPDATE SET answer = EXCLUDED.answer,
+                                  query_embedding = EXCLUDED.query_embedding,
+                                  entities = EXCLUDED.entities,
+                                  created_at = now()
+                """, (video_id, query_norm, config_hash, answer, vector_text, entities))
+                conn.commit()
+        except Exception as error:
+            logger.error(f"Ошибка при записи в кэш ответов: {error}")
+        finally:
+            if conn:
+                self.release_connection(conn)
+
+    def delete_cached_answers(self, video_id: str) -> None:
+        """Удалить закэшированные ответы по видео (после повторной загрузки субтитров)."""
+        conn = None
+        try:
+            conn = self.get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM answer_cache WHERE video_id = %s;", (video_id,))
+                conn.commit()
+        except Exception as error:
+            logger.error(f"Ошибка при очистке кэша ответов: {error}")
+        finally:
+            if conn:
+                self.release_connection(conn)
+
     def drop_table(self) -> None:
         """Удалить таблицу 'subtitles'."""
         conn = None
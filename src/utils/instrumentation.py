@@ -0,0 +1,146 @@
+import time
+from typing import Any, Dict, Optional
+
+from src.utils.metrics import REGISTRY
+
+# Длительности этапов: от миллисекунд (поиск, промпт) до минут (загрузка субтитров, генерация)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+STAGE_SECONDS = REGISTRY.histogram("rag_stage_seconds", "Duration of pipeline stages", buckets=STAGE_BUCKETS)
+STAGE_ERRORS = REGISTRY.counter("rag_stage_errors_total", "Pipeline stages that raised")
+PROMPT_TOKENS = REGISTRY.counter("llm_prompt_tokens_total", "Prompt tokens sent to the LLM")
+COMPLETION_TOKENS = REGISTRY.counter("llm_completion_tokens_total", "Tokens generated by the LLM")
+COMPLETION_TOKENS_HIST = REGISTRY.histogram(
+    "llm_completion_tokens", "Generated tokens per request", buckets=TOKEN_BUCKETS
+)
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "llm_tokens_per_second", "Decode speed per request", buckets=RATE_BUCKETS
+)
+
+_enabled = True
+
+
+def configure(config: Dict[str, Any]) -> None:
+    """Включить/выключить замеры по секции instrumentation конфига."""
+    set_enabled(config.get("instrumentation", {}).get("enabled", True))
+
+
+def set_enabled(flag: bool) -> None:
+    global _enabled
+    _enabled = bool(flag)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+class _Span:
+    """Замер одного этапа: время уходит в rag_stage_seconds{stage}, исключение — в rag_stage_errors_total."""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str) -> None:
+        self.stage = stage
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, stage=self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.stage)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage: str):
+    """
+    with span("db_search"): ... — замер этапа пайплайна.
+    В выключенном режиме возвращается общий пустой контекст без вызовов таймера.
+    """
+    return _Span(stage) if _enabled else _NOOP_SPAN
+
+
+def record_generation(
+        backend: str,
+        prompt_tokens: Optional[int],
+        completion_tokens: int,
+        prefill_seconds: Optional[float],
+        decode_seconds: float
+) -> None:
+    """Метрики одной генерации: prefill/decode как этапы, счётчики токенов, скорость декодирования."""
+    if not _enabled:
+        return
+    if prefill_seconds is not None:
+        STAGE_SECONDS.observe(prefill_seconds, stage="prefill")
+    STAGE_SECONDS.observe(decode_seconds, stage="decode")
+    if prompt_tokens is not None:
+        PROMPT_TOKENS.inc(prompt_tokens, backend=backend)
+    COMPLETION_TOKENS.inc(completion_tokens, backend=backend)
+    COMPLETION_TOKENS_HIST.observe(completion_tokens, backend=backend)
+    if decode_seconds > 0 and completion_tokens > 0:
+        TOKENS_PER_SECOND.observe(completion_tokens / decode_seconds, backend=backend)
+
+
+class GenerationMeter:
+    """
+    Замер генерации по потоку токенов: время до первого токена — prefill,
+    остальное — decode. Бэкенд вызывает token() на каждый токен/кусок и finish() в конце.
+    """
+
+    active = True
+
+    def __init__(self, backend: str) -> None:
+        self.backend = backend
+        self.start = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.tokens = 0
+
+    def token(self, count: int = 1) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += count
+
+    def finish(self, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None) -> None:
+        end = time.perf_counter()
+        first = self.first_token_at if self.first_token_at is not None else end
+        record_generation(
+            self.backend,
+            prompt_tokens,
+            self.tokens if completion_tokens is None else completion_tokens,
+            first - self.start,
+            end - first,
+        )
+
+
+class _NoopMeter:
+    active = False
+
+    def token(self, count: int = 1) -> None:
+        pass
+
+    def finish(self, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None) -> None:
+        pass
+
+
+_NOOP_METER = _NoopMeter()
+
+
+def generation_meter(backend: str):
+    """GenerationMeter или пустая заглушка в выключенном режиме (meter.active — считать ли токены промпта)."""
+    return GenerationMeter(backend) if _enabled else _NOOP_METER
@@ -1,13 +1,147 @@
+import atexit
+import contextvars
+import copy
+import functools
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
 from dotenv import load_dotenv
 
-# Загружаем переменные из .env
-load_dotenv()
+from src.utils.metrics import REGISTRY
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] - %(message)s"
+
+DROPPED_RECORDS = REGISTRY.counter("log_records_dropped_total", "Log records dropped on a full log queue")
+
+# Идентификатор текущего запроса: contextvars переходят в asyncio-задачи, to_thread и run_in_threadpool;
+# для своих пулов потоков — bind_request_id
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def set_request_id(request_id: Optional[str]) -> contextvars.Token:
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token: contextvars.Token) -> None:
+    _request_id.reset(token)
+
+
+def bind_request_id(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Обернуть fn так, чтобы в любом потоке она выполнялась с request id вызывающего.
+    Копируется значение, а не контекст: обёртку можно одновременно звать из нескольких потоков.
+    """
+    request_id = _request_id.get()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _request_id.set(request_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _request_id.reset(token)
+
+    return wrapper
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавляет к записи request_id текущего контекста (выполняется в потоке, который пишет лог)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get() or "-"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает каждую every-ю запись уровня не выше level с одного места в коде
+    (файл + строка): частые отладочные события не заваливают очередь.
+    """
+
+    def __init__(self, every: int = 1, level: int = logging.DEBUG) -> None:
+        super().__init__()
+        self.every = every
+        self.level = level
+        self._seen: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every <= 1 or record.levelno > self.level:
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+        return seen % self.every == 0
+
+
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна JSON-строка; поля из extra= попадают в объект как есть."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "thread": record.threadName,
+            "location": f"{record.module}:{record.lineno}",
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который не блокирует поток запроса: при полной очереди запись
+    отбрасывается (log_records_dropped_total). Сообщение и трейсбек собираются здесь,
+    форматирование и запись на диск — в потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED_RECORDS.inc()
+
 
 class LoggerLoader:
     """
     Синглтон для настройки логирования.
+
+    Корневой логгер пишет в очередь (QueueHandler), а консоль и файл обслуживает
+    фоновый QueueListener — поток запроса не ждёт диска. configure() применяет
+    секцию logging конфига: формат text/json, уровни по модулям, сэмплирование DEBUG.
     """
     _instance = None  # Храним единственный экземпляр
 
@@ -19,27 +153,70 @@ class LoggerLoader:
 
     def _initialize(self, log_level: str):
         """Настраивает логгер при первом создании."""
+        # Переменные из .env (LOG_FILE, LOG_LEVEL, LOG_FORMAT)
+        load_dotenv()
         self.logger = logging.getLogger()
+        self.listener: Optional[logging.handlers.QueueListener] = None
 
         if not self.logger.hasHandlers():  # Чтобы не добавлять хендлеры повторно
-            self.logger.setLevel(self._get_log_level(log_level))
-
-            # Формат логов
-            formatter = logging.Formatter(
-                "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-            )
-
-            # Лог в консоль
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
-
-            # Лог в файл (если указан)
-            log_file = os.getenv("LOG_FILE", "logs/app.log")
-            os.makedirs(os.path.dirname(log_file), exist_ok=True)
-            file_handler = logging.FileHandler(log_file)
+            self.logger.setLevel(self._get_log_level(os.getenv("LOG_LEVEL", log_level)))
+            self.sampling = SamplingFilter()
+            self.queue: queue.Queue = queue.Queue(maxsize=10000)
+            self.queue_handler = _QueueHandler(self.queue)
+            self.queue_handler.addFilter(RequestIdFilter())
+            self.queue_handler.addFilter(self.sampling)
+            self.logger.addHandler(self.queue_handler)
+            self._start_listener(os.getenv("LOG_FORMAT", "text"), os.getenv("LOG_FILE", "logs/app.log"))
+            atexit.register(self.stop)
+
+    def _start_listener(self, fmt: str, log_file: Optional[str]) -> None:
+        formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+
+        # Лог в консоль
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        handlers = [console_handler]
+
+        # Лог в файл (если указан)
+        if log_file:
+            os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+            # файл открывается при первой записи: перезапуск в configure() не оставляет пустых файлов
+            file_handler = logging.FileHandler(log_file, delay=True)
             file_handler.setFormatter(formatter)
-            self.logger.addHandler(file_handler)
+            handlers.append(file_handler)
+
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self) -> None:
+        """Дописать очередь и закрыть файлы (вызывается при выходе из процесса)."""
+        if self.listener is None:
+            return
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        self.listener = None
+
+    @classmethod
+    def configure(cls, config: Dict[str, Any]) -> None:
+        """
+        Применить секцию logging конфига: level, format (text/json), file,
+        levels (уровни по именам логгеров), sampling.debug_every.
+        """
+        loader = cls()
+        if not hasattr(loader, "queue_handler"):
+            # Логирование уже настроено снаружи (например, в тестах) — не вмешиваемся
+            return
+        log_cfg = config.get("logging", {})
+        loader.logger.setLevel(cls._get_log_level(os.getenv("LOG_LEVEL", log_cfg.get("level", "INFO"))))
+        for name, level in log_cfg.get("levels", {}).items():
+            logging.getLogger(name).setLevel(cls._get_log_level(level))
+        loader.sampling.every = int(log_cfg.get("sampling", {}).get("debug_every", 1))
+        loader.stop()
+        loader._start_listener(
+            os.getenv("LOG_FORMAT", log_cfg.get("format", "text")),
+            os.getenv("LOG_FILE", log_cfg.get("file", "logs/app.log"))
+        )
 
     @staticmethod
     def _get_log_level(level: str):
@@ -54,12 +231,18 @@ class LoggerLoader:
         return levels.get(level.upper(), logging.INFO)
 
     @classmethod
-    def get_logger(cls):
-        """Возвращает синглтон-логгер."""
-        if cls._instance is None:
-            cls()
-        return cls._instance.logger
+    def get_logger(cls, name: Optional[str] = None):
+        """
+        Логгер модуля (get_logger(__name__)) или корневой. Обработчики висят на корневом,
+        так что модульные логгеры отличаются только уровнем из logging.levels.
+
+        Сам вызов ничего не настраивает: модули зовут его при импорте, а очередь,
+        поток записи и файл лога поднимает приложение при старте (configure()
+        или LoggerLoader()).
+        """
+        return logging.getLogger(name)
 
 if __name__ == "__main__":
+    LoggerLoader()
     logger = LoggerLoader.get_logger()
     logger.info("Logger initialized successfully!")
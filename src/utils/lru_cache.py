@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+
+class LRUCache:
+    """
+    Потокобезопасный LRU-кэш с ограничением по размеру и опциональным TTL.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None) -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize должен быть положительным")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Вернуть значение по ключу (и пометить его как недавно использованное)."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            stored_at, value = item
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Положить значение, вытесняя самые старые записи при переполнении."""
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Удалить запись и вернуть её значение."""
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Снимок живых записей (просроченные удаляются, порядок LRU не меняется)."""
+        with self._lock:
+            if self.ttl is not None:
+                now = time.monotonic()
+                for key in [k for k, (ts, _) in self._data.items() if now - ts > self.ttl]:
+                    del self._data[key]
+            return [(key, value) for key, (_, value) in self._data.items()]
+
+    def clear(self) -> None:
+        """Очистить кэш."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,178 @@
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, LabelKey, float]
+# Снимок метрики: (имя, тип, описание, сэмплы) — передаётся между процессами
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Counter:
+    """Монотонно растущий счётчик (с опциональными метками)."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str = "") -> None:
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        with self._lock:
+            return [(self.name, key, val) for key, val in self._values.items()]
+
+
+class Gauge(Counter):
+    """Значение, которое может как расти, так и уменьшаться."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Гистограмма с фиксированными бакетами (кумулятивная, как в Prometheus)."""
+
+    kind = "histogram"
+    DEFAULT_BUCKETS: Sequence[float] = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+    )
+
+    def __init__(self, name: str, description: str = "", buckets: Optional[Sequence[float]] = None) -> None:
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+        self._data: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            # [count per bucket..., +Inf count, sum]
+            data = self._data.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += 1
+            data[-1] += value
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            data = self._data.get(_label_key(labels))
+            return int(data[-2]) if data else 0
+
+    def sum(self, **labels: str) -> float:
+        with self._lock:
+            data = self._data.get(_label_key(labels))
+            return data[-1] if data else 0.0
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        out = []
+        with self._lock:
+            for key, data in self._data.items():
+                for bound, cnt in zip(self.buckets, data):
+                    out.append((f"{self.name}_bucket", key + (("le", repr(bound)),), cnt))
+                out.append((f"{self.name}_bucket", key + (("le", "+Inf"),), data[-2]))
+                out.append((f"{self.name}_count", key, data[-2]))
+                out.append((f"{self.name}_sum", key, data[-1]))
+        return out
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса. Метрики создаются один раз по имени
+    и переиспользуются всеми компонентами.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif type(metric) is not cls:
+                raise ValueError(f"Метрика {name} уже зарегистрирована с другим типом")
+            return metric
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name: str, description: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, description)
+
+    def histogram(self, name: str, description: str = "", buckets: Optional[Sequence[float]] = None) -> Histogram:
+        return self._get_or_create(Histogram, name, description, buckets)
+
+    def metrics(self) -> List[object]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self) -> List[Family]:
+        """Все метрики как (имя, тип, описание, сэмплы): их можно отдать другому процессу."""
+        return [(m.name, m.kind, m.description, m.samples()) for m in self.metrics()]
+
+    def render(self, remote: Sequence[Tuple[Dict[str, str], List[Family]]] = ()) -> str:
+        """
+        Все метрики в текстовом формате экспозиции Prometheus.
+
+        remote — снимки других процессов (например, сервера моделей) с метками,
+        которые добавляются к их сэмплам; одноимённые метрики выводятся одним
+        семейством, как требует формат.
+        """
+        families: Dict[str, Family] = {}
+        sources = [({}, self.snapshot())] + list(remote)
+        for extra, snapshot in sources:
+            extra_key = _label_key(extra)
+            for name, kind, description, samples in snapshot:
+                family = families.setdefault(name, (name, kind, description, []))
+                family[3].extend((s_name, labels + extra_key, value) for s_name, labels, value in samples)
+        lines: List[str] = []
+        for name, kind, description, samples in families.values():
+            if description:
+                lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for s_name, labels, value in samples:
+                lines.append(f"{s_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: LabelKey) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# Общий реестр процесса
+REGISTRY = MetricsRegistry()
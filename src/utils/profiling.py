@@ -0,0 +1,289 @@
+import cProfile
+import hmac
+import io
+import itertools
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as StackCounter
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.utils.logger_loader import LoggerLoader
+from src.utils.lru_cache import LRUCache
+
+MODES = ("sampling", "cprofile")
+
+# Id профиля идёт в имя файла в dump_dir и в ключ хранилища: только hex и дефис
+PROFILE_ID_RE = re.compile(r"^[0-9a-f-]{1,64}$")
+
+# В Python 3.12+ cProfile занимает общий на интерпретатор слот sys.monitoring:
+# второй enable() в другом потоке падает, поэтому сессии cProfile идут по одной
+_CPROFILE_LOCK = threading.Lock()
+
+
+def new_profile_id() -> str:
+    """Id профиля генерирует сервер, а не клиент (X-Request-Id ему не подходит)."""
+    return uuid.uuid4().hex
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame) -> str:
+    """Стек кадра в «свёрнутом» формате flame graph: корень;...;лист."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+# Лист стека в этих модулях — поток простаивает (ждёт событие, очередь или сокеты event loop)
+IDLE_MODULES = ("threading.py", "selectors.py", "queue.py")
+
+
+def _is_idle(frame) -> bool:
+    return os.path.basename(frame.f_code.co_filename) in IDLE_MODULES
+
+
+class StackSampler:
+    """
+    Сэмплирующий профайлер: раз в interval секунд снимает стек потока thread_id
+    через sys._current_frames(). Накладные расходы не зависят от числа вызовов функций.
+
+    thread_id=None — все потоки процесса, кроме простаивающих: так профилируется
+    асинхронный путь, где запрос переходит между event loop и пулами потоков.
+    """
+
+    def __init__(self, thread_id: Optional[int], interval: float = 0.005) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: StackCounter = StackCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frame = frames.get(self.thread_id)
+                if frame is not None:
+                    self.stacks[collapse_stack(frame)] += 1
+                continue
+            for thread_id, frame in frames.items():
+                if thread_id != own and not _is_idle(frame):
+                    self.stacks[collapse_stack(frame)] += 1
+
+
+@dataclass
+class ProfileReport:
+    """Профиль одного запроса: свёрнутые стеки (sampling) или вывод pstats (cprofile)."""
+    profile_id: str
+    mode: str
+    duration: float
+    stacks: Dict[str, int] = field(default_factory=dict)
+    stats_text: Optional[str] = None
+
+    def to_text(self) -> str:
+        """Свёрнутые стеки для flamegraph.pl / speedscope или текст pstats."""
+        if self.mode == "cprofile":
+            return self.stats_text or ""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def top_functions(stacks: Dict[str, int], top: int = 20) -> List[Tuple[str, int, int]]:
+    """(функция, собственные сэмплы, суммарные сэмплы) — самые горячие по собственным сэмплам."""
+    own: StackCounter = StackCounter()
+    total: StackCounter = StackCounter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for name in set(frames):
+            total[name] += count
+    return [(name, cnt, total[name]) for name, cnt in own.most_common(top)]
+
+
+class RequestProfiler:
+    """
+    Профилирование запросов по требованию и фоновое (1 из N).
+
+    - run() выполняет функцию под профайлером по запросу администратора и сохраняет
+      отчёт по id профиля (последние store_size отчётов в памяти и, если задан
+      dump_dir, файлами). cProfile работает для одного запроса за раз; пока он занят,
+      остальные запросы профилируются сэмплированием.
+    - sample() — фоновый профиль 1 из N: тот же асинхронный путь, что у обычных
+      запросов, всегда сэмплированием по всем потокам. Только эти профили
+      складываются в агрегат горячих путей (не больше max_hot_stacks стеков).
+    - Запрос профилирования от клиента разрешён только с admin-токеном.
+    """
+
+    def __init__(
+            self,
+            admin_token: Optional[str] = None,
+            sample_every: int = 0,
+            mode: str = "sampling",
+            interval_ms: float = 5.0,
+            store_size: int = 100,
+            dump_dir: Optional[str] = None,
+            max_hot_stacks: int = 2000
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        self.logger = LoggerLoader.get_logger(__name__)
+        self.admin_token = admin_token
+        self.sample_every = sample_every
+        self.mode = mode
+        self.interval = interval_ms / 1000.0
+        self.dump_dir = dump_dir
+        self.reports = LRUCache(maxsize=store_size)
+        self.hot_stacks: StackCounter = StackCounter()
+        self.max_hot_stacks = max_hot_stacks
+        self.profiled_requests = 0
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        if dump_dir:
+            os.makedirs(dump_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "RequestProfiler":
+        prof_cfg = config.get("profiling", {})
+        return cls(
+            admin_token=os.getenv(prof_cfg.get("admin_token_env", "ADMIN_TOKEN")) or None,
+            sample_every=prof_cfg.get("sample_every", 0),
+            mode=prof_cfg.get("mode", "sampling"),
+            interval_ms=prof_cfg.get("interval_ms", 5),
+            store_size=prof_cfg.get("store_size", 100),
+            dump_dir=prof_cfg.get("dump_dir"),
+            max_hot_stacks=prof_cfg.get("max_hot_stacks", 2000),
+        )
+
+    def authorized(self, token: Optional[str]) -> bool:
+        """Токен совпадает с admin-токеном (без токена в конфиге профилирование по запросу выключено)."""
+        if not self.admin_token or not token:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self.admin_token.encode("utf-8"))
+
+    def should_sample(self) -> bool:
+        """Фоновое профилирование: True для каждого sample_every-го запроса."""
+        if self.sample_every <= 0:
+            return False
+        with self._lock:
+            return next(self._counter) % self.sample_every == 0
+
+    def run(self, profile_id: str, mode: Optional[str], fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Выполнить fn(*args, **kwargs) в текущем потоке под профайлером и сохранить
+        отчёт под profile_id (см. new_profile_id).
+        """
+        if not PROFILE_ID_RE.match(profile_id):
+            raise ValueError(f"Invalid profile id: {profile_id!r}")
+        mode = mode or self.mode
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        if mode == "cprofile" and not _CPROFILE_LOCK.acquire(blocking=False):
+            self.logger.info(f"cProfile занят другим запросом, профиль {profile_id} снимается сэмплированием")
+            mode = "sampling"
+        start = time.perf_counter()
+        sampler = profiler = None
+        try:
+            if mode == "sampling":
+                sampler = StackSampler(threading.get_ident(), self.interval)
+                sampler.start()
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                if sampler is not None:
+                    sampler.stop()
+                    report = ProfileReport(profile_id, mode, duration, stacks=dict(sampler.stacks))
+                else:
+                    profiler.disable()
+                    out = io.StringIO()
+                    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(60)
+                    report = ProfileReport(profile_id, mode, duration, stats_text=out.getvalue())
+                self._store(report)
+        finally:
+            if mode == "cprofile":
+                _CPROFILE_LOCK.release()
+
+    async def sample(self, awaitable: Awaitable[Any]) -> Any:
+        """
+        Фоновый профиль: дождаться awaitable, сэмплируя все потоки процесса, и добавить
+        стеки в агрегат горячих путей. Режим из конфига не важен: cProfile видел бы
+        только поток event loop, а агрегату нужны стеки.
+        """
+        profile_id = new_profile_id()
+        start = time.perf_counter()
+        sampler = StackSampler(None, self.interval)
+        sampler.start()
+        try:
+            return await awaitable
+        finally:
+            sampler.stop()
+            report = ProfileReport(profile_id, "sampling", time.perf_counter() - start, stacks=dict(sampler.stacks))
+            self._store(report, aggregate=True)
+
+    def _store(self, report: ProfileReport, aggregate: bool = False) -> None:
+        self.reports.put(report.profile_id, report)
+        if aggregate:
+            with self._lock:
+                self.profiled_requests += 1
+                self.hot_stacks.update(report.stacks)
+                if len(self.hot_stacks) > self.max_hot_stacks:
+                    # агрегат живёт всё время работы воркера: хвост редких стеков отбрасывается
+                    self.hot_stacks = StackCounter(dict(self.hot_stacks.most_common(self.max_hot_stacks)))
+        self.logger.info(f"Профиль запроса {report.profile_id} ({report.mode}): {report.duration:.2f} с")
+        if self.dump_dir:
+            ext = "pstats.txt" if report.mode == "cprofile" else "folded"
+            with open(os.path.join(self.dump_dir, f"{report.profile_id}.{ext}"), "w", encoding="utf-8") as f:
+                f.write(report.to_text())
+
+    def get(self, profile_id: str) -> Optional[ProfileReport]:
+        return self.reports.get(profile_id)
+
+    def hot_paths(self, top: int = 20) -> Dict[str, Any]:
+        """Агрегат по фоновым профилям: самые горячие функции и стеки."""
+        with self._lock:
+            stacks = dict(self.hot_stacks)
+            profiled = self.profiled_requests
+        return {
+            "profiled_requests": profiled,
+            "samples": sum(stacks.values()),
+            "functions": [
+                {"function": name, "self_samples": own, "total_samples": total}
+                for name, own, total in top_functions(stacks, top)
+            ],
+            "stacks": [
+                {"stack": stack, "samples": count}
+                for stack, count in StackCounter(stacks).most_common(top)
+            ],
+        }
+
+    def dump_hot_paths(self) -> Optional[str]:
+        """Записать агрегат свёрнутых стеков в dump_dir (hot_paths.folded); путь к файлу или None."""
+        if not self.dump_dir:
+            return None
+        path = os.path.join(self.dump_dir, "hot_paths.folded")
+        with self._lock:
+            lines = [f"{stack} {count}\n" for stack, count in self.hot_stacks.items()]
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        return path
@@ -31,3 +31,18 @@ class PromptLoader:
 
         self.prompts_cache[language_code] = prompt
         return prompt
+
+    @staticmethod
+    def static_prefix(template: str) -> str:
+        """
+        Статическая часть шаблона до первого плейсхолдера.
+        Она одинакова для всех запросов, поэтому её состояние можно кэшировать в LLM.
+
+        Args:
+            template (str): Шаблон с плейсхолдерами {query} и {context}.
+
+        Returns:
+            str: Текст шаблона до первого плейсхолдера.
+        """
+        positions = [template.find(p) for p in ("{context}", "{query}") if p in template]
+        return template[: min(positions)] if positions else template
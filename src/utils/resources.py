@@ -0,0 +1,173 @@
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, TypeVar
+
+from src.utils.logger_loader import LoggerLoader
+
+# torch и threadpoolctl импортируются только при применении настроек
+
+logger = LoggerLoader.get_logger(__name__)
+
+T = TypeVar("T")
+
+# Пулы BLAS, которые читают размер из окружения при загрузке библиотеки
+BLAS_ENV_VARS = ("OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "BLIS_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+_warned = set()
+
+
+def _warn_once(key: str, message: str) -> None:
+    if key not in _warned:
+        _warned.add(key)
+        logger.warning(message)
+
+
+@dataclass
+class ComponentResources:
+    """
+    Ресурсы одного компонента: число потоков и ядра, к которым привязывается его работа.
+    threads — n_threads для llama.cpp и intra-op потоки torch для эмбеддера;
+    threads_batch — только для llama.cpp (prefill).
+    """
+    threads: Optional[int] = None
+    threads_batch: Optional[int] = None
+    cores: Optional[List[int]] = None
+
+    @classmethod
+    def from_config(cls, cfg: Optional[Dict[str, Any]]) -> "ComponentResources":
+        cfg = cfg or {}
+        cores = cfg.get("cores")
+        return cls(
+            threads=cfg.get("threads"),
+            threads_batch=cfg.get("threads_batch"),
+            cores=[int(c) for c in cores] if cores else None
+        )
+
+
+class ResourcePlan:
+    """
+    Раскладка CPU между LLM, эмбеддером и реранкером по секции resources конфига.
+    По умолчанию torch, BLAS и llama.cpp берут все ядра и при одновременной работе
+    мешают друг другу; здесь каждому задаётся свой пул потоков и, при желании, свои ядра.
+    Пустая секция ничего не меняет.
+    """
+
+    def __init__(
+        self,
+        llm: Optional[ComponentResources] = None,
+        embedder: Optional[ComponentResources] = None,
+        reranker: Optional[ComponentResources] = None,
+        blas_threads: Optional[int] = None
+    ) -> None:
+        self.llm = llm or ComponentResources()
+        self.embedder = embedder or ComponentResources()
+        self.reranker = reranker or ComponentResources()
+        self.blas_threads = blas_threads
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ResourcePlan":
+        cfg = config.get("resources") or {}
+        return cls(
+            llm=ComponentResources.from_config(cfg.get("llm")),
+            embedder=ComponentResources.from_config(cfg.get("embedder")),
+            reranker=ComponentResources.from_config(cfg.get("reranker")),
+            blas_threads=cfg.get("blas_threads")
+        )
+
+    def apply_blas(self) -> None:
+        """
+        Ограничивает пулы BLAS/OpenMP numpy и sklearn (логрег-реранкер, MMR, признаки).
+        Уже загруженные библиотеки — через threadpoolctl, загружаемые позже — через переменные окружения.
+        """
+        if not self.blas_threads:
+            return
+        for var in BLAS_ENV_VARS:
+            os.environ.setdefault(var, str(self.blas_threads))
+        try:
+            from threadpoolctl import threadpool_limits
+        except ImportError:
+            _warn_once("threadpoolctl", "threadpoolctl не установлен: BLAS ограничен только переменными окружения")
+            return
+        threadpool_limits(limits=self.blas_threads, user_api="blas")
+        logger.info(f"BLAS threads: {self.blas_threads}")
+
+    def apply_torch(self) -> None:
+        """
+        Intra-op потоки torch для эмбеддера. Пул общий на процесс, поэтому
+        cross-encoder реранкера в этом же процессе работает с тем же числом потоков.
+        """
+        if not self.embedder.threads:
+            return
+        import torch
+        torch.set_num_threads(self.embedder.threads)
+        logger.info(f"Torch intra-op threads: {self.embedder.threads}")
+
+
+def available_cores() -> Optional[List[int]]:
+    """Ядра, доступные процессу (None, если ОС не поддерживает привязку)."""
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    return sorted(os.sched_getaffinity(0))
+
+
+def _target(cores: Optional[Sequence[int]]) -> Optional[Set[int]]:
+    """Ядра из cores, доступные процессу; None — привязывать не нужно или нельзя."""
+    if not cores:
+        return None
+    allowed = available_cores()
+    if allowed is None:
+        _warn_once("affinity", "Привязка к ядрам не поддерживается на этой платформе")
+        return None
+    target = set(cores) & set(allowed)
+    if not target:
+        _warn_once(f"cores:{sorted(cores)}", f"Ядра {sorted(cores)} недоступны процессу, привязка пропущена")
+        return None
+    return target
+
+
+@contextmanager
+def pinned(cores: Optional[Sequence[int]]) -> Iterator[None]:
+    """
+    Привязывает текущий поток к ядрам на время блока и возвращает прежнюю маску.
+    Потоки, созданные внутри (пулы llama.cpp и OpenMP torch), наследуют привязку.
+    Ядра вне доступных процессу отбрасываются; без поддержки ОС блок выполняется как есть.
+    """
+    target = _target(cores)
+    if target is None:
+        yield
+        return
+    # pid 0 в Linux — вызывающий поток, а не весь процесс
+    previous = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, target)
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, previous)
+
+
+def pinned_steps(iterable: Iterable[T], cores: Optional[Sequence[int]]) -> Iterator[T]:
+    """
+    Итерирует iterable, выполняя каждый шаг с привязкой к ядрам: шаги потоковой
+    генерации приходят из разных потоков, поэтому привязка ставится на каждый next().
+    """
+    if not cores:
+        yield from iterable
+        return
+    it = iter(iterable)
+    while True:
+        with pinned(cores):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+
+def thread_initializer(cores: Optional[Sequence[int]]) -> Callable[[], None]:
+    """initializer для ThreadPoolExecutor: привязывает рабочий поток к ядрам на всё время жизни."""
+    def init() -> None:
+        target = _target(cores)
+        if target is not None:
+            os.sched_setaffinity(0, target)
+    return init
@@ -0,0 +1,40 @@
+import logging
+
+import pytest
+
+from src.answer_generator.rag_model import RAGModel
+
+
+class FakeExtractor:
+    """Извлекатель субтитров без сети: id видео из URL и ссылка на момент в видео."""
+
+    @staticmethod
+    def extract_video_id(url):
+        return None if "bad" in url else url.rsplit("=", 1)[-1]
+
+    @staticmethod
+    def video_url(video_id, start_time=None):
+        return f"https://youtu.be/{video_id}?t={int(start_time or 0)}"
+
+    @staticmethod
+    def get_subtitles(video_id):
+        return []
+
+
+@pytest.fixture
+def rag_model():
+    """
+    Фабрика RAGModel без загрузки моделей и БД: объект создаётся через __new__,
+    атрибуты задаёт тест — ровно те, что нужны проверяемому этапу.
+    Логгер и FakeExtractor ставятся по умолчанию.
+    """
+
+    def make(**attrs):
+        model = RAGModel.__new__(RAGModel)
+        model.logger = logging.getLogger("test")
+        model.subtitle_extractor = FakeExtractor()
+        for name, value in attrs.items():
+            setattr(model, name, value)
+        return model
+
+    return make
@@ -0,0 +1,124 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from unittest.mock import MagicMock
+
+from src.answer_generator.answer_cache import AnswerCache, config_hash, normalize_query, query_entities
+
+
+def test_normalize_query_ignores_case_and_punctuation():
+    assert normalize_query("  О чём   фильм?! ") == normalize_query("о чем фильм")
+
+
+def test_config_hash_depends_on_prompt_and_settings():
+    config = {"language": "ru", "models": {"ru": {"backend": "llama.cpp"}}, "retriever": {"top_k": 6}}
+    base = config_hash(config, "prompt")
+    assert base == config_hash(dict(config), "prompt")
+    assert base != config_hash(config, "другой промпт")
+    assert base != config_hash({**config, "retriever": {"top_k": 3}}, "prompt")
+    # другие параметры декодирования — другие ответы
+    assert base != config_hash({**config, "generation": {"max_tokens": 128}}, "prompt")
+    assert config_hash({**config, "generation": {"stop": ["a"]}}, "prompt") != config_hash(
+        {**config, "generation": {"stop": ["b"]}}, "prompt"
+    )
+
+
+def test_exact_hit_for_normalized_query():
+    cache = AnswerCache("h")
+    cache.put("vid", "О чём фильм?", "Ответ")
+    assert cache.get("vid", "о чем фильм") == "Ответ"
+    # другой видео-ролик — промах
+    assert cache.get("other", "о чем фильм") is None
+
+
+def test_semantic_hit_within_same_video_only():
+    cache = AnswerCache("h", semantic_threshold=0.9)
+    cache.put("vid", "О чём фильм?", "Ответ", [1.0, 0.0])
+    # близкий по смыслу вопрос (косинус ~0.99)
+    assert cache.get("vid", "Про что это кино?", [0.99, 0.1]) == "Ответ"
+    # далёкий вопрос — промах
+    assert cache.get("vid", "Кто режиссёр?", [0.0, 1.0]) is None
+    assert cache.get("other", "Про что это кино?", [0.99, 0.1]) is None
+
+
+def test_semantic_layer_can_be_disabled():
+    cache = AnswerCache("h", semantic_threshold=None)
+    cache.put("vid", "О чём фильм?", "Ответ", [1.0, 0.0])
+    assert cache.get("vid", "Про что это кино?", [1.0, 0.0]) is None
+
+
+def test_config_hash_separates_entries():
+    first, second = AnswerCache("a"), AnswerCache("b")
+    first.put("vid", "вопрос", "ответ")
+    assert second.get("vid", "вопрос") is None
+
+
+def test_invalidate_drops_only_that_video():
+    cache = AnswerCache("h")
+    cache.put("vid", "вопрос", "ответ")
+    cache.put("other", "вопрос", "ответ 2")
+    cache.invalidate("vid")
+    assert cache.get("vid", "вопрос") is None
+    assert cache.get("other", "вопрос") == "ответ 2"
+
+
+def test_persistent_store_is_used_on_local_miss():
+    store = MagicMock()
+    store.fetch_cached_answer.return_value = "из базы"
+    cache = AnswerCache("h", store=store)
+    store.ensure_answer_cache_table.assert_called_once()
+
+    assert cache.get("vid", "Вопрос") == "из базы"
+    store.fetch_cached_answer.assert_called_once_with("vid", "вопрос", "h", ttl=3600)
+    # второй раз — из локального слоя, без запроса в БД
+    assert cache.get("vid", "вопрос") == "из базы"
+    assert store.fetch_cached_answer.call_count == 1
+
+    cache.put("vid", "новый", "ответ", [3.0, 4.0])
+    args, kwargs = store.upsert_cached_answer.call_args
+    assert args == ("vid", "новый", "h")
+    assert kwargs["embedding"] == pytest.approx([0.6, 0.8])
+
+    cache.invalidate("vid")
+    store.delete_cached_answers.assert_called_once_with("vid")
+
+
+def test_query_entities_keep_numbers_and_names():
+    assert query_entities("Что было в 3 серии?") == "3"
+    assert query_entities("Что сказал Иван про NASA?") == "nasa иван"
+    # первое слово предложения с заглавной буквы — не имя
+    assert query_entities("Расскажи кратко. Кто автор?") == ""
+    assert query_entities("What did I say about Python 3.12?") == "12 3 python"
+
+
+def test_semantic_layer_does_not_cross_numbers_or_names():
+    cache = AnswerCache("h", semantic_threshold=0.9)
+    cache.put("vid", "Что было в 3 серии?", "Ответ про 3", [1.0, 0.0])
+    cache.put("vid", "Что сказал Иван?", "Ответ про Ивана", [0.0, 1.0])
+    # эмбеддинги почти совпадают, но число другое — промах
+    assert cache.get("vid", "Что было в 4 серии?", [0.99, 0.1]) is None
+    assert cache.get("vid", "Что было в третьей серии, номер 3?", [0.99, 0.1]) == "Ответ про 3"
+    assert cache.get("vid", "Что сказал Пётр?", [0.1, 0.99]) is None
+
+
+def test_persistent_semantic_lookup_filters_by_entities():
+    store = MagicMock()
+    store.fetch_cached_answer.return_value = None
+    store.fetch_similar_cached_answer.return_value = None
+    cache = AnswerCache("h", store=store)
+    cache.put("vid", "Что в 3 серии?", "ответ", [1.0, 0.0])
+    assert store.upsert_cached_answer.call_args.kwargs["entities"] == "3"
+    assert cache.get("other", "Что в 5 серии?", [1.0, 0.0]) is None
+    assert store.fetch_similar_cached_answer.call_args.kwargs["entities"] == "5"
+
+
+def test_module_imports_without_database_environment():
+    # без переменных БД (и с пустым PORT) импорт не падает и не тянет драйвер
+    env = {k: v for k, v in os.environ.items() if k not in ("USER", "SUPABASE_KEY", "HOST", "DBNAME")}
+    env["PORT"] = ""
+    code = "import sys, tests.test_answer_cache; print('psycopg2' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,237 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.api import main
+
+CONFIG = {"embedding_model": "emb", "async_api": {"enabled": True}}
+
+
+class FakeDB:
+    """Пул БД: конструктор ждёт gate, чтобы проверить /ready во время загрузки."""
+
+    gate = threading.Event()
+    instances = []
+
+    def __init__(self):
+        assert self.gate.wait(5)
+        self.closed = False
+        self.instances.append(self)
+
+    def pool_stats(self):
+        return {"size": 1, "in_use": 0}
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAsyncDB:
+    instances = []
+
+    def __init__(self, min_size=2, max_size=10):
+        self.connected = False
+        self.closed = False
+        self.instances.append(self)
+
+    async def connect(self):
+        self.connected = True
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeRegistry:
+    def get_embedder(self, name):
+        return object()
+
+    def get_llm(self, config):
+        return object()
+
+    def model_client(self, config):
+        return None
+
+
+@pytest.fixture
+def make_rag_model(rag_model):
+    # Настоящий RAGModel.close на заглушке: проверяем остановку его пулов потоков
+    def make(db):
+        return rag_model(
+            db=db,
+            async_db=None,
+            cpu_executor=ThreadPoolExecutor(max_workers=1),
+            llm_executor=ThreadPoolExecutor(max_workers=1),
+            warmup=lambda: {"embedding": 0.0},
+        )
+
+    return make
+
+
+@pytest.fixture
+def app_env(monkeypatch, make_rag_model):
+    FakeDB.gate.clear()
+    FakeDB.instances.clear()
+    FakeAsyncDB.instances.clear()
+    models = []
+
+    def fake_rag_model(db):
+        models.append(make_rag_model(db))
+        return models[-1]
+
+    monkeypatch.setattr(main.ConfigLoader, "get_config", staticmethod(lambda: CONFIG))
+    monkeypatch.setattr(main.LoggerLoader, "configure", classmethod(lambda cls, config: None))
+    monkeypatch.setattr(main.ModelRegistry, "get_registry", staticmethod(FakeRegistry))
+    monkeypatch.setattr(main, "DBConnector", FakeDB)
+    monkeypatch.setattr(main, "AsyncDBConnector", FakeAsyncDB)
+    monkeypatch.setattr(main, "RAGModel", fake_rag_model)
+    monkeypatch.setattr(main, "state", main.ServiceState())
+    yield models
+    FakeDB.gate.set()
+
+
+def wait_ready(client, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get("/ready")
+        if response.status_code == 200:
+            return response
+        time.sleep(0.01)
+    raise AssertionError("сервис не стал готов")
+
+
+def test_ready_is_503_until_components_load(app_env):
+    with TestClient(main.app) as client:
+        # пока пул БД не поднялся: процесс жив, но трафик не принимает
+        assert client.get("/health").json() == {"status": "ok"}
+        starting = client.get("/ready")
+        assert starting.status_code == 503
+        assert starting.json()["status"] == "starting"
+        query = client.post("/query", json={"video_url": "v", "query": "q"})
+        assert query.status_code == 503
+        assert query.headers["Retry-After"] == "5"
+
+        FakeDB.gate.set()
+        ready = wait_ready(client).json()
+        assert ready["status"] == "ready"
+        assert ready["db_pool"] == {"size": 1, "in_use": 0}
+        assert {"db", "embedder", "llm", "rag_model", "warmup", "total"} <= set(ready["timings"])
+        assert FakeAsyncDB.instances[0].connected
+        assert app_env[0].async_db is FakeAsyncDB.instances[0]
+
+
+def test_shutdown_closes_pools_and_executors(app_env):
+    FakeDB.gate.set()
+    with TestClient(main.app) as client:
+        wait_ready(client)
+    model = app_env[0]
+    assert not main.state.ready
+    assert FakeDB.instances[0].closed
+    assert FakeAsyncDB.instances[0].closed
+    assert model.async_db is None
+    # пулы потоков RAGModel остановлены и новых задач не принимают
+    for executor in (model.cpu_executor, model.llm_executor):
+        with pytest.raises(RuntimeError):
+            executor.submit(lambda: None)
+
+
+def test_startup_error_is_reported_by_health_and_ready(app_env, monkeypatch, make_rag_model):
+    def failing_warmup():
+        raise RuntimeError("warmup failed")
+
+    def broken_model(db):
+        model = make_rag_model(db)
+        model.warmup = failing_warmup
+        app_env.append(model)
+        return model
+
+    monkeypatch.setattr(main, "RAGModel", broken_model)
+    FakeDB.gate.set()
+    with TestClient(main.app) as client:
+        deadline = time.monotonic() + 5
+        while main.state.error is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.get("/health").status_code == 503
+        assert client.get("/ready").json()["status"] == "error"
+        assert client.post("/query", json={"video_url": "v", "query": "q"}).status_code == 503
+    # то, что успело подняться, всё равно закрывается
+    assert FakeDB.instances[0].closed
+
+
+def test_shutdown_during_loading_cancels_startup(app_env):
+    # клиент закрывается, пока пул БД ещё поднимается: загрузка отменяется без зависаний
+    with TestClient(main.app) as client:
+        assert client.get("/ready").status_code == 503
+        # поток загрузки отменить нельзя — он должен сам дойти до конца
+        threading.Timer(0.1, FakeDB.gate.set).start()
+    assert not main.state.ready
+    assert main.state.rag_model is None
+
+
+class FakeModelClient:
+    def __init__(self, families=None):
+        self.families = families
+
+    def metrics(self):
+        if self.families is None:
+            raise RuntimeError("server down")
+        return self.families
+
+
+def test_metrics_include_model_server_registry(monkeypatch):
+    # в режиме сервера моделей токены и prefill/decode считаются там — /metrics воркера их показывает
+    families = [("llm_completion_tokens_total", "counter", "Tokens", [
+        ("llm_completion_tokens_total", (("backend", "llama.cpp"),), 42.0)
+    ])]
+    monkeypatch.setattr(main, "state", main.ServiceState())
+    main.state.model_client = FakeModelClient(families)
+    client = TestClient(main.app)
+    text = client.get("/metrics").text
+    assert 'llm_completion_tokens_total{backend="llama.cpp",process="model_server"} 42' in text
+    # недоступный сервер не ломает метрики самого воркера
+    main.state.model_client = FakeModelClient()
+    response = client.get("/metrics")
+    assert response.status_code == 200 and "process=\"model_server\"" not in response.text
+
+
+class ProfiledModel:
+    """RAGModel-заглушка: записывает, каким путём прошёл запрос."""
+
+    def __init__(self):
+        from src.answer_generator.deadline import DeadlinePolicy
+        from src.answer_generator.generation import GenerationParams
+
+        self.deadline_policy = DeadlinePolicy()
+        self.generation = GenerationParams()
+        self.paths = []
+
+    async def aprocess_query(self, video_url, query, deadline=None, generation=None):
+        self.paths.append("async")
+        return "ответ"
+
+    def process_query(self, video_url, query, deadline=None, generation=None):
+        self.paths.append("sync")
+        return "ответ"
+
+
+def test_background_profiling_uses_async_path(monkeypatch):
+    monkeypatch.setattr(main, "state", main.ServiceState())
+    model = ProfiledModel()
+    main.state.rag_model, main.state.ready = model, True
+    main.state.profiler = main.RequestProfiler(sample_every=1, mode="cprofile", interval_ms=1)
+    response = TestClient(main.app).post("/query", json={"video_url": "v", "query": "q"})
+    assert response.status_code == 200
+    # фоновый профиль снят с того же пути, что и у обычных запросов, и попал в агрегат
+    assert model.paths == ["async"]
+    assert "X-Profile-Id" not in response.headers
+    assert main.state.profiler.hot_paths()["profiled_requests"] == 1
+
+
+@pytest.mark.parametrize("top_k", [0, -1, main.MAX_SEARCH_TOP_K + 1])
+def test_search_rejects_invalid_top_k(monkeypatch, top_k):
+    monkeypatch.setattr(main, "state", main.ServiceState())
+    main.state.rag_model, main.state.ready = ProfiledModel(), True
+    response = TestClient(main.app).post("/search", json={"video_url": "v", "query": "q", "top_k": top_k})
+    # некорректный top_k отсекается схемой запроса, до пайплайна
+    assert response.status_code == 422
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+
+from src.utils.async_db_connector import AsyncDBConnector, decode_vector, encode_vector
+
+
+class FakePool:
+    """Пул asyncpg: запоминает запросы и отдаёт заранее заданные строки."""
+
+    def __init__(self, rows=None, value=None):
+        self.rows = rows or []
+        self.value = value
+        self.calls = []
+
+    async def fetch(self, sql, *args):
+        self.calls.append((sql, args))
+        return self.rows
+
+    async def fetchval(self, sql, *args):
+        self.calls.append((sql, args))
+        return self.value
+
+
+def make_connector(pool):
+    db = AsyncDBConnector()
+    db._pool = pool
+    return db
+
+
+def test_vector_codec_roundtrip():
+    assert encode_vector([0.5, 0.25]) == "[0.5,0.25]"
+    assert decode_vector("[0.5,0.25]") == [0.5, 0.25]
+    assert decode_vector("[]") == []
+
+
+def test_requires_pool():
+    with pytest.raises(RuntimeError):
+        asyncio.run(AsyncDBConnector().has_subtitles("vid"))
+
+
+def test_has_subtitles():
+    pool = FakePool(value=1)
+    assert asyncio.run(make_connector(pool).has_subtitles("vid")) is True
+    assert pool.calls[0][1] == ("vid",)
+    assert asyncio.run(make_connector(FakePool(value=None)).has_subtitles("vid")) is False
+
+
+def test_search_filters_by_video_and_returns_tuples():
+    row = ("text", 0.9, [1, 2], [0.5, 0.25], 0.0, 60.0, "vid", "id-1")
+    pool = FakePool(rows=[row])
+    rows = asyncio.run(make_connector(pool).search_similar_embeddings([0.1, 0.2], top_k=3, video_id="vid"))
+    assert rows == [row]
+    sql, args = pool.calls[0]
+    # параметры передаются отдельно от SQL
+    assert "$1::vector" in sql and "video_id = $2" in sql
+    assert args == ([0.1, 0.2], "vid", 3)
+
+
+def test_batch_search_groups_rows_by_query():
+    pool = FakePool(rows=[
+        (1, "a", 0.9, None, [1.0], 0.0, 60.0, "vid", "id-a"),
+        (3, "b", 0.8, None, [1.0], 0.0, 60.0, "vid", "id-b"),
+    ])
+    rows = asyncio.run(make_connector(pool).search_similar_embeddings_batch([[0.1], [0.2], [0.3]], top_k=1))
+    assert [[r[0] for r in group] for group in rows] == [["a"], [], ["b"]]
+    assert len(pool.calls) == 1
@@ -0,0 +1,262 @@
+import threading
+
+import pytest
+
+from src.answer_generator.batching import (
+    BatchingTransformersLLM, ContinuousBatcher, GenerationRequest, IncrementalDecoder
+)
+
+
+class FakeEngine:
+    """
+    Вместо модели: каждый шаг отдаёт каждому запросу следующий символ промпта задом наперёд
+    и запоминает, какие запросы были в батче на каждом шаге.
+    """
+
+    def __init__(self, step_gate=None):
+        self.requests = []
+        self.steps = []
+        self.step_gate = step_gate
+        self.admitted = []
+
+    @property
+    def size(self):
+        return len(self.requests)
+
+    def reset(self):
+        self.requests = []
+
+    def admit(self, requests):
+        self.admitted.append([r.prompt for r in requests])
+        for r in requests:
+            r.left = list(reversed(r.prompt[:r.max_new_tokens]))
+        self.requests = self.requests + list(requests)
+
+    def step(self):
+        if self.step_gate is not None:
+            self.step_gate(self)
+        self.steps.append([r.prompt for r in self.requests])
+        finished = []
+        for r in self.requests:
+            if r.cancelled or not r.left:
+                finished.append(r)
+                continue
+            r.emit(r.left.pop(0))
+            if not r.left:
+                finished.append(r)
+        self.requests = [r for r in self.requests if r not in finished]
+        return finished
+
+
+def test_new_request_joins_running_batch_between_steps():
+    long_started, short_submitted = threading.Event(), threading.Event()
+
+    def gate(engine):
+        # на втором шаге длинного запроса ждём, пока придёт короткий
+        if len(engine.steps) == 1:
+            long_started.set()
+            short_submitted.wait(2)
+
+    engine = FakeEngine(step_gate=gate)
+    batcher = ContinuousBatcher(engine, max_batch_size=4, batch_window_ms=0)
+    long = batcher.submit(GenerationRequest("abcdefghij", 100))
+    assert long_started.wait(2)
+    short = batcher.submit(GenerationRequest("xy", 100))
+    short_submitted.set()
+    assert "".join(short.stream()) == "yx"
+    assert "".join(long.stream()) == "jihgfedcba"
+    # короткий запрос вошёл в батч, пока длинный ещё декодировался, и вышел раньше него
+    joined = [i for i, step in enumerate(engine.steps) if "xy" in step]
+    assert joined and joined[0] < len(engine.steps) - 1
+    assert engine.steps[-1] == ["abcdefghij"]
+    assert engine.admitted == [["abcdefghij"], ["xy"]]
+
+
+def test_requests_within_window_are_admitted_together():
+    engine = FakeEngine()
+    started, gate = threading.Event(), threading.Event()
+    original_admit = engine.admit
+
+    def blocking_admit(requests):
+        started.set()
+        gate.wait(2)
+        original_admit(requests)
+
+    engine.admit = blocking_admit
+    batcher = ContinuousBatcher(engine, max_batch_size=8, batch_window_ms=50)
+    first = batcher.submit(GenerationRequest("first", 10))
+    assert started.wait(2)
+    rest = [batcher.submit(GenerationRequest(p, 10)) for p in ("abc", "de", "f")]
+    gate.set()
+    assert "".join(first.stream()) == "tsrif"
+    assert ["".join(r.stream()) for r in rest] == ["cba", "ed", "f"]
+    assert engine.admitted[0] == ["first"]
+    assert ["abc", "de", "f"] in engine.admitted
+
+
+def test_max_batch_size_is_respected():
+    engine = FakeEngine()
+    batcher = ContinuousBatcher(engine, max_batch_size=2, batch_window_ms=100)
+    requests = [batcher.submit(GenerationRequest(str(i) * 3, 3)) for i in range(5)]
+    assert ["".join(r.stream()) for r in requests] == ["000", "111", "222", "333", "444"]
+    assert all(len(step) <= 2 for step in engine.steps)
+
+
+def test_cancelled_request_is_skipped_and_finished():
+    engine = FakeEngine()
+    gate = threading.Event()
+    engine.step_gate = lambda e: gate.wait(2)
+    batcher = ContinuousBatcher(engine, max_batch_size=8, batch_window_ms=10)
+    first = batcher.submit(GenerationRequest("x", 1))
+    cancel = threading.Event()
+    cancel.set()
+    skipped = batcher.submit(GenerationRequest("skipped", 5, cancel_event=cancel))
+    gate.set()
+    assert "".join(first.stream()) == "x"
+    # отменённый запрос не попадает в батч, но его поток корректно завершается
+    assert list(skipped.stream()) == []
+    assert all("skipped" not in b for b in engine.admitted)
+
+
+def test_batch_error_is_raised_in_every_stream_and_batch_is_reset():
+    engine = FakeEngine()
+
+    def failing(e):
+        raise RuntimeError("boom")
+
+    engine.step_gate = failing
+    batcher = ContinuousBatcher(engine, max_batch_size=4, batch_window_ms=20)
+    request = batcher.submit(GenerationRequest("a", 1))
+    try:
+        list(request.stream())
+    except RuntimeError as e:
+        assert str(e) == "boom"
+    else:
+        raise AssertionError("ошибка батча должна дойти до потребителя")
+    assert engine.size == 0
+
+
+class ByteTokenizer:
+    """Токен — один байт UTF-8; неполный символ декодируется в U+FFFD, как у BPE-токенизаторов."""
+
+    def __init__(self):
+        self.decoded = 0
+
+    def encode(self, text):
+        return list(text.encode("utf-8"))
+
+    def decode(self, tokens, skip_special_tokens=True):
+        self.decoded += len(tokens)
+        return bytes(tokens).decode("utf-8", errors="replace")
+
+
+def test_incremental_decoder_holds_partial_characters():
+    tokenizer = ByteTokenizer()
+    decoder = IncrementalDecoder(tokenizer)
+    pieces = [decoder.push(t) for t in tokenizer.encode("да, ok")]
+    # кириллица — по два байта: первый байт символа ничего не выдаёт
+    assert pieces == ["", "д", "", "а", ",", " ", "o", "k"]
+    assert decoder.flush() == ""
+
+    decoder = IncrementalDecoder(tokenizer)
+    assert decoder.push(tokenizer.encode("ж")[0]) == ""
+    assert decoder.flush() == "�"
+
+
+def test_incremental_decoder_work_is_linear_in_length():
+    tokenizer = ByteTokenizer()
+    decoder = IncrementalDecoder(tokenizer)
+    text = "слово " * 200
+    assert "".join(decoder.push(t) for t in tokenizer.encode(text)) == text
+    # декодируется короткое окно, а не весь ответ на каждом шаге
+    assert tokenizer.decoded < 10 * len(tokenizer.encode(text))
+
+
+# --- BatchingTransformersLLM на настоящих тензорах: крошечная случайная модель, без загрузки весов ---
+
+class CharTokenizer:
+    """Символ — токен; левый паддинг нулями, как у HF-токенизатора с padding_side='left'."""
+
+    pad_token_id = 0
+    eos_token_id = -1  # модель никогда не выдаёт: длину ответа задаёт max_new_tokens
+
+    def __init__(self, torch, transformers):
+        self.torch, self.transformers = torch, transformers
+
+    def __call__(self, texts, return_tensors="pt", padding=True):
+        ids = [[ord(c) % 60 + 1 for c in text] for text in texts]
+        width = max(len(row) for row in ids)
+        input_ids = [[0] * (width - len(row)) + row for row in ids]
+        mask = [[0] * (width - len(row)) + [1] * len(row) for row in ids]
+        return self.transformers.BatchEncoding({
+            "input_ids": self.torch.tensor(input_ids), "attention_mask": self.torch.tensor(mask),
+        })
+
+    @staticmethod
+    def decode(tokens, skip_special_tokens=True):
+        return "".join(f"<{t}>" for t in tokens)
+
+
+@pytest.fixture(scope="module")
+def tiny_llm():
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=4, max_position_embeddings=128,
+    )
+    # eager-внимание и float64: паддинг не даёт NaN, а argmax не зависит от шума округления
+    model = transformers.AutoModelForCausalLM.from_config(config, attn_implementation="eager").double().eval()
+
+    def make():
+        llm = BatchingTransformersLLM.__new__(BatchingTransformersLLM)
+        llm.torch, llm.cache_cls = torch, getattr(transformers, "DynamicCache", None)
+        llm.tokenizer, llm.model, llm.device = CharTokenizer(torch, transformers), model, "cpu"
+        llm.reset()
+        return llm
+
+    return make
+
+
+def check_positions(llm):
+    # позиция последнего токена каждой строки — число его непаддинговых предшественников
+    assert llm._positions.tolist() == (llm._mask.sum(-1) - 1).tolist()
+    # общие пустые столбцы слева срезаны
+    assert bool(llm._mask[:, 0].any())
+
+
+def drain(llm):
+    while llm.size:
+        llm.step()
+        if llm.size:
+            check_positions(llm)
+
+
+def test_batched_tensors_match_unbatched_generation(tiny_llm):
+    prompts = [("длинный промпт", 6), ("xy", 3), ("средний", 5)]
+
+    expected = []
+    for prompt, max_new in prompts:
+        llm = tiny_llm()
+        request = GenerationRequest(prompt, max_new)
+        llm.admit([request])
+        drain(llm)
+        expected.append(request.decoder.tokens)
+
+    llm = tiny_llm()
+    requests = [GenerationRequest(prompt, max_new) for prompt, max_new in prompts]
+    # первые два — одним prefill с левым паддингом
+    llm.admit(requests[:2])
+    check_positions(llm)
+    llm.step()
+    llm.step()
+    # третий вливается в идущий батч: кэши разной длины склеиваются (_merge)
+    llm.admit(requests[2:])
+    check_positions(llm)
+    assert llm.size == 3
+    # короткий запрос закончит первым: строка удаляется из батча (_keep), остальные продолжают
+    drain(llm)
+    assert [r.decoder.tokens for r in requests] == expected
+    assert [len(tokens) for tokens in expected] == [6, 3, 5]
+    assert llm.size == 0 and llm._past is None
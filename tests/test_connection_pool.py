@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+from src.utils.connection_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        if self.conn.broken:
+            raise RuntimeError("server closed the connection unexpectedly")
+        self.conn.pings += 1
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.pings = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.broken:
+            raise RuntimeError("connection lost")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+def make_pool(**kwargs):
+    opened = []
+
+    def connect():
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+
+    return ConnectionPool(connect, **kwargs), opened
+
+
+def test_minconn_opened_upfront_and_reused():
+    # minconn соединений открываются сразу, возвращённое выдаётся повторно
+    pool, opened = make_pool(minconn=2, maxconn=4)
+    assert len(opened) == 2
+
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(opened) == 2
+
+
+def test_acquire_blocks_until_release():
+    # при исчерпанном пуле getconn ждёт возврата соединения
+    pool, _ = make_pool(minconn=0, maxconn=1, acquire_timeout=2)
+    conn = pool.getconn()
+    got = []
+
+    thread = threading.Thread(target=lambda: got.append(pool.getconn()))
+    thread.start()
+    time.sleep(0.05)
+    assert pool.stats()["waiting"] == 1
+
+    pool.putconn(conn)
+    thread.join(1)
+    assert got == [conn]
+
+
+def test_acquire_timeout():
+    pool, _ = make_pool(minconn=0, maxconn=1)
+    pool.getconn()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn(timeout=0.05)
+
+
+def test_stale_connection_is_pinged_and_replaced():
+    # давно простаивающее соединение проверяется, сломанное заменяется новым
+    pool, opened = make_pool(minconn=1, maxconn=1, ping_after=0)
+    opened[0].broken = True
+
+    conn = pool.getconn()
+    assert conn is not opened[0]
+    assert opened[0].closed
+    assert len(opened) == 2
+
+
+def test_healthy_connection_passes_ping():
+    pool, opened = make_pool(minconn=1, maxconn=1, ping_after=0)
+    assert pool.getconn() is opened[0]
+    assert opened[0].pings == 1
+
+
+def test_old_connection_is_recycled_on_release():
+    pool, opened = make_pool(minconn=0, maxconn=1, max_lifetime=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.stats()["idle"] == 0
+
+
+def test_broken_connection_not_returned_to_pool():
+    pool, _ = make_pool(minconn=0, maxconn=1)
+    conn = pool.getconn()
+    conn.broken = True
+    pool.putconn(conn)
+    assert conn.closed
+    # место освободилось — следующее соединение открывается заново
+    assert pool.getconn() is not conn
+
+
+def test_context_manager_returns_connection_on_error():
+    pool, _ = make_pool(minconn=0, maxconn=1)
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError("query failed")
+    assert pool.stats()["in_use"] == 0
+    assert pool.stats()["idle"] == 1
+
+
+def test_stats_and_closeall():
+    pool, opened = make_pool(minconn=2, maxconn=3)
+    conn = pool.getconn()
+    stats = pool.stats()
+    assert stats["in_use"] == 1 and stats["idle"] == 1 and stats["maxconn"] == 3
+
+    pool.closeall()
+    assert opened[1].closed or opened[0].closed
+    pool.putconn(conn)
+    assert conn.closed
+    with pytest.raises(RuntimeError):
+        pool.getconn()
@@ -0,0 +1,51 @@
+from src.answer_generator.context_builder import ContextBuilder, merge_overlapping_text
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def chunk(text, score, start=None, end=None, video_id="vid"):
+    return {"page_content": text, "score": score, "start_time": start, "end_time": end, "video_id": video_id}
+
+
+def test_merge_overlapping_text_drops_shared_words():
+    assert merge_overlapping_text("a b c d", "c d e f") == "a b c d e f"
+    assert merge_overlapping_text("a b", "c d") == "a b c d"
+
+
+def test_packs_by_score_within_budget():
+    builder = ContextBuilder(count_words)
+    chunks = [
+        chunk("low score words here", 0.1),
+        chunk("best chunk", 0.9),
+        chunk("second best chunk text", 0.5),
+    ]
+    built = builder.build(chunks, max_tokens=7)
+    assert [c["page_content"] for c in built.chunks] == ["best chunk", "second best chunk text"]
+    assert built.dropped == 1
+    assert built.tokens <= 7
+
+
+def test_merges_adjacent_windows_by_timestamp():
+    builder = ContextBuilder(count_words)
+    chunks = [
+        chunk("d e f g", 0.8, start=50.0, end=110.0),
+        chunk("a b c d e", 0.9, start=0.0, end=60.0),
+        chunk("x y", 0.7, start=300.0, end=360.0),
+        chunk("other video", 0.6, start=55.0, end=100.0, video_id="vid2"),
+    ]
+    built = builder.build(chunks)
+    texts = [c["page_content"] for c in built.chunks]
+    # окна 0-60 и 50-110 склеены без повтора перекрытия, порядок хронологический
+    assert "a b c d e f g" in texts
+    assert "x y" in texts and "other video" in texts
+    merged = next(c for c in built.chunks if c["page_content"] == "a b c d e f g")
+    assert (merged["start_time"], merged["end_time"]) == (0.0, 110.0)
+    assert len(built.chunks) == 3
+
+
+def test_untimed_chunks_are_not_merged():
+    builder = ContextBuilder(count_words)
+    built = builder.build([chunk("a b", 0.9, 0.0, 0.0), chunk("b c", 0.8, 0.0, 0.0)])
+    assert built.text == "a b\nb c"
@@ -1,5 +1,9 @@
+import re
+
+import numpy as np
 import pytest
 from unittest.mock import MagicMock, patch
+from src.utils.async_db_connector import SEARCH_BATCH_SQL, SEARCH_SQL
 from src.utils.db_connector import DBConnector
 
 
@@ -75,4 +79,113 @@ def test_sql_injection_protection():
 
         # Проверяем параметризованный запрос
         assert "%s" in args[0]  # Должен быть параметризованный запрос
-        assert args[1] == ("hack' OR 1=1--", 0, 1, "text", [])  # Проверяем параметры
+        assert args[1] == ("hack' OR 1=1--", 0, 1, "text", [], None)  # Проверяем параметры
+
+
+def test_search_is_filtered_by_video():
+    """Поиск похожих фрагментов ограничен одним видео, video_id передаётся параметром."""
+    db = DBConnector.__new__(DBConnector)
+    db._pool = MagicMock()
+
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchall.return_value = []
+
+    with patch.object(db, 'get_connection', return_value=mock_conn):
+        db.search_similar_embeddings([0.1, 0.2], top_k=3, video_id="vid1")
+
+        args, _ = mock_cursor.execute.call_args
+        assert "video_id = %s" in args[0]
+        assert args[1] == ("[0.1,0.2]", "vid1", "vid1", "[0.1,0.2]", 3)
+
+
+def test_batch_search_is_one_statement_and_groups_rows():
+    """Пакетный поиск — один execute, строки раскладываются по запросам в исходном порядке."""
+    db = DBConnector.__new__(DBConnector)
+    db._pool = MagicMock()
+
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.fetchall.return_value = [
+        (1, "a", 0.9, None, "[1,0]", 0.0, 60.0, "vid1", "id-a"),
+        (2, "b", 0.8, None, "[0,1]", 50.0, 110.0, "vid1", "id-b"),
+        (1, "c", 0.7, None, "[1,1]", 100.0, 160.0, "vid1", "id-c"),
+    ]
+
+    with patch.object(db, 'get_connection', return_value=mock_conn):
+        rows = db.search_similar_embeddings_batch([[0.1], [0.2], [0.3]], top_k=2, video_id="vid1")
+
+    mock_cursor.execute.assert_called_once()
+    args, _ = mock_cursor.execute.call_args
+    assert "unnest" in args[0] and "LATERAL" in args[0]
+    assert args[1] == (["[0.1]", "[0.2]", "[0.3]"], "vid1", "vid1", 2)
+    assert [[r[0] for r in group] for group in rows] == [["a", "c"], ["b"], []]
+
+
+def test_connection_context_manager_releases():
+    """Контекстный менеджер возвращает соединение в пул и при ошибке."""
+    db = DBConnector.__new__(DBConnector)
+    mock_pool = MagicMock()
+    db._pool = mock_pool
+
+    with pytest.raises(ValueError):
+        with db.connection() as conn:
+            raise ValueError("boom")
+    mock_pool.putconn.assert_called_once_with(conn)
+
+
+# Семантика операторов pgvector: <=> — косинусное расстояние, <#> — отрицательное
+# скалярное произведение, <-> — евклидово расстояние
+PGVECTOR_OPS = {
+    "<=>": lambda a, b: 1 - np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)),
+    "<#>": lambda a, b: -np.dot(a, b),
+    "<->": lambda a, b: np.linalg.norm(np.subtract(a, b)),
+}
+
+
+def reported_similarity(sql, stored, query):
+    """Вычислить колонку similarity из SQL так, как её посчитал бы PostgreSQL."""
+    match = re.search(r"1 - \(embedding (<=>|<#>|<->) [^)]+\) AS similarity", sql)
+    assert match, sql
+    return 1 - PGVECTOR_OPS[match.group(1)](np.array(stored, float), np.array(query, float))
+
+
+def captured_search_sql(method, *args):
+    db = DBConnector.__new__(DBConnector)
+    db._pool = MagicMock()
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = []
+    with patch.object(db, "get_connection", return_value=mock_conn):
+        getattr(db, method)(*args)
+    return mock_cursor.execute.call_args[0][0]
+
+
+@pytest.mark.parametrize("sql", [
+    captured_search_sql("search_similar_embeddings", [0.1, 0.2]),
+    captured_search_sql("search_similar_embeddings_batch", [[0.1, 0.2]]),
+    SEARCH_SQL,
+    SEARCH_BATCH_SQL,
+], ids=["sync", "sync_batch", "async", "async_batch"])
+def test_reported_similarity_is_cosine(sql):
+    """similarity — косинусная близость: не зависит от нормы векторов и лежит в [-1, 1]."""
+    assert reported_similarity(sql, [1.0, 0.0], [1.0, 0.0]) == pytest.approx(1.0)
+    assert reported_similarity(sql, [3.0, 0.0], [0.5, 0.0]) == pytest.approx(1.0)
+    assert reported_similarity(sql, [1.0, 0.0], [0.0, 2.0]) == pytest.approx(0.0)
+    assert reported_similarity(sql, [1.0, 0.0], [-1.0, 0.0]) == pytest.approx(-1.0)
+    assert reported_similarity(sql, [1.0, 1.0], [2.0, 0.0]) == pytest.approx(np.sqrt(0.5))
+
+
+@pytest.mark.parametrize("sql", [
+    captured_search_sql("search_similar_embeddings", [0.1, 0.2]),
+    captured_search_sql("search_similar_embeddings_batch", [[0.1, 0.2]]),
+    SEARCH_SQL,
+    SEARCH_BATCH_SQL,
+], ids=["sync", "sync_batch", "async", "async_batch"])
+def test_search_orders_by_cosine_distance(sql):
+    """Кандидаты сортируются по самому расстоянию <=> по возрастанию — так план использует ivfflat-индекс."""
+    order = re.search(r"ORDER BY (.+?)\s+LIMIT", sql, re.S)
+    assert order, sql
+    assert re.fullmatch(r"embedding <=> \S+", order.group(1).strip())
@@ -1,6 +1,8 @@
+import numpy as np
 import pytest
 from unittest.mock import MagicMock
 from src.core.adapters.db_vector_store import DBVectorStore
+from src.reranker.tokenizer import TOKENIZER
 
 @pytest.fixture
 def mock_db():
@@ -40,25 +42,27 @@ def test_add_calls_db_insert(vector_store, mock_db, mock_embedder):
         start_time=0,
         end_time=1,
         text="text1",
-        embedding=[0.1, 0.2, 0.3]
+        embedding=[0.1, 0.2, 0.3],
+        token_ids=TOKENIZER.encode("text1").tolist()
     )
     mock_db.insert_subtitle.assert_any_call(
         video_id="vid1",
         start_time=1,
         end_time=2,
         text="text2",
-        embedding=[0.4, 0.5, 0.6]
+        embedding=[0.4, 0.5, 0.6],
+        token_ids=TOKENIZER.encode("text2").tolist()
     )
 
 
 def test_search_calls_db_search(vector_store, mock_db, mock_embedder):
     mock_db.search_similar_embeddings.return_value = [
-        ("some text", 0.9),
-        ("another text", 0.7)
+        ("some text", 0.9, [1, 2], "[0.5,0.25]", 0.0, 60.0, "vid1", "id-1"),
+        ("another text", 0.7, None, None, 50.0, 110.0, "vid1", "id-2")
     ]
 
     query = "test query"
-    results = vector_store.search(query, k=2)
+    results = vector_store.search(query, k=2, video_id="vid1")
 
     # Проверяем вызов encode
     mock_embedder.encode.assert_called_once_with(query, convert_to_tensor=False)
@@ -66,10 +70,36 @@ def test_search_calls_db_search(vector_store, mock_db, mock_embedder):
     # Проверяем вызов метода поиска в базе
     emb = mock_embedder.encode.return_value
     expected_emb = emb.tolist() if hasattr(emb, "tolist") else emb
-    mock_db.search_similar_embeddings.assert_called_once_with(expected_emb, top_k=2)
+    # Поиск ограничен одним видео
+    mock_db.search_similar_embeddings.assert_called_once_with(expected_emb, top_k=2, video_id="vid1")
 
     # Проверяем формат результата
-    assert results == [
-        {"page_content": "some text", "score": 0.9},
-        {"page_content": "another text", "score": 0.7}
+    assert [(r["page_content"], r["score"]) for r in results] == [
+        ("some text", 0.9),
+        ("another text", 0.7)
     ]
+    # Сохранённые id токенов возвращаются как int64-массив
+    assert results[0]["token_ids"].dtype == np.int64
+    assert results[0]["token_ids"].tolist() == [1, 2]
+    assert results[1]["token_ids"] is None
+    # Эмбеддинг из текстового представления pgvector
+    assert results[0]["embedding"].tolist() == [0.5, 0.25]
+    assert results[1]["embedding"] is None
+    assert (results[1]["start_time"], results[1]["end_time"]) == (50.0, 110.0)
+    assert [r["id"] for r in results] == ["id-1", "id-2"]
+
+
+def test_search_by_vectors_wraps_each_query(vector_store, mock_db):
+    mock_db.search_similar_embeddings_batch.return_value = [
+        [("some text", 0.9, [1], "[0.5,0.25]", 0.0, 60.0, "vid1", "id-1")],
+        [],
+    ]
+    results = vector_store.search_by_vectors([np.array([0.1, 0.2]), [0.3, 0.4]], k=3, video_id="vid1")
+
+    mock_db.search_similar_embeddings_batch.assert_called_once_with(
+        [[0.1, 0.2], [0.3, 0.4]], top_k=3, video_id="vid1"
+    )
+    assert len(results) == 2
+    assert results[0][0]["page_content"] == "some text"
+    assert results[0][0]["id"] == "id-1"
+    assert results[1] == []
@@ -0,0 +1,208 @@
+import math
+import os
+import time
+
+import pytest
+import yaml
+
+from src.answer_generator.deadline import DEGRADED, Deadline, DeadlinePolicy
+from src.answer_generator.generation import GenerationParams
+from src.answer_generator.rag_model import PreparedQuery
+from src.answer_generator.scheduler import LLMScheduler, QueueTimeoutError
+
+
+class SlowLLM:
+    """LLM-заглушка: кусок текста раз в delay секунд, запоминает отмену и закрытие."""
+
+    def __init__(self, pieces=20, delay=0.02):
+        self.pieces = pieces
+        self.delay = delay
+        self.max_length = None
+        self.cancelled = False
+        self.closed = False
+
+    def generate(self, prompt, max_length=200):
+        self.max_length = max_length
+        return " full answer "
+
+    def stream_generate(self, prompt, max_length=200, cancel_event=None):
+        self.max_length = max_length
+        try:
+            for i in range(self.pieces):
+                if cancel_event is not None and cancel_event.is_set():
+                    self.cancelled = True
+                    return
+                time.sleep(self.delay)
+                yield f"t{i} "
+        finally:
+            self.closed = True
+
+
+@pytest.fixture
+def make_model(rag_model):
+    # RAGModel без загрузки моделей и БД: только то, что нужно этапу генерации
+    def make(llm, scheduler=None, policy=None):
+        return rag_model(
+            llm=llm,
+            scheduler=scheduler or LLMScheduler(slots=1, max_queue=4, queue_timeout=5),
+            deadline_policy=policy or DeadlinePolicy(generation_seconds=0.05, tokens_per_second=1000),
+            generation=GenerationParams(max_tokens=1024),
+        )
+
+    return make
+
+
+def test_deadline_without_budget_never_expires():
+    deadline = Deadline()
+    assert deadline.remaining() == math.inf
+    assert not deadline.expired()
+    assert not deadline.degraded
+
+
+def test_deadline_expires_and_records_reasons_once():
+    deadline = Deadline(0.01)
+    time.sleep(0.02)
+    assert deadline.expired()
+    before = DEGRADED.value(reason="test_reason")
+    deadline.degrade("test_reason")
+    deadline.degrade("test_reason")
+    assert deadline.reasons == ["test_reason"]
+    assert DEGRADED.value(reason="test_reason") == before + 1
+
+
+def test_policy_request_budget_default_and_cap():
+    policy = DeadlinePolicy(default_seconds=10, max_seconds=30)
+    assert policy.new_deadline().seconds == 10
+    assert policy.new_deadline(5).seconds == 5
+    assert policy.new_deadline(100).seconds == 30
+    assert DeadlinePolicy().new_deadline().at is None
+
+
+def test_shipped_config_has_no_default_deadline():
+    # без "timeout" в запросе дедлайна нет: поведение по умолчанию не меняется
+    with open(os.path.join(os.path.dirname(__file__), "..", "config", "config.yaml"), encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    # секция deadline передаётся так же, как в RAGModel
+    assert "default_seconds" in config["deadline"]
+    policy = DeadlinePolicy.from_config(config["deadline"])
+    assert policy.new_deadline().at is None
+    assert policy.new_deadline(5).seconds == 5
+    assert policy.new_deadline(10 ** 6).seconds == config["deadline"]["max_seconds"]
+
+
+def test_policy_degrades_stages_by_remaining_time():
+    policy = DeadlinePolicy(full_retrieval_seconds=5, rerank_seconds=3, generation_seconds=2, tokens_per_second=10)
+    roomy = Deadline(200)
+    assert policy.retrieval_k(roomy, 10, floor=3) == 10
+    assert policy.allow_rerank(roomy) and policy.allow_generation(roomy)
+    assert policy.max_tokens(roomy, 1024) == 1024
+    assert not roomy.degraded
+
+    short = Deadline(2.5)
+    assert policy.retrieval_k(short, 10, floor=3) == 5
+    assert policy.retrieval_k(short, 4, floor=3) == 3
+    assert not policy.allow_rerank(short)
+    assert policy.allow_generation(short)
+    assert policy.max_tokens(short, 1024) <= 25
+    assert short.reasons == ["top_k_reduced", "rerank_skipped", "max_length_capped"]
+
+    assert not policy.allow_generation(Deadline(1))
+
+
+def test_generate_without_deadline_uses_plain_generate(make_model):
+    llm = SlowLLM()
+    answer = make_model(llm)._generate_answer("prompt")
+    assert answer == "full answer"
+    assert llm.max_length == 1024
+
+
+def test_generation_cancelled_at_deadline(make_model):
+    llm = SlowLLM(pieces=100, delay=0.02)
+    model = make_model(llm)
+    deadline = Deadline(0.2)
+
+    start = time.monotonic()
+    answer = model._generate_answer("prompt", deadline)
+    assert time.monotonic() - start < 0.5
+    assert answer.startswith("t0")
+    assert "generation_cut" in deadline.reasons
+    # генератор закрыт, слот планировщика освобождён
+    assert llm.closed
+    assert model.scheduler.stats()["busy"] == 0
+
+
+def test_max_length_capped_by_remaining_time(make_model):
+    llm = SlowLLM(pieces=1, delay=0)
+    model = make_model(llm, policy=DeadlinePolicy(generation_seconds=0.05, tokens_per_second=100))
+    deadline = Deadline(1.0)
+    model._generate_answer("prompt", deadline)
+    assert llm.max_length <= 100
+    assert "max_length_capped" in deadline.reasons
+
+
+def test_no_time_for_generation_returns_chunks(make_model):
+    llm = SlowLLM()
+    model = make_model(llm, policy=DeadlinePolicy(generation_seconds=1.0))
+    prepared = PreparedQuery(video_id="vid", prompt="p", chunks=[
+        {"page_content": "first chunk", "start_time": 12.0},
+        {"page_content": "second chunk", "start_time": 40.0},
+    ])
+    deadline = Deadline(0.5)
+    answer = model._answer_prepared(prepared, deadline)
+    assert "1. first chunk (https://youtu.be/vid?t=12)" in answer
+    assert "2. second chunk" in answer
+    assert deadline.reasons == ["retrieval_only"]
+    assert llm.max_length is None
+
+
+def test_slot_wait_ends_before_deadline_with_chunks(make_model):
+    scheduler = LLMScheduler(slots=1, max_queue=4, queue_timeout=5)
+    model = make_model(SlowLLM(), scheduler=scheduler, policy=DeadlinePolicy(generation_seconds=0.1))
+    prepared = PreparedQuery(video_id="vid", prompt="p", chunks=[{"page_content": "only chunk"}])
+    scheduler.acquire()  # слот занят другим запросом
+    try:
+        deadline = Deadline(0.3)
+        start = time.monotonic()
+        answer = model._answer_prepared(prepared, deadline)
+        # ждали слот только до deadline - generation_seconds
+        assert time.monotonic() - start < 0.3
+        assert "only chunk" in answer
+        assert deadline.reasons == ["retrieval_only"]
+    finally:
+        scheduler.release()
+
+
+def test_scheduler_queue_timeout_still_reported_as_overload(make_model):
+    scheduler = LLMScheduler(slots=1, max_queue=4, queue_timeout=0.05)
+    model = make_model(SlowLLM(), scheduler=scheduler, policy=DeadlinePolicy(generation_seconds=0.1))
+    scheduler.acquire()
+    try:
+        with pytest.raises(QueueTimeoutError):
+            model._answer_prepared(PreparedQuery(video_id="vid", prompt="p"), Deadline(60))
+    finally:
+        scheduler.release()
+
+
+class ForwardingLLM(SlowLLM):
+    """Как RemoteLLM: принимает крайний срок ожидания слота для сервера моделей."""
+
+    forwards_slot_deadline = True
+
+    def __init__(self):
+        super().__init__(pieces=1, delay=0)
+        self.slot_deadline = None
+
+    def stream_generate(self, prompt, max_length=200, cancel_event=None, slot_deadline=None):
+        self.slot_deadline = slot_deadline
+        return super().stream_generate(prompt, max_length, cancel_event)
+
+
+def test_slot_deadline_is_forwarded_to_remote_llm(make_model):
+    llm = ForwardingLLM()
+    model = make_model(llm, policy=DeadlinePolicy(generation_seconds=0.5))
+    deadline = Deadline(10)
+    model._generate_answer("prompt", deadline)
+    # сервер моделей ждёт слот не дольше, чем запрос ещё может начать генерацию
+    assert llm.slot_deadline == pytest.approx(deadline.at - 0.5)
+    # локальные LLM этот аргумент не получают
+    assert make_model(SlowLLM(pieces=1, delay=0))._generate_answer("prompt", Deadline(10)) == "t0"
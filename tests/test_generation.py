@@ -0,0 +1,137 @@
+import numpy as np
+
+from src.answer_generator.batching import GenerationRequest
+from src.answer_generator.generation import (
+    AnswerLengthPolicy, GenerationParams, StopFilter, truncate_at_stop
+)
+from src.answer_generator.model_factory import StopTextCriteria, sampling_kwargs
+from src.answer_generator.rag_model import PreparedQuery
+
+
+def test_params_from_config_merge_language_overrides():
+    config = {
+        "generation": {"max_tokens": 512, "stop": ["###"], "temperature": None},
+        "models": {"ru": {"generation": {"temperature": 0.3}}, "en": {}},
+    }
+    ru = GenerationParams.from_config(config, "ru")
+    assert (ru.max_tokens, ru.stop, ru.temperature) == (512, ["###"], 0.3)
+    en = GenerationParams.from_config(config, "en")
+    assert en.temperature is None
+    assert GenerationParams.from_config({}, "ru").max_tokens == 1024
+
+
+def test_request_overrides_and_llm_kwargs():
+    base = GenerationParams(max_tokens=512, stop=["###"])
+    assert base.with_overrides() is base
+    assert base.llm_kwargs() == {"stop": ["###"]}
+
+    custom = base.with_overrides(max_tokens=64, temperature=0.0)
+    assert (custom.max_tokens, custom.stop, custom.temperature) == (64, ["###"], 0.0)
+    # явный max_tokens отключает адаптивный лимит
+    assert base.adaptive and not custom.adaptive
+    assert custom.llm_kwargs() == {"stop": ["###"], "temperature": 0.0}
+    assert GenerationParams().llm_kwargs() == {}
+
+
+def test_truncate_at_earliest_stop():
+    assert truncate_at_stop("answer\n**Question:** more", ["**Question:**"]) == "answer\n"
+    assert truncate_at_stop("a STOP b END c", ["END", "STOP"]) == "a "
+    assert truncate_at_stop("no stops", ["END"]) == "no stops"
+    assert truncate_at_stop("text", None) == "text"
+
+
+def test_stop_filter_holds_back_partial_stop_across_pieces():
+    f = StopFilter(["**Question:**"])
+    out = [f.feed(p) for p in ["Ответ ", "готов.", "\n**Que", "stion:** ещё"]]
+    assert "".join(out) == "Ответ готов.\n"
+    # частичное совпадение не отдаётся, пока не ясно, стоп ли это
+    assert out[2] == "\n"
+    assert f.stopped
+    assert f.feed("хвост") == "" and f.flush() == ""
+
+
+def test_stop_filter_releases_false_partial_match():
+    f = StopFilter(["END"])
+    assert f.feed("the E") == "the "
+    assert f.feed("ND?") == ""
+    assert f.stopped
+
+    f = StopFilter(["END"])
+    assert f.feed("the E") == "the "
+    assert f.feed("xit") == "Exit"
+    assert f.feed("  EN") == "  "
+    assert f.flush() == "EN"
+
+
+def test_stop_filter_without_stops_passes_through():
+    f = StopFilter()
+    assert f.feed("abc") == "abc" and f.flush() == ""
+
+
+def test_batched_request_applies_stop_sequences():
+    request = GenerationRequest("prompt", 100, stop=["\n\n"])
+    for piece in ["one", "\n", "\nignored"]:
+        request.emit(piece)
+    request.finish()
+    assert request.stopped
+    assert "".join(request.stream()) == "one"
+
+    request = GenerationRequest("prompt", 100, stop=["END"])
+    request.emit("tail E")
+    request.finish()
+    assert "".join(request.stream()) == "tail E"
+
+
+class CharTokenizer:
+    """Токенизатор-заглушка: один токен — один символ."""
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(int(i)) for i in ids)
+
+
+def test_stop_text_criteria_checks_generated_tail_only():
+    prompt = [ord(c) for c in "**Question:** q\n"]
+    criteria = StopTextCriteria(CharTokenizer(), ["**Question:**"])
+    # стоп-строка в промпте не останавливает генерацию
+    ids = prompt + [ord("A")]
+    assert not criteria(np.array([ids]), None)
+    ids += [ord(c) for c in "nswer\n**Question:"]
+    assert not criteria(np.array([ids]), None)
+    ids += [ord("*"), ord("*")]
+    assert criteria(np.array([ids]), None)
+
+
+def test_sampling_kwargs():
+    assert sampling_kwargs(None) == {}
+    assert sampling_kwargs(0) == {"do_sample": False}
+    assert sampling_kwargs(0.7) == {"do_sample": True, "temperature": 0.7}
+
+
+def test_answer_length_policy_by_question_type_and_context():
+    policy = AnswerLengthPolicy(enabled=True, short_tokens=100, medium_tokens=300, context_ratio=0.5, min_tokens=50)
+    assert policy.question_type("Сколько лет автору?") == "short"
+    assert policy.question_type("When was it released?") == "short"
+    assert policy.question_type("Почему так произошло?") == "long"
+    assert policy.question_type("Explain the main idea") == "long"
+    assert policy.question_type("О чём видео?") == "medium"
+
+    assert policy.cap("Кто автор?", 2000, 1024) == 100
+    assert policy.cap("О чём видео?", 2000, 1024) == 300
+    assert policy.cap("Почему так?", 4000, 1024) == 1024
+    # маленький контекст ограничивает ответ, но не ниже min_tokens
+    assert policy.cap("Почему так?", 400, 1024) == 200
+    assert policy.cap("Почему так?", 20, 1024) == 50
+    assert AnswerLengthPolicy(enabled=False).cap("Кто автор?", 100, 1024) == 1024
+
+
+def test_rag_model_generation_params_respect_request_max_tokens(rag_model):
+    model = rag_model(
+        generation=GenerationParams(max_tokens=1024, stop=["###"]),
+        answer_length=AnswerLengthPolicy(enabled=True, short_tokens=128),
+    )
+    prepared = PreparedQuery(video_id="v", prompt="p", context_tokens=1000)
+
+    params = model._generation_params("Кто автор?", prepared)
+    assert params.max_tokens == 128 and params.stop == ["###"]
+    explicit = model.generation.with_overrides(max_tokens=900)
+    assert model._generation_params("Кто автор?", prepared, explicit).max_tokens == 900
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from src.utils import instrumentation
+from src.utils.instrumentation import (
+    COMPLETION_TOKENS, PROMPT_TOKENS, STAGE_ERRORS, STAGE_SECONDS, TOKENS_PER_SECOND,
+    generation_meter, record_generation, span
+)
+
+
+@pytest.fixture(autouse=True)
+def enabled():
+    instrumentation.set_enabled(True)
+    yield
+    instrumentation.set_enabled(True)
+
+
+def test_span_observes_stage_duration():
+    before = STAGE_SECONDS.count(stage="test_stage")
+    with span("test_stage"):
+        time.sleep(0.01)
+    assert STAGE_SECONDS.count(stage="test_stage") == before + 1
+    assert STAGE_SECONDS.sum(stage="test_stage") >= 0.01
+
+
+def test_span_counts_errors_and_reraises():
+    before = STAGE_ERRORS.value(stage="test_failing")
+    with pytest.raises(ValueError):
+        with span("test_failing"):
+            raise ValueError("boom")
+    assert STAGE_ERRORS.value(stage="test_failing") == before + 1
+
+
+def test_disabled_mode_records_nothing():
+    # выключенный режим: общий пустой контекст, метрики не меняются
+    instrumentation.configure({"instrumentation": {"enabled": False}})
+    assert span("a") is span("b")
+    before = STAGE_SECONDS.count(stage="test_disabled")
+    with span("test_disabled"):
+        pass
+    meter = generation_meter("test-backend-off")
+    assert not meter.active
+    meter.token()
+    meter.finish(prompt_tokens=10)
+    assert STAGE_SECONDS.count(stage="test_disabled") == before
+    assert COMPLETION_TOKENS.value(backend="test-backend-off") == 0
+
+
+def test_generation_meter_splits_prefill_and_decode():
+    prefill_before = STAGE_SECONDS.count(stage="prefill")
+    meter = generation_meter("test-backend")
+    time.sleep(0.02)  # «prefill» до первого токена
+    for _ in range(4):
+        meter.token()
+    meter.finish(prompt_tokens=100)
+
+    assert STAGE_SECONDS.count(stage="prefill") == prefill_before + 1
+    assert PROMPT_TOKENS.value(backend="test-backend") == 100
+    assert COMPLETION_TOKENS.value(backend="test-backend") == 4
+
+
+def test_record_generation_tokens_per_second():
+    record_generation("test-rate", prompt_tokens=None, completion_tokens=50,
+                      prefill_seconds=None, decode_seconds=2.0)
+    assert TOKENS_PER_SECOND.sum(backend="test-rate") == pytest.approx(25.0)
+    assert PROMPT_TOKENS.value(backend="test-rate") == 0
@@ -0,0 +1,34 @@
+import subprocess
+import sys
+
+import pytest
+
+# Тяжёлые зависимости, которые должны загружаться только при использовании
+HEAVY = ["torch", "transformers", "sentence_transformers", "llama_cpp", "sklearn", "yt_dlp", "youtube_transcript_api"]
+
+
+def import_in_fresh_interpreter(module: str) -> subprocess.CompletedProcess:
+    code = (
+        f"import sys, {module}\n"
+        f"print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    )
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+
+
+@pytest.mark.parametrize("module", [
+    "src.answer_generator.model_factory",
+    "src.answer_generator.rag_model",
+    "src.reranker.reranker",
+    "src.data_processing.subtitle_extractor",
+])
+def test_module_import_does_not_load_heavy_dependencies(module):
+    result = import_in_fresh_interpreter(module)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_db_connector_import_has_no_output():
+    # импорт не читает окружение и ничего не печатает
+    result = import_in_fresh_interpreter("src.utils.db_connector")
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.utils.logger_loader import (
+    DROPPED_RECORDS, JsonFormatter, LoggerLoader, RequestIdFilter, SamplingFilter, _QueueHandler,
+    bind_request_id, get_request_id, reset_request_id, set_request_id
+)
+
+
+def make_record(msg="hello %s", args=("world",), level=logging.INFO, lineno=10, exc_info=None, **extra):
+    record = logging.LogRecord("src.test", level, "/src/test.py", lineno, msg, args, exc_info)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_request_id_filter_uses_context():
+    record = make_record()
+    RequestIdFilter().filter(record)
+    assert record.request_id == "-"
+
+    token = set_request_id("abc")
+    try:
+        record = make_record()
+        RequestIdFilter().filter(record)
+        assert record.request_id == "abc"
+    finally:
+        reset_request_id(token)
+    assert get_request_id() is None
+
+
+def test_bind_request_id_carries_id_into_threads():
+    seen = []
+
+    def work():
+        seen.append(get_request_id())
+
+    token = set_request_id("req-42")
+    try:
+        bound = bind_request_id(work)
+    finally:
+        reset_request_id(token)
+    # обычный поток контекст не наследует, обёрнутая функция — да (и из нескольких потоков сразу)
+    threads = [threading.Thread(target=work)] + [threading.Thread(target=bound) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert seen.count(None) == 1
+    assert seen.count("req-42") == 3
+
+
+def test_sampling_filter_keeps_every_nth_debug_per_call_site():
+    sampler = SamplingFilter(every=3)
+    kept = [sampler.filter(make_record(level=logging.DEBUG, lineno=1)) for _ in range(9)]
+    assert kept.count(True) == 3
+    # другое место в коде считается отдельно, INFO не сэмплируется
+    assert sampler.filter(make_record(level=logging.DEBUG, lineno=2))
+    assert all(sampler.filter(make_record(level=logging.INFO, lineno=1)) for _ in range(5))
+
+
+def test_json_formatter_includes_extra_and_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record(exc_info=sys.exc_info(), request_id="r1", video_id="vid")
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "hello world"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "src.test"
+    assert entry["request_id"] == "r1"
+    assert entry["video_id"] == "vid"
+    assert "ValueError: boom" in entry["exc"]
+
+
+def test_queue_handler_prepares_record_and_drops_when_full():
+    q = queue.Queue(maxsize=1)
+    handler = _QueueHandler(q)
+    try:
+        raise RuntimeError("bad")
+    except RuntimeError:
+        handler.handle(make_record(exc_info=sys.exc_info()))
+
+    record = q.get_nowait()
+    # сообщение собрано в потоке вызова, трейсбек сохранён текстом
+    assert record.msg == "hello world" and record.args is None
+    assert record.exc_info is None and "RuntimeError: bad" in record.exc_text
+
+    before = DROPPED_RECORDS.value()
+    handler.handle(make_record())
+    handler.handle(make_record())
+    assert DROPPED_RECORDS.value() == before + 1
+
+
+def test_get_logger_returns_module_logger():
+    assert LoggerLoader.get_logger("src.some.module").name == "src.some.module"
+    assert LoggerLoader.get_logger() is logging.getLogger()
+
+
+def test_import_does_not_start_logging(tmp_path):
+    # импорт приложения не поднимает поток записи и не создаёт logs/app.log
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": root}
+    env.pop("LOG_FILE", None)
+    code = (
+        "import logging, os, src.api.main; "
+        "print(len(logging.getLogger().handlers), os.path.exists('logs'))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, cwd=tmp_path)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "0 False"
+
+
+def test_cli_entry_point_configures_logging(tmp_path):
+    # run.main() сам поднимает логирование: INFO доходит до файла лога
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    log_file = tmp_path / "app.log"
+    env = {**os.environ, "PYTHONPATH": root, "LOG_FILE": str(log_file), "LOG_LEVEL": "INFO"}
+    code = (
+        "import run\n"
+        "def no_db():\n"
+        "    raise RuntimeError('no db')\n"
+        "run.DBConnector = no_db\n"
+        "run.main()\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, cwd=root)
+    assert result.returncode == 0, result.stderr
+    text = log_file.read_text(encoding="utf-8")
+    assert "INFO" in text and "Запуск пайплайна RAG" in text
+
+
+@pytest.mark.parametrize("incoming, kept", [
+    ("abc-123_X.9", True),
+    ("a" * 64, True),
+    ("a" * 65, False),
+    ("id with spaces", False),
+    ("../../etc/passwd", False),
+    ("id\u0442", False),
+])
+def test_request_id_header_is_validated(incoming, kept):
+    from src.api import main
+
+    headers = {"X-Request-Id": incoming.encode("utf-8")}
+    rid = TestClient(main.app).get("/health", headers=headers).headers["X-Request-Id"]
+    if kept:
+        assert rid == incoming
+    else:
+        # недопустимый id заменяется сгенерированным, а не обрезается
+        assert rid != incoming and main.REQUEST_ID_RE.fullmatch(rid) and len(rid) == 32
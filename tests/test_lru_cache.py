@@ -0,0 +1,32 @@
+import time
+
+from src.utils.lru_cache import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "a" становится самым свежим
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_ttl_expiry():
+    cache = LRUCache(maxsize=4, ttl=0.01)
+    cache.put("k", "v")
+    assert cache.get("k") == "v"
+    time.sleep(0.02)
+    assert cache.get("k", "miss") == "miss"
+    assert len(cache) == 0
+
+
+def test_items_snapshot_skips_expired():
+    cache = LRUCache(maxsize=4, ttl=0.05)
+    cache.put("old", 1)
+    time.sleep(0.06)
+    cache.put("new", 2)
+    assert cache.items() == [("new", 2)]
+    assert len(cache) == 1
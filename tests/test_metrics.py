@@ -0,0 +1,55 @@
+import pytest
+
+from src.utils.metrics import MetricsRegistry
+
+
+def test_registry_returns_same_metric_by_name():
+    reg = MetricsRegistry()
+    c = reg.counter("requests_total")
+    assert reg.counter("requests_total") is c
+    c.inc(path="a")
+    c.inc(2, path="a")
+    assert c.value(path="a") == 3
+    assert c.value(path="b") == 0
+    with pytest.raises(ValueError):
+        reg.gauge("requests_total")
+
+
+def test_histogram_buckets_are_cumulative():
+    reg = MetricsRegistry()
+    h = reg.histogram("latency_seconds", buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 2.0):
+        h.observe(v)
+    samples = {(name, dict(labels).get("le")): val for name, labels, val in h.samples()}
+    assert samples[("latency_seconds_bucket", "0.1")] == 1
+    assert samples[("latency_seconds_bucket", "1.0")] == 2
+    assert samples[("latency_seconds_bucket", "+Inf")] == 3
+    assert h.count() == 3
+    assert h.sum() == pytest.approx(2.55)
+
+
+def test_render_prometheus_text():
+    reg = MetricsRegistry()
+    reg.counter("requests_total", "Total requests").inc(path='a"b')
+    reg.gauge("queue_depth").set(3)
+    reg.histogram("latency_seconds", buckets=(0.5,)).observe(0.25)
+    text = reg.render()
+    assert "# HELP requests_total Total requests" in text
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{path="a\\"b"} 1' in text
+    assert "queue_depth 3" in text
+    assert 'latency_seconds_bucket{le="0.5"} 1' in text
+    assert "latency_seconds_sum 0.25" in text
+
+
+def test_render_merges_remote_snapshot_into_one_family():
+    worker, server = MetricsRegistry(), MetricsRegistry()
+    worker.counter("llm_completion_tokens_total", "Tokens").inc(3, backend="remote")
+    server.counter("llm_completion_tokens_total", "Tokens").inc(7, backend="llama.cpp")
+    server.histogram("llm_prefill_seconds", buckets=(1.0,)).observe(0.5)
+    text = worker.render([({"process": "model_server"}, server.snapshot())])
+    # одноимённая метрика — одно семейство с сэмплами обоих процессов
+    assert text.count("# TYPE llm_completion_tokens_total counter") == 1
+    assert 'llm_completion_tokens_total{backend="remote"} 3' in text
+    assert 'llm_completion_tokens_total{backend="llama.cpp",process="model_server"} 7' in text
+    assert 'llm_prefill_seconds_bucket{le="1.0",process="model_server"} 1' in text
@@ -2,6 +2,7 @@ import pytest
 
 from src.answer_generator.model_factory import model_factory, TransformersLLM, LlamaCppLLM
 from src.utils.logger_loader import LoggerLoader
+from src.utils.metrics import REGISTRY
 
 # Заглушка для генерации текстов
 class DummyLLM:
@@ -21,10 +22,10 @@ def patch_dependencies(monkeypatch):
     # Подменяем класс LlamaCppLLM внутри фабрики
     monkeypatch.setattr(
         'src.answer_generator.model_factory.LlamaCppLLM',
-        lambda model_path, n_ctx=2048: DummyLLM()
+        lambda model_path, n_ctx=2048, **kwargs: DummyLLM()
     )
     # Подменяем LoggerLoader, чтобы не писать в лог
-    monkeypatch.setattr(LoggerLoader, 'get_logger', lambda: None)
+    monkeypatch.setattr(LoggerLoader, 'get_logger', lambda name=None: None)
 
 
 def test_model_factory_llama_cpp():
@@ -78,4 +79,44 @@ def test_model_factory_unknown_backend_raises():
     }
     # Ожидаем ValueError при неизвестном backend
     with pytest.raises(Exception):
-        model_factory(config)
\ No newline at end of file
+        model_factory(config)
+
+class FakeLlamaState:
+    """llama.cpp-заглушка: хранит токены в KV и считает загрузки состояния."""
+
+    def __init__(self, tokens):
+        self.input_ids = list(tokens)
+        self.n_tokens = len(tokens)
+        self.loads = 0
+
+    def load_state(self, state):
+        self.loads += 1
+        self.input_ids = list(state)
+        self.n_tokens = len(state)
+
+
+def test_prefix_savings_counted_only_when_state_is_restored():
+    llm = LlamaCppLLM.__new__(LlamaCppLLM)
+    llm._prefix_text = "Правила: "
+    llm._prefix_tokens = [1, 2, 3]
+    llm._prefix_state = [1, 2, 3]
+    llm._prefix_eval_seconds = 0.5
+    llm._prefix_hits = REGISTRY.counter("test_prefix_hits_total", "")
+    llm._prefill_saved = REGISTRY.counter("test_prefill_saved_seconds_total", "")
+
+    # KV и так начинается с префикса — llama.cpp переиспользует его сам, выигрыша нет
+    llm.llm = FakeLlamaState([1, 2, 3, 9])
+    llm._restore_prefix("Правила: вопрос")
+    assert llm.llm.loads == 0
+    assert llm._prefix_hits.value() == 0 and llm._prefill_saved.value() == 0
+
+    # KV занят другим промптом — префикс восстанавливается из сохранённого состояния
+    llm.llm = FakeLlamaState([7, 8])
+    llm._restore_prefix("Правила: вопрос")
+    assert llm.llm.loads == 1
+    assert llm._prefix_hits.value() == 1
+    assert 0 < llm._prefill_saved.value() <= 0.5
+
+    # промпт без префикса не трогаем
+    llm._restore_prefix("Другой промпт")
+    assert llm._prefix_hits.value() == 1
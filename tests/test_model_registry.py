@@ -0,0 +1,93 @@
+import sys
+import threading
+import types
+import pytest
+
+from src.answer_generator.model_registry import ModelRegistry
+
+
+class DummyLLM:
+    def __init__(self):
+        self.prefixes = []
+
+    def warm_prefix(self, prefix):
+        self.prefixes.append(prefix)
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    # Промпт во временной папке и фейковый model_factory, считающий вызовы
+    (tmp_path / "prompt_ru.txt").write_text("Правила\n{context}\n{query}", encoding="utf-8")
+    created = []
+
+    def fake_factory(config):
+        created.append(config)
+        return DummyLLM()
+
+    module = types.ModuleType("src.answer_generator.model_factory")
+    module.model_factory = fake_factory
+    monkeypatch.setitem(sys.modules, "src.answer_generator.model_factory", module)
+
+    reg = ModelRegistry.get_registry()
+    reg.clear()
+    monkeypatch.setattr(reg.prompt_loader, "prompts_dir", str(tmp_path))
+    monkeypatch.setattr(reg.prompt_loader, "prompts_cache", {})
+    reg.created = created
+    yield reg
+    reg.clear()
+
+
+CONFIG = {"language": "ru", "models": {"ru": {"backend": "llama.cpp", "model_path": "m.gguf"}}}
+
+
+def test_llm_created_once_and_shared(registry):
+    first = registry.get_llm(CONFIG)
+    second = ModelRegistry.get_registry().get_llm(dict(CONFIG))
+    assert first is second
+    assert len(registry.created) == 1
+    # статический префикс прогрет один раз при создании
+    assert first.prefixes == ["Правила\n"]
+
+
+def test_different_model_gets_own_instance(registry):
+    other = {"language": "ru", "models": {"ru": {"backend": "llama.cpp", "model_path": "other.gguf"}}}
+    assert registry.get_llm(CONFIG) is not registry.get_llm(other)
+    assert len(registry.created) == 2
+
+
+def test_prompt_cached(registry):
+    assert registry.get_prompt("ru") is registry.get_prompt("ru")
+
+
+def test_concurrent_get_or_create_builds_once(registry):
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def factory():
+        calls.append(1)
+        return object()
+
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(registry.get_or_create("key", factory))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_scheduler_slots_follow_batch_size(registry):
+    batched = {
+        "language": "en",
+        "llm_scheduler": {"slots": 1},
+        "models": {"en": {"backend": "transformers", "model_name": "m", "batching": {"enabled": True, "max_batch_size": 6}}},
+    }
+    assert registry.get_scheduler(batched).slots == 6
+    # без batching слоты берутся из конфига как есть
+    assert registry.get_scheduler(dict(CONFIG, llm_scheduler={"slots": 2})).slots == 2
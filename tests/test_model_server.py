@@ -0,0 +1,236 @@
+import os
+import stat
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.answer_generator.model_server import (
+    ModelClient,
+    ModelServer,
+    ModelServerError,
+    RemoteEmbedder,
+    RemoteLLM,
+    authkey_path,
+    create_authkey,
+    default_address,
+    server_address,
+    server_authkey,
+)
+from src.answer_generator.scheduler import LLMScheduler, QueueFullError, QueueTimeoutError
+from src.core.abstractions.llm import BaseLLM
+
+
+class FakeLLM(BaseLLM):
+    context_window = 4096
+
+    def __init__(self):
+        self.cancel_event = None
+        self.stopped = threading.Event()
+
+    def generate(self, prompt, max_length=200):
+        return f"answer to {prompt} ({max_length})"
+
+    def stream_generate(self, prompt, max_length=200, cancel_event=None):
+        self.cancel_event = cancel_event
+        try:
+            for i in range(max_length):
+                yield f"t{i} "
+                time.sleep(0.01)
+        finally:
+            self.stopped.set()
+
+
+class FakeEmbedder:
+    model_name = "fake-mpnet"
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, convert_to_tensor=False, **kwargs):
+        self.calls.append(list(texts))
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def server(tmp_path):
+    # Сервер моделей на Unix-сокете во временной папке
+    srv = ModelServer(
+        FakeLLM(), FakeEmbedder(), address=str(tmp_path / "run" / "models.sock"),
+        authkey=b"secret", embed_window_ms=50
+    )
+    srv.start()
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.close()
+    thread.join(1)
+
+
+@pytest.fixture
+def client(server):
+    c = ModelClient(server.address, authkey=b"secret")
+    yield c
+    c.close()
+
+
+def test_remote_llm_generate_and_info(client):
+    llm = RemoteLLM(client)
+    assert llm.context_window == 4096
+    assert llm.generate("q", max_length=5) == "answer to q (5)"
+    assert llm.count_tokens("abcdefgh") == 2
+
+
+def test_remote_stream(client):
+    llm = RemoteLLM(client)
+    assert "".join(llm.stream_generate("q", max_length=3)) == "t0 t1 t2 "
+
+
+def test_abandoned_stream_cancels_generation(server, client):
+    # потребитель бросил поток — сервер останавливает генерацию
+    stream = RemoteLLM(client).stream_generate("q", max_length=1000)
+    next(stream)
+    stream.close()
+    assert server.llm.stopped.wait(2)
+    assert server.llm.cancel_event.is_set()
+
+
+def test_scheduler_rejection_keeps_type(server, client):
+    server.scheduler = LLMScheduler(slots=1, max_queue=0)
+    server.scheduler.acquire()
+    try:
+        with pytest.raises(QueueFullError):
+            RemoteLLM(client).generate("q")
+    finally:
+        server.scheduler.release()
+
+
+def test_slot_wait_on_server_respects_request_deadline(server, client):
+    # слот сервера занят: запрос ждёт его не дольше остатка своего дедлайна, а не queue_timeout
+    server.scheduler = LLMScheduler(slots=1, max_queue=4, queue_timeout=30)
+    server.scheduler.acquire()
+    llm = RemoteLLM(client)
+    try:
+        start = time.monotonic()
+        with pytest.raises(QueueTimeoutError):
+            llm.generate("q", slot_deadline=time.monotonic() + 0.2)
+        with pytest.raises(QueueTimeoutError):
+            list(llm.stream_generate("q", max_length=3, slot_deadline=time.monotonic() + 0.2))
+        assert time.monotonic() - start < 5
+    finally:
+        server.scheduler.release()
+    assert llm.generate("q", max_length=1, slot_deadline=time.monotonic() + 5) == "answer to q (1)"
+
+
+def test_metrics_rpc_returns_server_registry(client):
+    from src.utils.metrics import REGISTRY
+
+    REGISTRY.counter("test_model_server_tokens_total", "Tokens").inc(5)
+    families = {name: samples for name, _, _, samples in client.metrics()}
+    assert families["test_model_server_tokens_total"] == [("test_model_server_tokens_total", (), 5.0)]
+
+
+def test_concurrent_encodes_are_batched(server, client):
+    embedder = RemoteEmbedder(client, "fake-mpnet")
+    results = {}
+
+    def encode(text):
+        results[text] = embedder.encode(text)
+
+    threads = [threading.Thread(target=encode, args=(t,)) for t in ("a", "bb", "ccc", "dddd")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(2)
+
+    # одиночный текст — один вектор, соответствующий своему тексту
+    assert {k: v[0] for k, v in results.items()} == {"a": 1.0, "bb": 2.0, "ccc": 3.0, "dddd": 4.0}
+    assert len(server.embedder.calls) < 4
+    assert embedder.embed_documents(["xy"]) == [[2.0, 1.0]]
+
+
+def test_client_reconnects_after_server_restart(tmp_path):
+    address = str(tmp_path / "run" / "models.sock")
+    client = ModelClient(address, authkey=b"secret")
+    for _ in range(2):
+        srv = ModelServer(FakeLLM(), FakeEmbedder(), address=address, authkey=b"secret")
+        srv.start()
+        thread = threading.Thread(target=srv.serve_forever, daemon=True)
+        thread.start()
+        assert client.call("count_tokens", "abcd") == 1
+        srv.close()
+        thread.join(1)
+    client.close()
+
+
+def test_registry_returns_remote_models_when_enabled(server, monkeypatch):
+    from src.answer_generator.model_registry import ModelRegistry
+
+    monkeypatch.setenv("TEST_MODEL_SERVER_KEY", "secret")
+    config = {
+        "language": "ru",
+        "models": {"ru": {"backend": "llama.cpp", "model_path": "m.gguf"}},
+        "model_server": {"enabled": True, "address": server.address, "authkey_env": "TEST_MODEL_SERVER_KEY"},
+    }
+    registry = ModelRegistry.get_registry()
+    registry.clear()
+    try:
+        llm = registry.get_llm(config)
+        assert isinstance(llm, RemoteLLM)
+        assert llm.generate("q", max_length=1) == "answer to q (1)"
+    finally:
+        registry.clear()
+
+
+def test_server_and_client_refuse_to_run_without_authkey(tmp_path):
+    # сообщения распаковываются pickle: без ключа нельзя ни слушать, ни подключаться
+    with pytest.raises(ModelServerError):
+        ModelServer(FakeLLM(), FakeEmbedder(), address=str(tmp_path / "run" / "models.sock"))
+    with pytest.raises(ModelServerError):
+        ModelClient(str(tmp_path / "run" / "models.sock"))
+
+
+def test_socket_is_private(server):
+    assert stat.S_IMODE(os.stat(os.path.dirname(server.address)).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(server.address).st_mode) == 0o600
+
+
+def test_server_refuses_shared_directory(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    srv = ModelServer(FakeLLM(), FakeEmbedder(), address=str(shared / "models.sock"), authkey=b"secret")
+    with pytest.raises(ModelServerError):
+        srv.start()
+    # клиент тоже не подключается к сокету в общем каталоге
+    with pytest.raises(ModelServerError):
+        ModelClient(str(shared / "models.sock"), authkey=b"secret").call("count_tokens", "abcd")
+
+
+def test_wrong_authkey_is_rejected(server):
+    client = ModelClient(server.address, authkey=b"wrong")
+    with pytest.raises(ModelServerError):
+        client.call("count_tokens", "abcd")
+
+
+def test_generated_authkey_is_shared_through_private_file(tmp_path, monkeypatch):
+    monkeypatch.delenv("TEST_MODEL_SERVER_KEY", raising=False)
+    address = str(tmp_path / "run" / "models.sock")
+    config = {"address": address, "authkey_env": "TEST_MODEL_SERVER_KEY"}
+    assert server_authkey(config) is None
+    key = create_authkey(address)
+    assert len(key) == 64
+    assert stat.S_IMODE(os.stat(authkey_path(address)).st_mode) == 0o600
+    # воркер без переменной окружения читает ключ из файла рядом с сокетом
+    assert server_authkey(config) == key
+    monkeypatch.setenv("TEST_MODEL_SERVER_KEY", "from-env")
+    assert server_authkey(config) == b"from-env"
+
+
+def test_default_address_is_in_a_per_user_directory(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert default_address() == str(tmp_path / "rag-model-server" / "model-server.sock")
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert f"rag-model-server-{os.getuid()}" in default_address()
+    assert server_address({"address": None}) == default_address()
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from src.utils.profiling import ProfileReport, RequestProfiler, new_profile_id, top_functions
+
+
+def _busy_leaf(seconds: float) -> int:
+    end = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < end:
+        n += 1
+    return n
+
+
+def _busy_root(seconds: float) -> int:
+    return _busy_leaf(seconds)
+
+
+def test_sampling_profile_records_request_stacks():
+    profiler = RequestProfiler(interval_ms=1)
+    result = profiler.run("0001", "sampling", _busy_root, 0.1)
+    assert result > 0
+
+    report = profiler.get("0001")
+    assert report.mode == "sampling"
+    assert report.duration >= 0.1
+    assert sum(report.stacks.values()) > 0
+    # свёрнутый формат: корень слева, лист справа, в конце число сэмплов
+    line = report.to_text().splitlines()[0]
+    stack, count = line.rsplit(" ", 1)
+    assert int(count) > 0
+    assert any("_busy_root" in s and "_busy_leaf" in s for s in report.stacks)
+
+
+def test_cprofile_mode_returns_pstats_text():
+    profiler = RequestProfiler()
+    profiler.run("0002", "cprofile", _busy_root, 0.01)
+    text = profiler.get("0002").to_text()
+    assert "_busy_leaf" in text
+    assert "cumulative" in text
+
+
+def test_report_is_stored_even_if_request_fails():
+    profiler = RequestProfiler()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        profiler.run("0003", "cprofile", fail)
+    assert profiler.get("0003") is not None
+
+
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        RequestProfiler(mode="perf")
+    with pytest.raises(ValueError):
+        RequestProfiler().run("0001", "perf", lambda: None)
+
+
+def test_store_is_bounded():
+    profiler = RequestProfiler(store_size=2)
+    for i in range(3):
+        profiler.run(f"000{i}", "cprofile", lambda: None)
+    assert profiler.get("0000") is None
+    assert profiler.get("0002") is not None
+
+
+def test_authorized_requires_configured_token():
+    assert not RequestProfiler().authorized("secret")
+    profiler = RequestProfiler(admin_token="secret")
+    assert profiler.authorized("secret")
+    assert not profiler.authorized("wrong")
+    assert not profiler.authorized(None)
+
+
+def test_from_config_reads_token_from_env(monkeypatch):
+    monkeypatch.setenv("TEST_ADMIN_TOKEN", "t0k")
+    profiler = RequestProfiler.from_config({
+        "profiling": {"admin_token_env": "TEST_ADMIN_TOKEN", "sample_every": 5, "mode": "cprofile"}
+    })
+    assert profiler.authorized("t0k")
+    assert profiler.sample_every == 5
+    assert profiler.mode == "cprofile"
+
+
+def test_should_sample_one_in_n():
+    assert not any(RequestProfiler().should_sample() for _ in range(10))
+    profiler = RequestProfiler(sample_every=4)
+    picks = [profiler.should_sample() for _ in range(12)]
+    assert picks.count(True) == 3
+    assert picks[3] and picks[7] and picks[11]
+
+
+def test_top_functions_counts_self_and_total_samples():
+    stacks = {"a;b;c": 3, "a;b": 2, "a;d": 1}
+    top = top_functions(stacks)
+    assert top[0] == ("c", 3, 3)
+    assert ("b", 2, 5) in top
+    assert ("d", 1, 1) in top
+
+
+async def _async_request(seconds: float) -> int:
+    # как aprocess_query: работа уходит из event loop в пул потоков
+    return await asyncio.to_thread(_busy_root, seconds)
+
+
+def test_hot_paths_aggregate_background_samples_and_dump(tmp_path):
+    profiler = RequestProfiler(interval_ms=1, dump_dir=str(tmp_path), mode="cprofile")
+    # фоновый профиль — всегда сэмплирование по всем потокам, даже при mode: cprofile
+    assert asyncio.run(profiler.sample(_async_request(0.05))) > 0
+    asyncio.run(profiler.sample(_async_request(0.05)))
+
+    hot = profiler.hot_paths(top=5)
+    assert hot["profiled_requests"] == 2
+    assert hot["samples"] > 0
+    assert any("_busy_leaf" in f["function"] for f in hot["functions"])
+    # простаивающий event loop (ожидание в selectors) в агрегат не попадает
+    assert not any("selectors.py" in f["function"] for f in hot["functions"])
+
+    # каждый профиль и агрегат пишутся в dump_dir
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".folded")]) == 2
+    path = profiler.dump_hot_paths()
+    assert path == str(tmp_path / "hot_paths.folded")
+    assert "_busy_leaf" in open(path, encoding="utf-8").read()
+
+
+def test_on_demand_profiles_are_not_aggregated():
+    profiler = RequestProfiler(interval_ms=1)
+    profiler.run("00aa", "sampling", _busy_root, 0.05)
+    assert sum(profiler.get("00aa").stacks.values()) > 0
+    assert profiler.hot_paths()["profiled_requests"] == 0
+    assert profiler.hot_paths()["samples"] == 0
+
+
+def test_hot_stacks_are_bounded():
+    profiler = RequestProfiler(max_hot_stacks=3)
+    for i in range(5):
+        stacks = {f"a;f{i}": i + 1, "a;common": 10}
+        profiler._store(ProfileReport(f"000{i}", "sampling", 0.0, stacks=stacks), aggregate=True)
+    # остаются только самые частые стеки
+    assert len(profiler.hot_stacks) == 3
+    assert profiler.hot_stacks["a;common"] == 50
+    assert "a;f0" not in profiler.hot_stacks
+
+
+def test_dump_hot_paths_without_dir_is_noop():
+    assert RequestProfiler().dump_hot_paths() is None
+    assert ProfileReport("r", "cprofile", 0.0).to_text() == ""
+
+
+@pytest.mark.parametrize("profile_id", ["../../etc/passwd", "a/b", "REQ-1", "", "f" * 65])
+def test_profile_id_must_be_hex(tmp_path, profile_id):
+    # id попадает в путь файла в dump_dir: посторонние символы отклоняются до запуска
+    profiler = RequestProfiler(dump_dir=str(tmp_path))
+    calls = []
+    with pytest.raises(ValueError):
+        profiler.run(profile_id, "sampling", calls.append, 1)
+    assert calls == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_new_profile_id_is_accepted():
+    profiler = RequestProfiler()
+    first, second = new_profile_id(), new_profile_id()
+    assert first != second
+    profiler.run(first, "cprofile", lambda: None)
+    assert profiler.get(first).mode == "cprofile"
+
+
+def test_concurrent_cprofile_falls_back_to_sampling():
+    profiler = RequestProfiler(interval_ms=1)
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=profiler.run, args=("00aa", "cprofile", hold))
+    thread.start()
+    try:
+        assert started.wait(5)
+        # cProfile занят первым запросом: второй профилируется сэмплированием
+        profiler.run("00bb", "cprofile", _busy_root, 0.02)
+    finally:
+        release.set()
+        thread.join(5)
+    assert profiler.get("00aa").mode == "cprofile"
+    assert profiler.get("00bb").mode == "sampling"
+    # после освобождения cProfile снова доступен
+    profiler.run("00cc", "cprofile", lambda: None)
+    assert profiler.get("00cc").mode == "cprofile"
@@ -36,3 +36,12 @@ def test_prompt_loader_missing_language(tmp_path, monkeypatch):
     loader = PromptLoader()
     with pytest.raises(FileNotFoundError):
         loader.load("xx")  # языка xx нет в пустой папке
+
+def test_static_prefix_stops_at_first_placeholder():
+    """
+    Статический префикс — всё до первого плейсхолдера, независимо от их порядка.
+    """
+    assert PromptLoader.static_prefix("System: правила\nКонтекст: {context}\nВопрос: {query}") == \
+        "System: правила\nКонтекст: "
+    assert PromptLoader.static_prefix("Вопрос: {query}\nКонтекст: {context}") == "Вопрос: "
+    assert PromptLoader.static_prefix("без плейсхолдеров") == "без плейсхолдеров"
@@ -0,0 +1,233 @@
+import numpy as np
+import pytest
+
+from src.answer_generator.answer_cache import AnswerCache
+from src.answer_generator.context_builder import ContextBuilder
+from src.answer_generator.deadline import DeadlinePolicy
+from src.answer_generator.generation import AnswerLengthPolicy, GenerationParams
+from src.answer_generator.scheduler import LLMScheduler
+from src.reranker.cascade import CascadePolicy
+from src.utils.metrics import REGISTRY
+
+# Вопросы и фрагменты в двумерном пространстве: оценка фрагмента — косинус с вопросом
+QUERY_VECTORS = {
+    "О чём начало?": [1.0, 0.0],
+    "Что в конце?": [0.0, 1.0],
+    "boom": [0.7, 0.7],
+}
+DOCS = [
+    ("Вступление", [1.0, 0.0], 0.0),
+    ("Середина", [0.7, 0.7], 60.0),
+    ("Финал", [0.0, 1.0], 120.0),
+]
+
+
+class FakeDB:
+    @staticmethod
+    def fetch_subtitles(video_id):
+        return video_id != "missing"
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, convert_to_tensor=False):
+        self.calls.append(texts)
+        if isinstance(texts, str):
+            return np.array(QUERY_VECTORS[texts])
+        return np.array([QUERY_VECTORS[t] for t in texts])
+
+
+class FakeVectorStore:
+    """Поиск по DOCS косинусом; запоминает, сколько раз к нему обращались."""
+
+    def __init__(self):
+        self.calls = []
+
+    def _search(self, q_emb, k):
+        docs = []
+        for i, (text, emb, start) in enumerate(DOCS):
+            emb = np.array(emb)
+            score = float(emb @ q_emb / (np.linalg.norm(emb) * np.linalg.norm(q_emb)))
+            docs.append({
+                "page_content": text, "score": score, "embedding": emb, "token_ids": None,
+                "start_time": start, "end_time": start + 60, "video_id": "vid", "id": str(i),
+            })
+        return sorted(docs, key=lambda d: d["score"], reverse=True)[:k]
+
+    def search_by_vector(self, q_emb, k=5, video_id=None):
+        self.calls.append(("one", video_id))
+        return self._search(np.asarray(q_emb), k)
+
+    def search_by_vectors(self, q_embs, k=5, video_id=None):
+        self.calls.append(("many", video_id))
+        return [self._search(np.asarray(q), k) for q in q_embs]
+
+
+class EchoLLM:
+    """Отвечает вопросом и контекстом из промпта; на промпт с 'boom' падает."""
+
+    context_window = None
+
+    def generate(self, prompt, max_length=200, **kwargs):
+        if "boom" in prompt:
+            raise RuntimeError("llm failure")
+        context, question = prompt.split("\n")[1:]
+        return f" {question.removeprefix('Вопрос: ')} -> {context} "
+
+    @staticmethod
+    def count_tokens(text):
+        return len(text.split())
+
+
+class FakeChain:
+    """LangChain-цепочка: падает на вопросе 'boom'."""
+
+    def __init__(self):
+        self.queries = []
+
+    def invoke(self, query):
+        self.queries.append(query)
+        if query == "boom":
+            raise RuntimeError("chain failure")
+        return f"ответ на «{query}»"
+
+
+@pytest.fixture
+def make_model(rag_model):
+    # RAGModel без моделей и БД: поиск, контекст и генерация на заглушках
+    def make(use_langchain=False, scheduler=None, answer_cache=None):
+        model = rag_model(
+            use_langchain=use_langchain,
+            use_reranker=False,
+            retriever_top_k=3,
+            db=FakeDB(),
+            embedding_model=FakeEmbedder(),
+            vectorstore=FakeVectorStore(),
+            scheduler=scheduler or LLMScheduler(slots=2, max_queue=8, queue_timeout=5),
+            deadline_policy=DeadlinePolicy(),
+            generation=GenerationParams(max_tokens=64),
+            answer_length=AnswerLengthPolicy(),
+            answer_cache=answer_cache,
+        )
+        if use_langchain:
+            model.chain = FakeChain()
+        else:
+            model.llm = EchoLLM()
+            model.prompt_template = "Контекст:\n{context}\nВопрос: {query}"
+            model.mmr_lambda = 1.0
+            model.dedup_threshold = 0.99
+            model.context_max_tokens = None
+            model.max_new_tokens = 64
+            model.context_builder = ContextBuilder(model.llm.count_tokens)
+            model.prompt_tokens_hist = REGISTRY.histogram("test_rag_prompt_tokens", "", buckets=(64,))
+        return model
+
+    return make
+
+
+def test_search_returns_ranked_chunks_with_deep_links(make_model):
+    model = make_model()
+    result = model.search("https://youtube.com/watch?v=vid", "Что в конце?", top_k=2)
+    assert result["video_id"] == "vid"
+    assert [c["text"] for c in result["chunks"]] == ["Финал", "Середина"]
+    assert result["chunks"][0]["score"] == pytest.approx(1.0)
+    assert result["chunks"][0]["url"] == "https://youtu.be/vid?t=120"
+    assert result["chunks"][1]["start_time"] == 60.0 and result["chunks"][1]["end_time"] == 120.0
+    assert model.vectorstore.calls == [("one", "vid")]
+
+
+class PruningCascade(CascadePolicy):
+    """Каскад, который всегда отправляет в реранкер только двух лучших кандидатов."""
+
+    def plan(self, scores):
+        return False, 2
+
+
+class ReverseReranker:
+    """Реранкер, переворачивающий порядок: последний кандидат получает лучший скор."""
+
+    def score_many(self, requests, deadline=None):
+        return [[float(i) for i in range(len(r["doc_texts"]))] for r in requests]
+
+
+def test_cascade_pruned_tail_follows_reranked_head(make_model):
+    model = make_model()
+    model.use_reranker = True
+    model.cascade = PruningCascade()
+    model.reranker = ReverseReranker()
+    # порядок поиска для «Что в конце?»: Финал, Середина, Вступление
+    result = model.search("v=vid", "Что в конце?", top_k=3)
+    # голова переранжирована (Середина выше Финала), отсечённый хвост идёт за ней, top_k не сокращается
+    assert [c["text"] for c in result["chunks"]] == ["Середина", "Финал", "Вступление"]
+    assert result["chunks"][2]["score"] < result["chunks"][1]["score"]
+
+
+def test_search_default_top_k_and_errors(make_model):
+    model = make_model()
+    assert len(model.search("v=vid", "О чём начало?")["chunks"]) == 3
+    assert model.search("bad url", "О чём начало?") == {"video_id": None, "error": "Ошибка: некорректный URL видео."}
+    assert model.search("v=missing", "О чём начало?")["error"] == "Ошибка: субтитры не найдены."
+
+
+def test_process_batch_answers_in_order_with_one_search(make_model):
+    model = make_model()
+    result = model.process_batch("v=vid", ["Что в конце?", "О чём начало?"])
+    assert result["video_id"] == "vid"
+    assert result["results"] == [
+        {"query": "Что в конце?", "answer": "Что в конце? -> Вступление Середина Финал"},
+        {"query": "О чём начало?", "answer": "О чём начало? -> Вступление Середина Финал"},
+    ]
+    # все вопросы закодированы одним вызовом и найдены одним запросом к БД
+    assert model.embedding_model.calls == [["Что в конце?", "О чём начало?"]]
+    assert model.vectorstore.calls == [("many", "vid")]
+
+
+def test_process_batch_reports_failures_per_item(make_model):
+    model = make_model()
+    result = model.process_batch("v=vid", ["О чём начало?", "boom"])
+    assert result["results"][0]["answer"].startswith("О чём начало? ->")
+    assert result["results"][1] == {"query": "boom", "error": "Ошибка: не удалось обработать запрос."}
+
+
+def test_process_batch_reports_scheduler_rejection_status(make_model):
+    scheduler = LLMScheduler(slots=1, max_queue=0)
+    scheduler.acquire()  # слот занят, очереди нет — генерации отклоняются
+    try:
+        result = make_model(scheduler=scheduler).process_batch("v=vid", ["О чём начало?"])
+    finally:
+        scheduler.release()
+    item = result["results"][0]
+    assert item["status"] == 429 and "answer" not in item
+
+
+def test_process_batch_video_errors(make_model):
+    model = make_model()
+    assert model.process_batch("bad", ["О чём начало?"])["error"] == "Ошибка: некорректный URL видео."
+    assert model.process_batch("v=missing", ["О чём начало?"]) == {
+        "video_id": "missing", "error": "Ошибка: субтитры не найдены."
+    }
+
+
+def test_langchain_batch_returns_structured_errors(make_model):
+    model = make_model(use_langchain=True)
+    result = model.process_batch("v=vid", ["О чём начало?", "boom"])
+    # ошибка цепочки не выдаётся за ответ
+    assert result["results"] == [
+        {"query": "О чём начало?", "answer": "ответ на «О чём начало?»"},
+        {"query": "boom", "error": "Ошибка: не удалось обработать запрос."},
+    ]
+    # без кэша ответов вопросы не кодируются: LangChain ищет сам
+    assert model.embedding_model.calls == []
+
+
+def test_langchain_batch_uses_answer_cache(make_model):
+    cache = AnswerCache("h", semantic_threshold=None)
+    model = make_model(use_langchain=True, answer_cache=cache)
+    model.process_batch("v=vid", ["О чём начало?", "boom"])
+    result = model.process_batch("v=vid", ["О чём начало?", "boom"])
+    assert result["results"][0]["answer"] == "ответ на «О чём начало?»"
+    assert "error" in result["results"][1]
+    # удачный ответ взят из кэша, упавший вопрос повторён
+    assert model.chain.queries == ["О чём начало?", "boom", "boom"]
@@ -51,4 +51,38 @@ def test_rerank_orders_correctly():
         doc_texts=texts
     )
     assert res[0][0] == "high"
-    assert res[1][0] == "low"
\ No newline at end of file
+    assert res[1][0] == "low"
+
+class SumModel:
+    """Оценка = сумма признаков; считает вызовы predict."""
+    def __init__(self):
+        self.calls = 0
+    def load(self, path): pass
+    def predict(self, X):
+        self.calls += 1
+        return list(np.asarray(X).sum(axis=1))
+
+
+class LenFB:
+    """Один признак — длина текста фрагмента."""
+    def build(self, doc_texts, **kwargs):
+        return [np.array([float(len(t))]) for t in doc_texts]
+
+
+def test_score_many_uses_one_feature_matrix(monkeypatch):
+    model = SumModel()
+    monkeypatch.setattr("src.reranker.reranker.LogisticRegressionReranker", lambda: model)
+    monkeypatch.setattr("src.reranker.reranker.FeatureBuilder", lambda: LenFB())
+    path = ConfigLoader._instance.config["reranker"]["model_path"]
+    rr = Reranker(model_path=path)
+
+    def req(texts):
+        return {
+            "query_embedding": np.zeros(2), "doc_embeddings": [np.zeros(2)] * len(texts),
+            "query_tokens": ["q"], "doc_tokens_list": [["d"]] * len(texts), "doc_texts": texts,
+        }
+
+    scores = rr.score_many([req(["a", "bbb"]), req([]), req(["cc"])])
+    # результаты разбиты обратно по запросам, пустой запрос — пустой список
+    assert scores == [[1.0, 3.0], [], [2.0]]
+    assert model.calls == 1
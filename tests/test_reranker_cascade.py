@@ -0,0 +1,52 @@
+import pytest
+
+from src.reranker.cascade import CascadePolicy
+
+
+@pytest.fixture
+def policy():
+    return CascadePolicy(margin_threshold=0.1, min_candidates=2, dispersion_ref=0.05)
+
+
+def test_bypass_when_top1_far_ahead(policy):
+    assert policy.plan([0.9, 0.7, 0.65]) == (True, 0)
+    assert policy.plan([0.9]) == (True, 0)
+
+
+def test_candidates_scale_with_dispersion(policy):
+    # одинаковые скоры — неоднозначно, отправляем всех кандидатов
+    assert policy.plan([0.5] * 6) == (False, 6)
+    # сильный разброс — только min_candidates
+    assert policy.plan([0.9, 0.85, 0.6, 0.4, 0.3, 0.1]) == (False, 2)
+    # промежуточный случай — между границами
+    bypass, n = policy.plan([0.52, 0.50, 0.49, 0.47, 0.46, 0.45])
+    assert not bypass and 2 < n < 6
+
+
+def test_disabled_policy_sends_everything():
+    policy = CascadePolicy(enabled=False)
+    assert policy.plan([0.9, 0.1, 0.05]) == (False, 3)
+
+
+def test_counters_track_paths_and_savings(policy):
+    before = policy.stats()
+    policy.record_rerank(elapsed=0.3, n_candidates=3, n_total=6)
+    policy.record_bypass(n_candidates=6)
+    after = policy.stats()
+
+    assert after["rerank"] - before["rerank"] == 1
+    assert after["bypass"] - before["bypass"] == 1
+    assert after["pruned_candidates"] - before["pruned_candidates"] == 3
+    assert after["rerank_seconds"] - before["rerank_seconds"] == pytest.approx(0.3)
+    # 3 отсечённых кандидата + полный обход 6 кандидатов по ~0.1 с
+    assert after["saved_seconds"] - before["saved_seconds"] == pytest.approx(0.9)
+
+
+def test_tail_scores_rank_below_head_in_retrieval_order():
+    tail = CascadePolicy.tail_scores([2.0, -1.0, 0.5], 3)
+    assert tail == sorted(tail, reverse=True)
+    assert max(tail) < -1.0
+    # шаг хвоста соразмерен разбросу головы: нормализация MMR не сжимает голову
+    assert -1.0 - min(tail) == pytest.approx(3.0)
+    assert CascadePolicy.tail_scores([0.3, 0.3], 2) == [-0.7, -1.7]
+    assert CascadePolicy.tail_scores([0.3], 0) == []
@@ -0,0 +1,132 @@
+import sys
+import time
+import types
+import numpy as np
+import pytest
+
+from src.reranker.cross_encoder import CrossEncoderReranker
+from src.reranker.reranker import Reranker
+
+
+class FakeCrossEncoder:
+    """Оценивает пару по длине фрагмента; считает вызовы predict."""
+    delay = 0.0
+
+    def __init__(self, name, max_length=None, device=None):
+        self.calls = []
+
+    def fit(self, train_dataloader, epochs=1, show_progress_bar=False):
+        self.fitted = (list(train_dataloader), epochs)
+
+    def predict(self, pairs, batch_size=None, show_progress_bar=False):
+        self.calls.append((len(pairs), batch_size))
+        time.sleep(self.delay)
+        return np.array([float(len(doc)) for _, doc in pairs])
+
+
+class DummyModel:
+    def load(self, path): pass
+    def predict(self, X): return [0.9, 0.1]
+
+
+class DummyFB:
+    def build(self, **kwargs):
+        return [np.array([0.0]), np.array([0.0])]
+
+
+@pytest.fixture(autouse=True)
+def fake_sentence_transformers(monkeypatch):
+    FakeCrossEncoder.delay = 0.0
+    module = types.ModuleType("sentence_transformers")
+    module.CrossEncoder = FakeCrossEncoder
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+
+
+def test_score_single_batch_and_cache():
+    ce = CrossEncoderReranker("fake")
+    scores = ce.score("q", ["a", "bbb", "cc"])
+    assert scores == [1.0, 3.0, 2.0]
+    # все пары — одним батчем
+    assert ce.model.calls == [(3, 3)]
+
+    # повторный запрос полностью из кэша, новый фрагмент — отдельно
+    assert ce.score("q", ["a", "bbb"]) == [1.0, 3.0]
+    ce.score("q", ["a", "dddd"])
+    assert ce.model.calls == [(3, 3), (1, 1)]
+
+
+def test_score_returns_none_when_out_of_time():
+    ce = CrossEncoderReranker("fake", latency_budget_ms=5)
+    FakeCrossEncoder.delay = 0.2
+    assert ce.score("q", ["a", "b"]) is None
+    # истёкший дедлайн — даже не запускаем модель
+    assert ce.score("q2", ["a"], deadline=time.monotonic() - 1) is None
+
+
+def test_overrun_batch_is_not_queued_behind():
+    ce = CrossEncoderReranker("fake", latency_budget_ms=20)
+    FakeCrossEncoder.delay = 0.2
+    assert ce.score("q", ["a"]) is None
+    # пока зависший батч работает, новые запросы сразу уходят на запасную модель
+    start = time.monotonic()
+    assert ce.score("q2", ["b"]) is None
+    assert time.monotonic() - start < 0.05
+    assert len(ce.model.calls) == 1
+
+    time.sleep(0.25)
+    FakeCrossEncoder.delay = 0.0
+    assert ce.score("q2", ["bb"]) == [2.0]
+
+
+def test_train_fine_tunes_and_drops_cached_scores(monkeypatch):
+    class InputExample:
+        def __init__(self, texts, label):
+            self.texts, self.label = texts, label
+
+    sys.modules["sentence_transformers"].InputExample = InputExample
+    data = types.ModuleType("torch.utils.data")
+    data.DataLoader = lambda examples, shuffle, batch_size: examples
+    monkeypatch.setitem(sys.modules, "torch", types.ModuleType("torch"))
+    monkeypatch.setitem(sys.modules, "torch.utils", types.ModuleType("torch.utils"))
+    monkeypatch.setitem(sys.modules, "torch.utils.data", data)
+
+    ce = CrossEncoderReranker("fake")
+    ce.score("q", ["a"])
+    ce.train([("q", "a"), ("q", "b")], np.array([1, 0]), epochs=2)
+    examples, epochs = ce.model.fitted
+    assert epochs == 2
+    assert [(e.texts, e.label) for e in examples] == [(["q", "a"], 1.0), (["q", "b"], 0.0)]
+    assert len(ce.cache) == 0
+
+
+def test_reranker_falls_back_to_logreg(monkeypatch, tmp_path):
+    pick = tmp_path / "dummy.pkl"
+    pick.write_text("ok")
+    monkeypatch.setattr("src.reranker.reranker.LogisticRegressionReranker", lambda: DummyModel())
+    monkeypatch.setattr("src.reranker.reranker.FeatureBuilder", lambda: DummyFB())
+
+    rr = Reranker(str(pick), model_type="cross_encoder",
+                  cross_encoder_config={"model_name": "fake", "latency_budget_ms": 5})
+    args = dict(
+        query_embedding=np.array([0.0]),
+        doc_embeddings=[np.array([0.0]), np.array([0.0])],
+        query_tokens=["x"],
+        doc_tokens_list=[["x"], ["y"]],
+        doc_texts=["short", "much longer"],
+        query_text="x",
+    )
+    # кросс-энкодер предпочитает длинный фрагмент
+    assert rr.rerank(**args)[0][0] == "much longer"
+
+    # при таймауте — порядок логистической регрессии
+    FakeCrossEncoder.delay = 0.2
+    args["query_text"] = "other query"
+    assert rr.rerank(**args)[0][0] == "short"
+
+
+def test_unknown_model_type_raises(monkeypatch, tmp_path):
+    pick = tmp_path / "dummy.pkl"
+    pick.write_text("ok")
+    monkeypatch.setattr("src.reranker.reranker.LogisticRegressionReranker", lambda: DummyModel())
+    with pytest.raises(ValueError):
+        Reranker(str(pick), model_type="bm25")
@@ -0,0 +1,33 @@
+import numpy as np
+
+from src.reranker.diversity import mmr_select
+
+
+def make_embs():
+    # 0 и 1 — почти одинаковые окна, 2 — другое, 3 — ортогональное
+    return np.array([
+        [1.0, 0.0, 0.0],
+        [0.99, 0.05, 0.0],
+        [0.6, 0.8, 0.0],
+        [0.0, 0.0, 1.0],
+    ])
+
+
+def test_pure_relevance_keeps_order():
+    picked = mmr_select(make_embs(), [0.9, 0.85, 0.5, 0.1], k=3, lambda_=1.0)
+    assert picked == [0, 1, 2]
+
+
+def test_mmr_skips_near_duplicate():
+    picked = mmr_select(make_embs(), [0.9, 0.85, 0.5, 0.1], k=2, lambda_=0.5)
+    assert picked[0] == 0
+    assert 1 not in picked
+
+
+def test_dedup_threshold_drops_duplicates():
+    picked = mmr_select(make_embs(), [0.9, 0.85, 0.5, 0.1], k=4, lambda_=1.0, dedup_threshold=0.95)
+    assert picked == [0, 2, 3]
+
+
+def test_empty_input():
+    assert mmr_select(np.zeros((0, 3)), [], k=3) == []
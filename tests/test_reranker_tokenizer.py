@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from src.reranker.features import token_overlap, stopword_ratio
+from src.reranker.tokenizer import Tokenizer, TOKENIZER
+
+
+WORDS = Tokenizer(mode="words")
+
+
+def test_tokenize_strips_punctuation_and_normalizes():
+    assert WORDS.tokenize("Ёлка, ЛЕС! и: поле?") == ["елка", "лес", "и", "поле"]
+
+
+def test_legacy_mode_matches_training_tokens():
+    # так токенизировались данные, на которых обучена поставляемая модель
+    legacy = Tokenizer()
+    assert legacy.mode == "legacy"
+    assert legacy.tokenize("Ёлка, ЛЕС! и: поле?") == "Ёлка, ЛЕС! и: поле?".lower().split()
+    with pytest.raises(ValueError):
+        Tokenizer(mode="bpe")
+
+
+def test_id_cache_is_bounded():
+    tokenizer = Tokenizer(stopwords=(), cache_size=10)
+    tokenizer.encode(" ".join(f"w{i}" for i in range(100)))
+    assert len(tokenizer._ids) == 10
+    # вытесненный токен получает тот же id заново
+    assert tokenizer.token_id("w0") == Tokenizer(stopwords=()).token_id("w0")
+
+
+def test_ids_are_stable_across_instances():
+    # id должны совпадать между процессами, т.к. хранятся в БД
+    other = Tokenizer()
+    assert TOKENIZER.encode("Закон притяжения").tolist() == other.encode("закон притяжения").tolist()
+    assert TOKENIZER.encode("слово").dtype == np.int64
+
+
+def test_features_on_id_arrays_match_string_tokens():
+    q_text = "Как работает закон притяжения?"
+    d_text = "Закон притяжения объясняет, как мысли материализуются."
+    q_ids, d_ids = WORDS.encode(q_text), WORDS.encode(d_text)
+
+    # "как" — стоп-слово; остаются работает/закон/притяжения, совпадают два
+    assert token_overlap(q_ids, d_ids) == pytest.approx(2 / 3)
+    assert token_overlap(q_ids, d_ids) == token_overlap(
+        WORDS.tokenize(q_text), WORDS.tokenize(d_text)
+    )
+    assert stopword_ratio(d_ids) == pytest.approx(1 / 6)
+
+
+def test_empty_inputs():
+    empty = WORDS.encode("...")
+    assert TOKENIZER.encode("   ").size == 0
+    assert empty.size == 0
+    assert token_overlap(empty, TOKENIZER.encode("текст")) == 0.0
+    assert stopword_ratio(empty) == 0.0
@@ -0,0 +1,122 @@
+import os
+import sys
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.answer_generator.model_factory import model_factory
+from src.core.adapters.sentence_embedder import SentenceEmbedder
+from src.utils.resources import (
+    BLAS_ENV_VARS, ResourcePlan, available_cores, pinned, pinned_steps, thread_initializer
+)
+
+needs_affinity = pytest.mark.skipif(not hasattr(os, "sched_setaffinity"), reason="нет привязки к ядрам")
+
+
+def current_cores():
+    return sorted(os.sched_getaffinity(0))
+
+
+def test_plan_from_config():
+    plan = ResourcePlan.from_config({"resources": {
+        "blas_threads": 2,
+        "llm": {"threads": 6, "threads_batch": 8, "cores": [0, 1]},
+        "embedder": {"threads": 2},
+    }})
+    assert plan.blas_threads == 2
+    assert (plan.llm.threads, plan.llm.threads_batch, plan.llm.cores) == (6, 8, [0, 1])
+    assert plan.embedder.threads == 2 and plan.embedder.cores is None
+    # пустая секция ничего не задаёт
+    empty = ResourcePlan.from_config({"resources": None})
+    assert empty.blas_threads is None and empty.reranker.cores is None
+
+
+@needs_affinity
+def test_pinned_sets_and_restores_thread_mask():
+    before = current_cores()
+    with pinned([before[-1]]):
+        assert current_cores() == [before[-1]]
+    assert current_cores() == before
+
+
+@needs_affinity
+def test_pinned_ignores_unavailable_cores():
+    before = current_cores()
+    with pinned([max(before) + 1000]):
+        assert current_cores() == before
+    with pinned(None):
+        assert current_cores() == before
+
+
+@needs_affinity
+def test_pinned_steps_pins_every_step_only():
+    core = available_cores()[-1]
+    seen = []
+
+    def steps():
+        for i in range(3):
+            seen.append(current_cores())
+            yield i
+
+    before = current_cores()
+    for _ in pinned_steps(steps(), [core]):
+        # между шагами поток не привязан
+        assert current_cores() == before
+    assert seen == [[core]] * 3
+
+
+@needs_affinity
+def test_thread_initializer_pins_executor_thread():
+    core = available_cores()[-1]
+    with ThreadPoolExecutor(max_workers=1, initializer=thread_initializer([core])) as pool:
+        assert pool.submit(current_cores).result() == [core]
+
+
+def test_apply_blas_limits_loaded_libraries(monkeypatch):
+    threadpoolctl = pytest.importorskip("threadpoolctl")
+    for var in BLAS_ENV_VARS:
+        monkeypatch.delenv(var, raising=False)
+    # контекст возвращает исходные лимиты после теста
+    with threadpoolctl.threadpool_limits(limits=None):
+        ResourcePlan(blas_threads=1).apply_blas()
+        blas = [lib for lib in threadpoolctl.threadpool_info() if lib["user_api"] == "blas"]
+        assert all(lib["num_threads"] == 1 for lib in blas)
+    assert all(os.environ[var] == "1" for var in BLAS_ENV_VARS)
+
+
+class FakeLlama:
+    last = None
+
+    def __init__(self, **kwargs):
+        FakeLlama.last = kwargs
+        self.cores = current_cores() if hasattr(os, "sched_getaffinity") else None
+
+
+def test_llama_gets_threads_and_loads_pinned(monkeypatch):
+    module = types.ModuleType("llama_cpp")
+    module.Llama = FakeLlama
+    monkeypatch.setitem(sys.modules, "llama_cpp", module)
+    cores = available_cores()[-1:] if hasattr(os, "sched_getaffinity") else None
+    llm = model_factory({
+        "language": "ru",
+        "models": {"ru": {"backend": "llama.cpp", "model_path": "m.gguf"}},
+        "resources": {"llm": {"threads": 3, "threads_batch": 5, "cores": cores}},
+    })
+    assert FakeLlama.last["n_threads"] == 3
+    assert FakeLlama.last["n_threads_batch"] == 5
+    assert llm.cores == cores
+    assert llm.llm.cores == cores
+
+
+def test_embedder_encodes_pinned():
+    seen = []
+
+    class FakeModel:
+        def encode(self, texts, convert_to_tensor=False, normalize_embeddings=False):
+            seen.append(current_cores() if hasattr(os, "sched_getaffinity") else None)
+            return [0.0]
+
+    cores = available_cores()[-1:] if hasattr(os, "sched_getaffinity") else None
+    SentenceEmbedder("fake", model=FakeModel(), cores=cores).encode("text")
+    assert seen == [cores]
@@ -0,0 +1,83 @@
+import threading
+import time
+import pytest
+
+from src.answer_generator.scheduler import LLMScheduler, QueueFullError, QueueTimeoutError
+
+
+def start_waiter(scheduler, order, name, **kwargs):
+    """Поток, который ждёт слот, записывает своё имя и сразу отпускает слот."""
+    def run():
+        with scheduler.slot(**kwargs):
+            order.append(name)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def wait_for_queue(scheduler, depth, timeout=2.0):
+    end = time.monotonic() + timeout
+    while scheduler.stats()["waiting"] < depth:
+        assert time.monotonic() < end, "очередь не набралась"
+        time.sleep(0.005)
+
+
+def test_single_slot_is_fifo():
+    scheduler = LLMScheduler(slots=1, max_queue=10, queue_timeout=5)
+    order = []
+    scheduler.acquire()
+    threads = []
+    for i in range(4):
+        threads.append(start_waiter(scheduler, order, i))
+        wait_for_queue(scheduler, i + 1)
+    scheduler.release()
+    for t in threads:
+        t.join()
+    # обслуживание строго в порядке прихода
+    assert order == [0, 1, 2, 3]
+    assert scheduler.stats()["busy"] == 0
+
+
+def test_queue_full_is_rejected_with_429():
+    scheduler = LLMScheduler(slots=1, max_queue=1, queue_timeout=5)
+    scheduler.acquire()
+    order = []
+    thread = start_waiter(scheduler, order, "queued")
+    wait_for_queue(scheduler, 1)
+    with pytest.raises(QueueFullError) as exc:
+        scheduler.acquire()
+    assert exc.value.status_code == 429
+    scheduler.release()
+    thread.join()
+    assert order == ["queued"]
+
+
+def test_deadline_while_waiting_is_503():
+    scheduler = LLMScheduler(slots=1, max_queue=4, queue_timeout=5)
+    scheduler.acquire()
+    with pytest.raises(QueueTimeoutError) as exc:
+        scheduler.acquire(timeout=0.05)
+    assert exc.value.status_code == 503
+    # истёкший запрос ушёл из очереди
+    assert scheduler.stats()["waiting"] == 0
+    scheduler.release()
+
+
+def test_slots_allow_parallel_generation():
+    scheduler = LLMScheduler(slots=2, max_queue=0)
+    scheduler.acquire()
+    scheduler.acquire()
+    # оба слота заняты, очередь нулевая — сразу отказ
+    with pytest.raises(QueueFullError):
+        scheduler.acquire()
+    scheduler.release()
+    assert scheduler.run(lambda x: x * 2, 21) == 42
+    scheduler.release()
+
+
+def test_wait_time_is_exported():
+    scheduler = LLMScheduler(slots=1)
+    before = scheduler.queue_wait.count()
+    with scheduler.slot():
+        pass
+    assert scheduler.queue_wait.count() == before + 1
@@ -0,0 +1,59 @@
+import sys
+import types
+import numpy as np
+import pytest
+
+from src.core.adapters.sentence_embedder import SentenceEmbedder
+
+
+class FakeSentenceTransformer:
+    loaded = 0
+
+    def __init__(self, name):
+        FakeSentenceTransformer.loaded += 1
+        self.name = name
+
+    def encode(self, texts, convert_to_tensor=False, normalize_embeddings=False):
+        if isinstance(texts, str):
+            return np.array([float(len(texts)), 1.0], dtype=np.float32)
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture(autouse=True)
+def fake_sentence_transformers(monkeypatch):
+    FakeSentenceTransformer.loaded = 0
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = FakeSentenceTransformer
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+
+
+def test_model_loaded_lazily_once():
+    embedder = SentenceEmbedder("fake-model")
+    assert FakeSentenceTransformer.loaded == 0
+    embedder.encode("a")
+    embedder.embed_query("b")
+    embedder.embed_documents(["c"])
+    assert FakeSentenceTransformer.loaded == 1
+
+
+def test_embedder_and_langchain_interfaces_agree():
+    embedder = SentenceEmbedder("fake-model")
+    # encode — как у SentenceTransformer, embed_* — списки float для LangChain
+    assert embedder.encode(["abc"]).shape == (1, 2)
+    assert embedder.embed_documents(["abc", "de"]) == [[3.0, 1.0], [2.0, 1.0]]
+    assert embedder.embed_query("abc") == [3.0, 1.0]
+    assert all(isinstance(x, float) for x in embedder.embed_query("abc"))
+    assert embedder.embed_documents([]) == []
+
+
+def test_registry_shares_embedder():
+    from src.answer_generator.model_registry import ModelRegistry
+    registry = ModelRegistry.get_registry()
+    registry.clear()
+    try:
+        first = registry.get_embedder("fake-model")
+        assert registry.get_embedder("fake-model") is first
+        # веса загружены при создании через реестр, и только один раз
+        assert FakeSentenceTransformer.loaded == 1
+    finally:
+        registry.clear()
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.answer_generator.deadline import Deadline, DeadlinePolicy
+from src.answer_generator.generation import AnswerLengthPolicy, GenerationParams
+from src.answer_generator.rag_model import PreparedQuery
+from src.answer_generator.scheduler import LLMScheduler
+from src.api import main
+
+
+class StreamLLM:
+    """LLM-заглушка: отдаёт куски с задержкой и записывает закрытие потока."""
+
+    def __init__(self, pieces=5, delay=0.0, log=None):
+        self.pieces = pieces
+        self.delay = delay
+        self.log = log if log is not None else []
+        self.closed = False
+
+    def stream_generate(self, prompt, max_length=200, cancel_event=None, **kwargs):
+        try:
+            for i in range(self.pieces):
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                time.sleep(self.delay)
+                yield f"t{i} "
+        finally:
+            self.closed = True
+            self.log.append("stream_closed")
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+
+class RecordingScheduler(LLMScheduler):
+    def __init__(self, log):
+        super().__init__(slots=1, max_queue=4, queue_timeout=5)
+        self.log = log
+
+    def release(self):
+        self.log.append("slot_released")
+        super().release()
+
+
+@pytest.fixture
+def make_model(rag_model):
+    # RAGModel без моделей и БД: подготовка запроса подменена готовым промптом
+    def make(llm, policy=None):
+        chunks = [{"page_content": "first chunk", "start_time": 3.0}]
+        return rag_model(
+            llm=llm,
+            scheduler=RecordingScheduler(llm.log),
+            deadline_policy=policy or DeadlinePolicy(generation_seconds=0.05, tokens_per_second=1000),
+            generation=GenerationParams(max_tokens=64),
+            answer_length=AnswerLengthPolicy(),
+            prepare_query=lambda url, query, deadline=None: PreparedQuery(
+                video_id="vid", prompt="p", chunks=chunks, prompt_tokens=7
+            ),
+        )
+
+    return make
+
+
+def test_stream_query_emits_metadata_tokens_done(make_model):
+    llm = StreamLLM(pieces=3)
+    events = list(make_model(llm).stream_query("url", "q"))
+    assert [e["event"] for e in events] == ["metadata", "token", "token", "token", "done"]
+    assert events[0]["data"]["chunks"][0]["text"] == "first chunk"
+    assert events[-1]["data"]["completion_tokens"] == 3
+    assert events[-1]["data"]["degraded"] is False
+    assert llm.closed
+
+
+def test_closing_stream_closes_llm_before_releasing_slot(make_model):
+    llm = StreamLLM(pieces=100)
+    model = make_model(llm)
+    events = model.stream_query("url", "q")
+    assert next(events)["event"] == "metadata"
+    assert next(events)["event"] == "token"
+    events.close()  # клиент ушёл
+    assert llm.log == ["stream_closed", "slot_released"]
+    assert model.scheduler.stats()["busy"] == 0
+
+
+def test_stream_cut_at_deadline(make_model):
+    llm = StreamLLM(pieces=100, delay=0.02)
+    model = make_model(llm)
+    deadline = Deadline(0.2)
+    events = list(model.stream_query("url", "q", deadline=deadline))
+    assert events[-1]["event"] == "done"
+    assert events[-1]["data"]["degraded_reasons"] == ["generation_cut"]
+    assert 1 < len(events) < 100
+    assert llm.closed and model.scheduler.stats()["busy"] == 0
+
+
+def test_stream_without_time_returns_chunks(make_model):
+    llm = StreamLLM()
+    model = make_model(llm, policy=DeadlinePolicy(generation_seconds=1.0))
+    events = list(model.stream_query("url", "q", deadline=Deadline(0.5)))
+    assert [e["event"] for e in events] == ["metadata", "token", "done"]
+    assert "first chunk (https://youtu.be/vid?t=3)" in events[1]["data"]["text"]
+    assert events[-1]["data"]["degraded_reasons"] == ["retrieval_only"]
+    assert llm.log == []
+
+
+@pytest.fixture
+def ready_model(monkeypatch):
+    def install(model):
+        monkeypatch.setattr(main.state, "rag_model", model)
+        monkeypatch.setattr(main.state, "ready", True)
+        return model
+    return install
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n")
+        events.append((name.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def test_sse_endpoint_streams_events(ready_model, make_model):
+    ready_model(make_model(StreamLLM(pieces=2)))
+    client = TestClient(main.app)
+    response = client.post("/query/stream", json={"video_url": "url", "query": "q"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [name for name, _ in events] == ["metadata", "token", "token", "done"]
+    assert events[1][1] == {"text": "t0 "}
+
+
+class DisconnectingRequest:
+    """Запрос, клиент которого отключается после n проверок."""
+
+    def __init__(self, after):
+        self.after = after
+
+    async def is_disconnected(self):
+        self.after -= 1
+        return self.after < 0
+
+
+def test_sse_disconnect_cancels_and_closes_generation(ready_model, make_model):
+    llm = StreamLLM(pieces=1000, delay=0.001)
+    model = ready_model(make_model(llm))
+    request = main.QueryRequest(video_url="url", query="q")
+
+    async def consume():
+        response = await main.query_stream_endpoint(request, DisconnectingRequest(after=3))
+        return [chunk async for chunk in response.body_iterator]
+
+    chunks = asyncio.run(consume())
+    assert len(chunks) == 3
+    # поток LLM закрыт явно и до освобождения слота
+    assert llm.log == ["stream_closed", "slot_released"]
+    assert model.scheduler.stats()["busy"] == 0